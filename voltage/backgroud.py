@@ -1,5 +1,5 @@
 from typing import Optional, Literal, Union, List, Tuple
-import os
+import os, sys
 import subprocess, time, multiprocessing
 from constants import DIR_EXECUTABLE
 
@@ -183,17 +183,62 @@ class DisturberBackground(BackgroundProgramBase):
         periods: List[int] = [],
         values: List[int] = [], 
         name: str = "disturber_default",
-        executable: str = f"{DIR_EXECUTABLE}/setter.py"
+        executable: str = f"{DIR_EXECUTABLE}/setter.py",
+        msr_path: Optional[str] = None,
+        # Cores whose voltage is set, the setter's default (core 0) if None
+        targets: Optional[List[int]] = None,
+        # CSV of the requested and actual write time of every step
+        timing: Optional[str] = None
     ):
         super().__init__(
             method="all",
             cores=cores,
             name=name
         )
+        self.targets_ = targets
+        self.timing_ = timing
         self.periods_ = periods
         self.values_ = values
         self.exec_ = executable
         self.set_method_ = set_method
+        self.msr_path_ = msr_path
+        # Read end of the pipe the setter signals its first deadline on, and that deadline
+        self.ready_fd_ = None
+        self.start_ns_ = None
+    
+    def run(self):
+        self._close_ready()
+        self.start_ns_ = None
+        self.start_time_ = time.time()
+        self.ready_fd_, ready_w = os.pipe()
+        os.set_blocking(self.ready_fd_, False)
+        self.subprocess_ = subprocess.Popen(
+            self._build_cmd() + ["--ready_fd", str(ready_w)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=(ready_w,),
+        )
+        os.close(ready_w)
+    
+    def ready(self) -> bool:
+        """Whether the setter fixed its first deadline (kept in `start_ns_`) or exited without one."""
+        if self.ready_fd_ is None: return True
+        try:
+            signal = os.read(self.ready_fd_, 8)
+        except BlockingIOError:
+            return False
+        if len(signal) == 8: self.start_ns_ = int.from_bytes(signal, sys.byteorder)
+        self._close_ready()
+        return True
+    
+    def _close_ready(self):
+        if self.ready_fd_ is not None:
+            os.close(self.ready_fd_)
+            self.ready_fd_ = None
+    
+    def stop(self):
+        super().stop()
+        self._close_ready()
     
     def _runner_cmd(self) -> List[str]:
         return [
@@ -205,7 +250,9 @@ class DisturberBackground(BackgroundProgramBase):
             *[str(_) for _ in self.periods_],
             "--values",
             *[str(_) for _ in self.values_],
-        ]
+        ] + (["--msr_path", self.msr_path_] if self.msr_path_ else []) \
+          + (["--cores", *[str(_) for _ in self.targets_]] if self.targets_ else []) \
+          + (["--timing", self.timing_] if self.timing_ else [])
 
 class MultiBackground:
     def __init__(self, *backgrounds: BackgroundProgramBase):
@@ -0,0 +1,354 @@
+import numpy as np
+import multiprocessing as mp
+import time, json
+from recorder import VoltRecorder
+from source import VoltSourceBase, MSRSource, EmulatedMSRSource, ReplaySource
+
+# Same layout as the detector, squeezed onto small build machines
+_N_MAX_CORES = max(mp.cpu_count() - 2, 0)
+_PROC_CORE = _N_MAX_CORES
+_READER_CORE = min(_PROC_CORE + 1, mp.cpu_count() - 1)
+
+def _rate(n_samples, seconds):
+    return n_samples / seconds if seconds > 0 else float("inf")
+
+def transport_throughput(source: VoltSourceBase, args):
+    """Compare samples/sec of `record_once` between text, binary and in-process capture."""
+    n_reads, n_rounds = args.n_reads, args.n_rounds
+    recorder = VoltRecorder(_PROC_CORE, _READER_CORE, source)
+    results = {}
+    for transport in ["text", "binary", "inproc"]:
+        # Warm up
+        recorder.record_once(n_reads, 0, transport=transport)
+        st = time.perf_counter()
+        for _ in range(n_rounds):
+            recorder.record_once(n_reads, 0, transport=transport)
+        used = time.perf_counter() - st
+        results[f"{transport}_samples_per_sec"] = _rate(n_reads * n_rounds, used)
+        print(f"{transport:>8}: {results[f'{transport}_samples_per_sec']:.0f} samples/s")
+    for transport in ["binary", "inproc"]:
+        results[f"{transport}_speedup"] = results[f"{transport}_samples_per_sec"] / results["text_samples_per_sec"]
+        print(f"{transport.capitalize()} speedup: {results[f'{transport}_speedup']:.2f}x")
+    return results
+
+def multicore_throughput(source: VoltSourceBase, args):
+    """Frames/sec and per-core samples/sec of one sampler reading 1..len(cores) cores round-robin."""
+    n_reads, n_rounds = args.n_reads, args.n_rounds
+    results = {}
+    for k in range(1, len(args.cores) + 1):
+        recorder = VoltRecorder(_PROC_CORE, _READER_CORE, source, args.cores[:k])
+        recorder.record_once(n_reads, 0, transport="binary")
+        st = time.perf_counter()
+        for _ in range(n_rounds):
+            recorder.record_once(n_reads, 0, transport="binary")
+        used = time.perf_counter() - st
+        results[f"{k}_cores_frames_per_sec"] = _rate(n_reads * n_rounds, used)
+        results[f"{k}_cores_samples_per_sec"] = k * results[f"{k}_cores_frames_per_sec"]
+        print(f"{k:>3} cores: {results[f'{k}_cores_frames_per_sec']:.0f} frames/s, {results[f'{k}_cores_samples_per_sec']:.0f} samples/s")
+    return results
+
+def capture_overhead(source: VoltSourceBase, args, n_reads = 16):
+    """Fixed cost per `record_once` call (one dataset sample) of every transport, measured on tiny captures.
+    A disturbed sample also waits for the first deadline of its waveform, which is not included.
+    """
+    recorder = VoltRecorder(_PROC_CORE, _READER_CORE, source)
+    n_calls = 10 * args.n_rounds
+    results = {}
+    for transport in ["text", "binary", "inproc", "worker"]:
+        recorder.record_once(n_reads, 0, transport=transport)
+        st = time.perf_counter()
+        for _ in range(n_calls):
+            recorder.record_once(n_reads, 0, transport=transport)
+        results[f"{transport}_us_per_capture"] = 1e6 * (time.perf_counter() - st) / n_calls
+        print(f"{transport:>8}: {results[f'{transport}_us_per_capture']:.1f} us per capture")
+    recorder.stop_worker()
+    return results
+
+def _alloc_bytes(fn, *args):
+    """Peak bytes allocated while running `fn`, as seen by tracemalloc (numpy buffers included)."""
+    import tracemalloc
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(*args)
+    return tracemalloc.get_traced_memory()[1] - base
+
+def dealer_latency(source: VoltSourceBase, args):
+    """Per-window allocations and latency of `VoltDetector._dealer` fed with recorded windows, for every backend."""
+    import tracemalloc
+    from detector import VoltDetector
+    results = {}
+    for backend in args.backends:
+        detector = VoltDetector(args.model, n_windows=args.n_windows, proc_core=_PROC_CORE, reader_core=_READER_CORE, source=source, backend=backend)
+        # Never alarm, every window goes through the whole path
+        detector.tol_ = detector.n_windows_
+        w = detector.window_size_
+        n_calls = max(args.n_reads // w, 2 * detector.n_windows_)
+        stream = VoltRecorder(_PROC_CORE, _READER_CORE, source).record_once(n_calls * w, 0, transport="inproc")
+        windows = stream.reshape(n_calls, w)
+
+        detector.reset()
+        for data in windows[:detector.n_windows_ + 1]: detector._dealer(data)
+        latency = np.empty(n_calls, dtype=np.float64)
+        for i, data in enumerate(windows):
+            st = time.perf_counter()
+            detector._dealer(data)
+            latency[i] = time.perf_counter() - st
+
+        tracemalloc.start()
+        # What the measuring itself costs, e.g. the result tuple
+        base = np.median([_alloc_bytes(lambda _: None, None) for _ in range(8)])
+        slide = np.mean([_alloc_bytes(detector._slide, data) for data in windows]) - base
+        vote = np.mean([_alloc_bytes(detector._vote, i & 1) for i in range(n_calls)]) - base
+        dealer = np.mean([_alloc_bytes(detector._dealer, data) for data in windows]) - base
+        tracemalloc.stop()
+
+        results[backend] = {
+            "window_size": w,
+            "n_calls": n_calls,
+            "slide_bytes_per_window": float(slide),
+            "vote_bytes_per_window": float(vote),
+            "dealer_bytes_per_window": float(dealer),
+            "dealer_p50_us": 1e6 * float(np.percentile(latency, 50)),
+            "dealer_p99_us": 1e6 * float(np.percentile(latency, 99)),
+        }
+        print(f"{backend:>9}: allocated per window: slide {slide:.0f} B, vote {vote:.0f} B, whole dealer {dealer:.0f} B ({dealer / (2 * detector.n_reads_):.1f} windows)")
+        print(f"{backend:>9}: dealer latency p50 {results[backend]['dealer_p50_us']:.1f} us, p99 {results[backend]['dealer_p99_us']:.1f} us")
+    return results
+
+def multistream_scaling(source: VoltSourceBase, args):
+    """Tick latency and memory of one detector monitoring 1..len(cores) cores with batched inference,
+    against one detector per core.
+    """
+    import tracemalloc
+    from detector import VoltDetector
+    backend = args.backends[-1]
+    # Keep first-time imports out of the memory of the first detector
+    VoltDetector(args.model, n_windows=args.n_windows, proc_core=_PROC_CORE, reader_core=_READER_CORE, source=source, backend=backend).reset()
+    results = {}
+    for k in range(1, len(args.cores) + 1):
+        tracemalloc.start()
+        detector = VoltDetector(args.model, n_windows=args.n_windows, proc_core=_PROC_CORE, reader_core=_READER_CORE, source=source, backend=backend, cores=args.cores[:k], transport="binary")
+        detector.reset()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        detector.tol_[:] = detector.n_windows_
+        w = detector.window_size_
+        n_calls = max(args.n_reads // w, 2 * detector.n_windows_)
+        frames = VoltRecorder(_PROC_CORE, _READER_CORE, source, args.cores[:k]).record_once(n_calls * w, 0, transport="inproc").reshape(k, n_calls, w)
+        for i in range(detector.n_windows_ + 1): detector._dealer(frames[:, i])
+        latency = np.empty(n_calls, dtype=np.float64)
+        for i in range(n_calls):
+            st = time.perf_counter()
+            detector._dealer(frames[:, i])
+            latency[i] = time.perf_counter() - st
+        tick = 1e6 * float(np.percentile(latency, 50))
+        results[f"{k}_cores"] = {"tick_p50_us": tick, "tick_p99_us": 1e6 * float(np.percentile(latency, 99)), "us_per_stream": tick / k, "memory_bytes": memory}
+        if k == 1: single = results["1_cores"]
+        print(f"{k:>3} cores: tick p50 {tick:.1f} us ({tick / k:.1f} us per stream, {k * single['tick_p50_us']:.1f} us as separate detectors), memory {memory / 2**20:.1f} MiB ({k * single['memory_bytes'] / 2**20:.1f} MiB as separate detectors)")
+    return results
+
+def queue_policies(source: VoltSourceBase, args, window = 1000, n_windows = 200):
+    """Consumer lag and skipped windows of every queue policy, with a dealer `--slowdown` times
+    slower than the sampling of a window at `--rate` (use a replay source to fix the rate).
+    """
+    from recorder import StopDealing
+    rate = args.rate or 1e6
+    cost = args.slowdown * window / rate
+    results = {}
+    for policy in ["none", "block", "drop_oldest", "coalesce"]:
+        recorder = VoltRecorder(_PROC_CORE, _READER_CORE, source)
+        count = [0]
+        def dealer(data):
+            deadline = time.perf_counter() + cost
+            while time.perf_counter() < deadline: ...
+            count[0] += 1
+            if count[0] == n_windows: raise StopDealing()
+        st = time.perf_counter()
+        recorder.record_deal(window, 0, dealer, None, "binary", queue_size=0 if policy == "none" else args.queue_size, policy="block" if policy == "none" else policy)
+        used = time.perf_counter() - st
+        results[policy] = {"windows_per_sec": n_windows / used, **recorder.queue_stats()}
+        print(f"{policy:>11}: {n_windows / used:.0f} windows/s, {results[policy]}")
+    return results
+
+def inference_latency(source: VoltSourceBase, args):
+    """Per-window latency of every inference backend on detector-like windows, sliding by `n_reads / n_windows`."""
+    from inference import InferenceBackend, load_model, load_scaler
+    results, timed = {}, []
+    # The scaler the detector loads, so every backend sees the inputs it would
+    scaler = load_scaler(args.model)
+    for name in args.backends:
+        model, _, _ = load_model(args.model, name)
+        if name == args.backends[0]:
+            n_reads = model.input_shape[1]
+            shift = n_reads // args.n_windows
+            n_calls = 10 * args.n_rounds
+            stream = VoltRecorder(_PROC_CORE, _READER_CORE, source).record_once(n_reads + n_calls * shift, 0, transport="inproc")
+            windows = np.lib.stride_tricks.sliding_window_view(stream, n_reads)[::shift]
+        if InferenceBackend.registered[name].streaming_ and not scaler.uniform_:
+            print(f"{name:>9}: skipped, the model scaler is not shared by all positions")
+            continue
+        backend = InferenceBackend.create(name, model, shift=shift, scaler=scaler)
+        backend(windows[0])
+        backend.reset()
+        latency = np.empty(n_calls, dtype=np.float64)
+        outputs = np.empty(n_calls, dtype=np.float64)
+        for i, x in enumerate(windows[:n_calls]):
+            st = time.perf_counter()
+            outputs[i] = backend(x)
+            latency[i] = time.perf_counter() - st
+        # The first call of a streaming backend runs the whole window, keep it out of the steady state
+        results[f"{name}_p50_us"] = 1e6 * float(np.percentile(latency[1:], 50))
+        results[f"{name}_p99_us"] = 1e6 * float(np.percentile(latency[1:], 99))
+        if not timed: reference = outputs
+        timed.append(name)
+        results[f"{name}_max_abs_diff"] = float(np.abs(outputs - reference).max())
+        print(f"{name:>9}: p50 {results[f'{name}_p50_us']:.1f} us, p99 {results[f'{name}_p99_us']:.1f} us, max diff {results[f'{name}_max_abs_diff']:.2e}")
+    for name in timed[1:]:
+        results[f"{name}_speedup"] = results[f"{timed[0]}_p50_us"] / results[f"{name}_p50_us"]
+        print(f"{name.capitalize()} speedup: {results[f'{name}_speedup']:.2f}x")
+    return results
+
+def first_decision(source: VoltSourceBase, args):
+    """Time from spawning `detector.py` to its first prediction, split into interpreter and imports,
+    model loading and the first `n_windows + 1` windows, checked against `--target` seconds.
+    """
+    import subprocess, sys
+    cmd = [sys.executable, "detector.py", "-m", args.model, "-n", str(args.n_windows), "-P", str(_PROC_CORE), "-R", str(_READER_CORE), "--first_decision"]
+    if args.replay: cmd += ["--replay", args.replay, "--rate", str(args.rate)]
+    elif args.emulated: cmd += ["--emulated"]
+    results = {}
+    for backend in args.backends:
+        timeline = []
+        for _ in range(args.n_rounds):
+            st = time.monotonic()
+            proc = subprocess.run(cmd + ["-B", backend], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            stamps = json.loads(proc.stdout.strip().splitlines()[-1])
+            timeline.append([stamps["main"] - st, stamps["loaded"] - stamps["main"], stamps["decision"] - stamps["loaded"], stamps["decision"] - st])
+        imports, loading, deciding, total = np.median(timeline, axis=0)
+        results[backend] = {"imports_s": imports, "loading_s": loading, "deciding_s": deciding, "total_s": total, "max_total_s": float(np.max(timeline, axis=0)[3]), "meets_target": bool(total <= args.target)}
+        print(f"{backend:>9}: {total:.3f} s to the first decision (imports {imports:.3f} s, model {loading:.3f} s, windows {deciding:.3f} s){'' if total <= args.target else ' over target'}")
+    return results
+
+def metrics_overhead(source: VoltSourceBase, args):
+    """Cost of the per-window instrumentation of the detector against its dealer latency, and of one export."""
+    import tempfile
+    from metrics import DetectorMetrics
+    n_calls = 10 * args.n_reads
+    metrics = DetectorMetrics(interval=float("inf"))
+    st = time.perf_counter()
+    for i in range(n_calls):
+        for stage in DetectorMetrics.STAGES: metrics.stage(stage, 1000 + i)
+        metrics.add_samples(1000)
+        metrics.add_window()
+        metrics.tick()
+    per_window = (time.perf_counter() - st) / n_calls
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics.path_ = f"{tmp}/detector"
+        st = time.perf_counter()
+        metrics.export()
+        export = time.perf_counter() - st
+    results = {"us_per_window": 1e6 * per_window, "ms_per_export": 1e3 * export, "p99_s": metrics.last_["stages"]["window"]["p99_s"]}
+    print(f"Instrumentation: {results['us_per_window']:.2f} us per window, {results['ms_per_export']:.2f} ms per export")
+    return results
+
+def trace_codec(source: VoltSourceBase, args, n_rows = 16):
+    """Compression ratio, encode and decode throughput and random row latency of the `.vtc` codecs
+    against plain `.npy`, on `n_rows` captures of `n_reads` samples.
+    """
+    import tempfile, os
+    from trace_codec import encode_npy, TraceFile
+    recorder = VoltRecorder(_PROC_CORE, _READER_CORE, source)
+    data = np.stack([recorder.record_once(args.n_reads, 0, transport="inproc") for _ in range(n_rows)])
+    rows = np.random.default_rng(0).integers(0, n_rows, 10 * n_rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        npy = os.path.join(tmp, "traces.npy")
+        np.save(npy, data)
+        st = time.perf_counter()
+        np.load(npy)
+        load = time.perf_counter() - st
+        mapped = np.load(npy, mmap_mode="r")
+        st = time.perf_counter()
+        for i in rows: np.array(mapped[i])
+        row = (time.perf_counter() - st) / len(rows)
+        results["npy"] = {"ratio": 1., "decode_mb_per_sec": data.nbytes / load / 1e6, "row_us": 1e6 * row}
+        for codec in ["none", "zlib", "lzma"]:
+            path = os.path.join(tmp, f"traces_{codec}.vtc")
+            st = time.perf_counter()
+            encode_npy(npy, path, codec)
+            encode = time.perf_counter() - st
+            traces = TraceFile(path)
+            st = time.perf_counter()
+            decoded = np.asarray(traces)
+            decode = time.perf_counter() - st
+            assert np.array_equal(decoded, data), ValueError(f"Codec {codec} does not decode to the captures.")
+            st = time.perf_counter()
+            for i in rows: traces[i]
+            row = (time.perf_counter() - st) / len(rows)
+            results[codec] = {
+                "ratio": data.nbytes / os.path.getsize(path),
+                "encode_mb_per_sec": data.nbytes / encode / 1e6,
+                "decode_mb_per_sec": data.nbytes / decode / 1e6,
+                "row_us": 1e6 * row,
+            }
+    for name, r in results.items():
+        print(f"{name:>5}: {r['ratio']:6.1f}x smaller, decode {r['decode_mb_per_sec']:.0f} MB/s, random row {r['row_us']:.0f} us")
+    return results
+
+BenchList = [
+    transport_throughput,
+    multicore_throughput,
+    capture_overhead,
+    dealer_latency,
+    inference_latency,
+    first_decision,
+    multistream_scaling,
+    queue_policies,
+    metrics_overhead,
+    trace_codec,
+]
+
+def parse_args():
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("-s", "--benches", type=int, nargs="+", default=[0])
+    parser.add_argument("-N", "--n_rounds", type=int, default=10)
+    parser.add_argument("-n", "--n_reads", type=int, default=100_000)
+    parser.add_argument("-c", "--cores", type=int, nargs="+", default=[0], help="Monitored cores.")
+    parser.add_argument("-m", "--model", type=str, default="models/standard", help="Model of the detector benchmarks.")
+    parser.add_argument("-b", "--backends", type=str, nargs="+", default=["predict", "session", "numpy", "streaming"], help="Inference backends to compare, the first one is the reference.")
+    parser.add_argument("-w", "--n_windows", type=int, default=10, help="Number of sliding windows of the detector.")
+    parser.add_argument("--target", type=float, default=1.0, help="Target time to the first decision in seconds.")
+    parser.add_argument("-q", "--queue_size", type=int, default=4, help="Windows buffered between reading and the dealer.")
+    parser.add_argument("--slowdown", type=float, default=1.5, help="Dealer cost relative to the sampling time of a window.")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Dump results as json.")
+    parser.add_argument("--replay", type=str, default=None, help="Replay a recorded `.npy` trace instead of reading MSR.")
+    parser.add_argument("--rate", type=float, default=0, help="Replay rate in samples/sec, 0 for as fast as possible.")
+    parser.add_argument("--emulated", action="store_true", default=False, help="Read an emulated MSR file instead of the hardware.")
+    return parser.parse_args()
+
+def build_source(args) -> VoltSourceBase:
+    if args.replay:
+        return ReplaySource(args.replay, args.rate)
+    if args.emulated:
+        return EmulatedMSRSource(args.cores)
+    return MSRSource()
+
+def main():
+    args = parse_args()
+    source = build_source(args)
+    results = {}
+    for bench in args.benches:
+        if bench < 0 or bench >= len(BenchList):
+            print(f"Benchmark {bench} not found.")
+            continue
+        print(f"Running benchmark {bench} ({BenchList[bench].__name__})...")
+        results[BenchList[bench].__name__] = BenchList[bench](source, args)
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=4)
+
+if __name__ == "__main__":
+    main()
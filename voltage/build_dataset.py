@@ -2,13 +2,17 @@ from backgroud import BackgroundProgramBase, SpecCPUBackground, OpenSSLBackgroun
 from rwvolt import RWVolt
 from subprocess import Popen, PIPE, DEVNULL
 import multiprocessing as mp
-from typing import Optional, Union, Literal, List, Tuple, Dict
-import json, os, glob
+from typing import Any, Callable, Optional, Union, Literal, List, Tuple, Dict
+import json, os, glob, time, queue, mmap
 import numpy as np
 import tqdm, traceback
 from constants import *
 from recorder import VoltRecorder
+from source import VoltSourceBase, MSRSource
 from utils.augment import AugmentBase
+from shards import ShardedArray, Manifest
+from trace_codec import Codec, encode_npy, load_traces
+from utils.cache import config_hash, is_fresh, write_meta
 from collections import OrderedDict
 
 def find_config(name, dir: str = DIR_DATASETS_CONFIG):
@@ -16,6 +20,47 @@ def find_config(name, dir: str = DIR_DATASETS_CONFIG):
     for path in glob.iglob(os.path.join(dir, "**", name), recursive=True):
         return path
 
+def plan_lanes(n_cores: int, n_lanes: int = 1, n_cpus: Optional[int] = None) -> List[Dict]:
+    """Disjoint cores of `n_lanes` capture lanes, 0 for as many as fit on `n_cpus` cores. Lane `k` runs its
+    backgrounds on `n_cores` cores from the first ones up, its setter, reader and recorder on 3 cores from
+    the last ones down, so lane 0 keeps the layout of a single-lane capture.
+    """
+    n_cpus = n_cpus or mp.cpu_count()
+    max_lanes = max(n_cpus // (n_cores + 3), 1)
+    n_lanes = n_lanes or max_lanes
+    assert 1 <= n_lanes <= max_lanes, ValueError(f"{n_cpus} cores fit at most {max_lanes} lanes of {n_cores} cores.")
+    return [
+        {
+            "cores": list(range(k * n_cores, (k + 1) * n_cores)),
+            "setter": n_cpus - 3 - 3 * k,
+            "reader": n_cpus - 2 - 3 * k,
+            "recorder": n_cpus - 1 - 3 * k,
+        }
+        for k in range(n_lanes)
+    ]
+
+def capture_overlaps(timing: np.ndarray) -> np.ndarray:
+    """Whether the capture of every row of a disturber timing array, see `DatasetBuilder._timing_dtype`,
+    overlaps the span from its first to its last written step.
+    """
+    written, capture = timing["written"], timing["capture"]
+    if written.shape[-1] == 0: return np.zeros(written.shape[:-1], dtype=np.bool_)
+    return (written >= 0).all(axis=-1) & (capture[..., 0] <= written.max(axis=-1)) & (capture[..., 1] >= written.min(axis=-1))
+
+class CaptureLane:
+    """Programmes of one capture lane: backgrounds on `cores_`, the disturber on `setter_core_` setting the
+    voltage of the monitored core `cores_[0]`, and the recorder sampling it. Lanes share no core.
+    The disturber writes the timing of its steps to `timing_path_` on every run.
+    """
+    def __init__(self, index: int, cores: List[int], setter_core: int, backgrounds: MultiBackground, disturber: Optional[DisturberBackground], recorder: VoltRecorder, timing_path: Optional[str] = None):
+        self.index_ = index
+        self.timing_path_ = timing_path
+        self.cores_ = cores
+        self.setter_core_ = setter_core
+        self.backgrouds_ = backgrounds
+        self.disturber_ = disturber
+        self.recorder_ = recorder
+
 class DatasetBuilder:
     _BACKGROUNDS: Dict[str, BackgroundProgramBase] = {
         "speccpu": SpecCPUBackground,
@@ -31,7 +76,8 @@ class DatasetBuilder:
     _LOG_DIR = DIR_LOG
     
     def _reset_volt(self):
-        RWVolt.offset_core_voltage(0, self.base_, self.fp_log_)
+        for lane in self.lanes_:
+            self.source_.offset_core_voltage(lane.cores_[0], self.base_, self.fp_log_)
     
     def __init__(
         self,
@@ -39,41 +85,87 @@ class DatasetBuilder:
         size: int = 100000,
         n_cores: int = 1,
         n_reads: int = 1000000,
-        interval: int = 0,
+        interval: int = 0, # ns between samples, 0 for free running
         backgrounds: Dict[str, Dict] = {},
         disturber: Optional[Dict[str, List[int]]] = None,
         on_finished: Literal["revert", "repeat", "termiate"] = "repeat",
-        base: int = 400
+        base: int = 400,
+        transport: Literal["text", "binary", "inproc", "worker"] = "text",
+        source: Optional[Dict] = None,
+        codec: Optional[Codec] = None,
+        n_lanes: int = 1
     ):
+        """
+        Args:
+            n_lanes (int): Lanes capturing concurrently, each on its own `n_cores` cores with its own backgrounds,
+                disturber and recorder, 0 for as many as the CPU fits, see `plan_lanes`. On CPUs where cores share
+                a voltage plane, the disturbers of the lanes also offset each other's cores, so the resolved
+                lane count is part of the cache key and of the resume journal.
+        """
         self.name_ = name
         self.size_ = size
+        # Everything that changes the captured samples, partial captures only resume under the same one
+        self.capture_config_ = {
+            "size": size, "n_cores": n_cores, "n_reads": n_reads, "interval": interval, "backgrounds": backgrounds,
+            "disturber": disturber, "on_finished": on_finished, "base": base, "source": source,
+        }
         self.n_cores_ = n_cores
         self.n_reads_ = n_reads
         self.interval_ = interval
         self.label_ = self._POS_LABEL if disturber is not None else self._NEG_LABEL
         self.on_finished_ = on_finished
+        self.disturber_config_ = disturber
+        self.transport_ = transport
+        # Store the finished capture compressed as `.vtc` instead of `.npy`
+        self.codec_ = codec
         assert 1 <= n_cores <= self._N_MAX_CORES, ValueError(f"Number of cores should be between 1 and {self._N_MAX_CORES}")
         
         self.cores_ = list(range(0, self.n_cores_))
         self.base_ = base
+        self.source_config_ = source
+        self.source_ = VoltSourceBase.from_config(source) if source else MSRSource()
+        assert disturber is None or self.source_.msr_path_, ValueError("Disturber needs a source with MSR access.")
         
-        # Backgrounds
-        self.backgrouds_ = MultiBackground(
-            *[
-                self._BACKGROUNDS[k](
-                    cores=self.cores_,
-                    **kwargs,
-                )
-                for k, kwargs in backgrounds.items()
-            ]
-        )
-        self.disturber_ = DisturberBackground(cores=[self._SETTER_CORE], **disturber) if disturber else None
-        
-        # Reader
-        self.recorder_ = VoltRecorder(self._RECODER_CORE, self._READER_CORE)
+        # Backgrounds, disturber and reader of every lane
+        self.lanes_ = [
+            CaptureLane(
+                k,
+                plan["cores"],
+                plan["setter"],
+                MultiBackground(
+                    *[
+                        self._BACKGROUNDS[name](
+                            cores=plan["cores"],
+                            **kwargs,
+                        )
+                        for name, kwargs in backgrounds.items()
+                    ]
+                ),
+                DisturberBackground(cores=[plan["setter"]], msr_path=self.source_.msr_path_, targets=plan["cores"][:1], **{**disturber, "timing": self._lane_timing(k)}) if disturber else None,
+                VoltRecorder(plan["recorder"], plan["reader"], self.source_, plan["cores"][:1]),
+                self._lane_timing(k) if disturber else None,
+            )
+            for k, plan in enumerate(plan_lanes(n_cores, n_lanes))
+        ]
+        # Throughput of every lane in the last `build`
+        self.lane_stats_: List[Dict] = []
+        # Lanes load the CPU together and may offset each other's voltage, so the lane count this host
+        # resolved, not the requested one, is part of the capture config
+        self.capture_config_["n_lanes"] = len(self.lanes_)
+        # Cache key of the capture, kept in the `.meta.json` sidecar of the built file
+        self.key_ = config_hash({**self.capture_config_, "codec": codec})
 
         # File paths
         self.target_ = os.path.join(self._DATASET_DIR, self.label_, self.name_)
+        # Samples are captured into `partial_` and committed one by one in `journal_`
+        self.partial_ = self.target_ + ".partial.npy"
+        self.journal_ = self.target_ + ".journal.json"
+        # Disturber timing of every sample, committed along with it
+        self.timing_ = self.target_ + ".timing.npy"
+        self.partial_timing_ = self.target_ + ".partial.timing.npy"
+        self.timing_rows_: Optional[np.ndarray] = None
+        # Whether the last `build` returned every sample
+        self.finished_ = False
         self.log_path_ = os.path.join(self._LOG_DIR, self.name_)
         self.fp_log_ = None
         
@@ -83,86 +175,325 @@ class DatasetBuilder:
         os.sched_setaffinity(0, {self._SETTER_CORE})
         
     
+    def _lane_timing(self, index: int) -> str:
+        """Scratch CSV the disturber of lane `index` rewrites on every run."""
+        return os.path.join(self._LOG_DIR, f"{self.name_}.timing.lane{index}.csv")
+    
+    def _timing_dtype(self) -> np.dtype:
+        """Timing of a sample: CLOCK_MONOTONIC ns when its capture started and ended, and the deadline and
+        actual write time of every disturber step, -1 when the setter reported none.
+        """
+        n_steps = len(self.disturber_config_.get("periods", []))
+        return np.dtype([("capture", "<i8", (2,)), ("deadline", "<i8", (n_steps,)), ("written", "<i8", (n_steps,))])
+    
+    @property
+    def recorder_(self) -> VoltRecorder:
+        return self.lanes_[0].recorder_
+    
+    @recorder_.setter
+    def recorder_(self, recorder: VoltRecorder):
+        self.lanes_[0].recorder_ = recorder
+    
     @classmethod
     def from_config(cls, path: str):
         with open(path) as fp:
             return cls(**json.load(fp))
     
-    def _check_exist(self):
-        return os.path.exists(self.target_ + ".npy")
+    def _check_exist(self) -> Optional[str]:
+        """Path of the built capture, `.npy` or `.vtc`, `None` if not built."""
+        for ext in (".npy", ".vtc"):
+            if os.path.exists(self.target_ + ext): return self.target_ + ext
     
-    def build(self, save = True, replace = False):
-        # If exist and not replace, skip
-        if not replace and self._check_exist():
-            return np.load(self.target_ + ".npy"), self.label_
-        
-        data = np.zeros((self.size_, self.n_reads_), dtype=np.int16)
-        
-        self.fp_log_ = open(self.log_path_, "w")
-
-        # Set base voltage
-        self._reset_volt()
+    def _split(self) -> List[List[int]]:
+        """Rows of every lane as `[start, committed, stop]`, in equal contiguous ranges."""
+        bounds = np.linspace(0, self.size_, len(self.lanes_) + 1).astype(int).tolist()
+        return [[start, start, stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    
+    def _open_partial(self, replace: bool) -> Tuple[np.ndarray, List[List[int]]]:
+        """Memory-mapped capture and its row ranges with the rows already committed, resumed from the
+        journal if it was written under the same capture config.
+        """
+        if not replace and os.path.exists(self.partial_) and os.path.exists(self.journal_):
+            with open(self.journal_) as fp:
+                journal = json.load(fp)
+            if journal["config"] == json.loads(json.dumps(self.capture_config_)):
+                # Journals of single-lane captures only had the committed count
+                ranges = journal["ranges"] if "ranges" in journal else [[0, journal["committed"], self.size_]]
+                self._open_timing(resume=True)
+                return np.lib.format.open_memmap(self.partial_, mode="r+"), ranges
+        data = np.lib.format.open_memmap(self.partial_, mode="w+", dtype=np.int16, shape=(self.size_, self.n_reads_))
+        data.flush()
+        self._open_timing(resume=False)
+        ranges = self._split()
+        self._commit(ranges)
+        return data, ranges
+    
+    def _open_timing(self, resume: bool):
+        """Memory-mapped timing rows next to the partial capture, kept on resume."""
+        if self.disturber_config_ is None:
+            self.timing_rows_ = None
+        elif resume and os.path.exists(self.partial_timing_):
+            self.timing_rows_ = np.lib.format.open_memmap(self.partial_timing_, mode="r+")
+        else:
+            self.timing_rows_ = np.lib.format.open_memmap(self.partial_timing_, mode="w+", dtype=self._timing_dtype(), shape=(self.size_,))
+            self.timing_rows_[:] = np.full((), -1, dtype=self._timing_dtype())
+            self.timing_rows_.flush()
+    
+    def _store_timing(self, lane: CaptureLane, i: int, capture: Tuple[int, int], flog):
+        """Timing of sample `i` from the setter's CSV of the run that disturbed it, -1 for steps it did not report."""
+        timing = self.timing_rows_
+        timing["capture"][i] = capture
         try:
-            finished = False
+            steps = np.loadtxt(lane.timing_path_, delimiter=",", skiprows=1, dtype=np.int64, ndmin=2)
+            timing["deadline"][i], timing["written"][i] = steps[:, 2], steps[:, 3]
+        except (OSError, ValueError):
+            timing["deadline"][i] = timing["written"][i] = -1
+            flog.write(f"No disturber timing for sample {i} in {lane.timing_path_}\n")
+        if isinstance(timing, np.memmap): timing.flush()
+    
+    def _commit(self, ranges: List[List[int]]):
+        """Record the committed rows in the journal, replaced atomically. The rows are flushed before."""
+        with open(self.journal_ + ".tmp", "w") as fp:
+            json.dump({"config": self.capture_config_, "ranges": ranges}, fp)
+        os.replace(self.journal_ + ".tmp", self.journal_)
+    
+    def _capture(self, lane: CaptureLane, todo: List[int], data: np.ndarray, ranges: List[List[int]], commit: Callable[[int, int], Any], flog, keep_worker = False) -> Dict:
+        """Capture the remaining rows of `ranges[todo]` with `lane`, calling `commit(range, committed)` once every
+        row is flushed. Returns the throughput of the lane and how many of its rows missed the disturber steps.
+        """
+        os.sched_setaffinity(0, {lane.setter_core_})
+        finished, terminated, rows, unaligned = False, False, 0, 0
+        t_start = time.perf_counter()
+        try:
+            if self.transport_ == "worker": lane.recorder_.start_worker(self.n_reads_)
             # Start backgrounds
-            self.backgrouds_.run()
+            lane.backgrouds_.run()
             
             # Wait until all backgrounds are ready
-            while not self.backgrouds_.ready(): ...
+            while not lane.backgrouds_.ready(): ...
             
-            for i in tqdm.tqdm(range(self.size_)):
-                if self.disturber_:
-                    self.disturber_.run()
-                    while not self.disturber_.ready(): ...
-                
-                data[i] = self.recorder_.record_once(self.n_reads_, self.interval_, self.fp_log_)
-                
-                if self.backgrouds_.finished():
-                    # On finish
-                    if self.on_finished_ == "repeat":
-                        # self.backgrouds_.stop()
-                        for b in self.backgrouds_.backgrounds_:
-                            if b.finished(): b.run()
-                    elif self.on_finished_ == "revert":
-                        # self.backgrouds_.stop()
-                        for b in self.backgrouds_.backgrounds_:
-                            if b.finished(): b.run()
-                        i -= 1
-                    elif self.on_finished_ == "terminate":
-                        break
+            t_start = time.perf_counter()
+            for r in todo:
+                _, committed, stop = ranges[r]
+                for i in range(committed, stop):
+                    if lane.disturber_:
+                        if os.path.exists(lane.timing_path_): os.remove(lane.timing_path_)
+                        lane.disturber_.run()
+                        # Until the setter fixed its first deadline, its start-up is not part of the sample
+                        while not lane.disturber_.ready(): ...
+                        if lane.disturber_.start_ns_ is None: flog.write(f"Disturber of sample {i} exited before its first step\n")
+                    
+                    capture = (time.monotonic_ns(), 0)
+                    lane.recorder_.record_once(self.n_reads_, self.interval_, flog, self.transport_, out=data[i])
+                    capture = (capture[0], time.monotonic_ns())
+                    
+                    if lane.disturber_ is not None:
+                        while not lane.disturber_.finished():...
+                        if self.timing_rows_ is not None:
+                            self._store_timing(lane, i, capture, flog)
+                            if not capture_overlaps(self.timing_rows_[i]):
+                                unaligned += 1
+                                flog.write(f"Capture of sample {i} does not overlap the disturber steps\n")
+                    if isinstance(data, np.memmap): data.flush()
+                    commit(r, i + 1)
+                    rows += 1
                     
-                if self.disturber_ is not None:
-                    while not self.disturber_.finished():...
-                
-            self.backgrouds_.stop()
+                    if lane.backgrouds_.finished():
+                        # On finish
+                        if self.on_finished_ == "repeat":
+                            # lane.backgrouds_.stop()
+                            for b in lane.backgrouds_.backgrounds_:
+                                if b.finished(): b.run()
+                        elif self.on_finished_ == "revert":
+                            # lane.backgrouds_.stop()
+                            for b in lane.backgrouds_.backgrounds_:
+                                if b.finished(): b.run()
+                            i -= 1
+                        elif self.on_finished_ == "terminate":
+                            terminated = True
+                            break
+                if terminated: break
+            
+            lane.backgrouds_.stop()
             finished = True
         except Exception as e:
-            self.fp_log_.write(traceback.format_exc())
+            flog.write(traceback.format_exc())
+        finally:
+            lane.backgrouds_.stop()
+            if lane.disturber_: lane.disturber_.stop()
+            if not keep_worker: lane.recorder_.stop_worker()
+        seconds = time.perf_counter() - t_start
+        return {"lane": lane.index_, "cores": lane.cores_, "rows": rows, "seconds": seconds, "rows_per_sec": rows / max(seconds, 1e-9), "unaligned": unaligned, "finished": finished}
+    
+    def _capture_lanes(self, lanes: List[Tuple[CaptureLane, List[int]]], data: np.ndarray, ranges: List[List[int]], commit: Callable[[int, int], Any]) -> List[Dict]:
+        """Capture with every lane at once, one forked process per lane writing its rows straight into `data`,
+        so busy-waiting lanes do not share an interpreter. Commits come back on a queue, only this process
+        writes the journal. Each lane logs to `<log>.lane<k>`.
+        """
+        ctx = mp.get_context("fork")
+        messages = ctx.Queue()
+        
+        def run(lane: CaptureLane, todo: List[int]):
+            with open(f"{self.log_path_}.lane{lane.index_}", "a") as flog:
+                stats = self._capture(lane, todo, data, ranges, lambda r, committed: messages.put(("commit", r, committed)), flog)
+            messages.put(("done", stats))
+        
+        # Lanes start their own samplers, a worker shared from a previous config stays with this process
+        if self.transport_ == "worker": self.recorder_.stop_worker()
+        # Not daemonic, lanes start sampler processes
+        procs = {lane.index_: ctx.Process(target=run, args=(lane, todo)) for lane, todo in lanes}
+        stats = {}
+        try:
+            for proc in procs.values(): proc.start()
+            while len(stats) < len(procs):
+                try:
+                    message = messages.get(timeout=1)
+                except queue.Empty:
+                    if any(proc.is_alive() for proc in procs.values()): continue
+                    break
+                if message[0] == "commit":
+                    commit(*message[1:])
+                else:
+                    stats[message[1]["lane"]] = message[1]
         finally:
-            self.backgrouds_.stop()
-            if self.disturber_: self.disturber_.stop()
+            for proc in procs.values(): proc.join()
+        # Lanes killed before reporting
+        for lane, _ in lanes:
+            if lane.index_ not in stats:
+                self.fp_log_.write(f"Lane {lane.index_} exited with code {procs[lane.index_].exitcode}\n")
+                stats[lane.index_] = {"lane": lane.index_, "cores": lane.cores_, "rows": 0, "seconds": 0., "rows_per_sec": 0., "unaligned": 0, "finished": False}
+        return [stats[lane.index_] for lane, _ in lanes]
+    
+    def _rows(self, dtype, shape: Tuple[int, ...], fill: int = 0) -> np.ndarray:
+        """Unsaved rows, in an anonymous shared map with several lanes so their processes fill the same pages."""
+        dtype = np.dtype(dtype)
+        if len(self.lanes_) == 1:
+            rows = np.zeros(shape, dtype=dtype)
+        else:
+            rows = np.frombuffer(mmap.mmap(-1, int(np.prod(shape)) * dtype.itemsize), dtype=dtype).reshape(shape)
+        if fill: rows[...] = np.full((), fill, dtype=dtype)
+        return rows
+    
+    def build(self, save = True, replace = False, keep_worker = False):
+        """Capture `size` samples. With `save`, they go straight to a memory-mapped `.partial.npy`
+        committed sample by sample, a rerun after a crash resumes from the last committed sample
+        and the finished file is renamed to the target, or encoded to `.vtc` with `codec`. Returns the samples
+        read-only mapped.
+        With several lanes, each captures its own range of rows concurrently, see `n_lanes`, and
+        the throughput of every lane is reported and kept in `lane_stats_`.
+        With a disturber, the achieved timing of every sample is kept row by row in `timing_rows_`
+        and saved to `<name>.timing.npy`, see `_timing_dtype`.
+        """
+        # If built under the same config and not replace, skip
+        built = self._check_exist()
+        if not replace and built:
+            if is_fresh(built, self.key_):
+                self.finished_ = True
+                self.timing_rows_ = np.load(self.timing_, mmap_mode="r") if os.path.exists(self.timing_) else None
+                return load_traces(built), self.label_
+            print(f"{built} has no build metadata or its config changed, rebuilding...")
+        
+        if save:
+            data, ranges = self._open_partial(replace)
+        else:
+            data, ranges = self._rows(np.int16, (self.size_, self.n_reads_)), self._split()
+            self.timing_rows_ = self._rows(self._timing_dtype(), (self.size_,), -1) if self.disturber_config_ is not None else None
+        start = sum(committed - first for first, committed, _ in ranges)
+        
+        self.fp_log_ = open(self.log_path_, "a" if start else "w")
+        if start: self.fp_log_.write(f"Resuming from sample {start}/{self.size_}\n")
+        
+        # Ranges left, dealt round-robin to the lanes
+        pending = [r for r, (_, committed, stop) in enumerate(ranges) if committed < stop]
+        lanes = [(lane, pending[k::len(self.lanes_)]) for k, lane in enumerate(self.lanes_) if pending[k::len(self.lanes_)]]
+        progress = tqdm.tqdm(initial=start, total=self.size_)
+        def commit(r: int, committed: int):
+            progress.update(committed - ranges[r][1])
+            ranges[r][1] = committed
+            if save: self._commit(ranges)
+
+        # Set base voltage
+        self._reset_volt()
+        if len(lanes) > 1:
+            self.lane_stats_ = self._capture_lanes(lanes, data, ranges, commit)
+        else:
+            self.lane_stats_ = [self._capture(lane, todo, data, ranges, commit, self.fp_log_, keep_worker) for lane, todo in lanes]
+        progress.close()
+        # Lanes stopped early by `terminate` leave rows to resume as well
+        finished = self.finished_ = all(stats["finished"] for stats in self.lane_stats_) and all(committed == stop for _, committed, stop in ranges)
+        for stats in self.lane_stats_:
+            line = f"Lane {stats['lane']} on cores {stats['cores']}: {stats['rows']} samples in {stats['seconds']:.1f}s, {stats['rows_per_sec']:.2f} samples/s"
+            # Throughput only counts when the samples saw their disturber
+            if self.disturber_config_ is not None: line += f", {stats['unaligned']} not overlapping the disturber steps"
+            self.fp_log_.write(line + "\n")
+            if len(self.lanes_) > 1 or stats["unaligned"]: print(line)
         self._reset_volt()
         self.fp_log_.close()
         
-        if save and finished: np.save(self.target_, data)
-        return data, self.label_
+        if not save:
+            return data, self.label_
+        data.flush()
+        del data
+        if self.timing_rows_ is not None:
+            self.timing_rows_.flush()
+            self.timing_rows_ = np.lib.format.open_memmap(self.partial_timing_, mode="r")
+        if not finished:
+            print(f"Capture of `{self.name_}` stopped, rerun to resume, see {self.log_path_}{'*' if len(self.lanes_) > 1 else ''}")
+            return np.lib.format.open_memmap(self.partial_, mode="r"), self.label_
+        # A stale build in the other format would shadow this one
+        for ext in (".npy", ".vtc"):
+            if os.path.exists(self.target_ + ext): os.remove(self.target_ + ext)
+        if self.codec_ is None:
+            built = self.target_ + ".npy"
+            os.replace(self.partial_, built)
+        else:
+            built = encode_npy(self.partial_, self.target_ + ".vtc", self.codec_)
+            os.remove(self.partial_)
+        if self.timing_rows_ is not None:
+            os.replace(self.partial_timing_, self.timing_)
+            self.timing_rows_ = np.load(self.timing_, mmap_mode="r")
+        elif os.path.exists(self.timing_):
+            os.remove(self.timing_)
+        os.remove(self.journal_)
+        write_meta(built, self.key_, self.capture_config_, name=self.name_, label=self.label_, transport=self.transport_, codec=self.codec_,
+                   timing=os.path.basename(self.timing_) if self.timing_rows_ is not None else None)
+        return load_traces(built), self.label_
+
+    @classmethod
+    def build_each(cls, configs: List[str], save = True, replace = False):
+        """Build `configs` one by one, yield `(config, data, label, key)` for every config found, raise on unfinished ones."""
+        # (source config, recorder) whose sampler worker is kept alive across configs
+        worker = None
+        try:
+            for config in configs:
+                cfg_pth = find_config(config)
+                if cfg_pth is None:
+                    print(f"Config `{config}` not found, skipped...")
+                    continue
+                print(f"Building config `{config}`...")
+                builder = cls.from_config(cfg_pth)
+                if builder.transport_ == "worker":
+                    if worker is not None and worker[0] == builder.source_config_:
+                        builder.recorder_ = worker[1]
+                    else:
+                        if worker is not None: worker[1].stop_worker()
+                        worker = (builder.source_config_, builder.recorder_)
+                data, label = builder.build(save, replace, keep_worker=True)
+                if not builder.finished_: raise RuntimeError(f"Capture of `{config}` did not finish, rerun to resume it.")
+                yield config, data, label, builder.key_
+        finally:
+            if worker is not None: worker[1].stop_worker()
+            RWVolt.unbind()
 
     @classmethod
     def build_all(cls, configs: List[str], save = True, replace = False):
+        """All `configs` as one lazy `ShardedArray` over their memory-mapped captures, and their labels."""
         datasets = []
         labels = []
-        for config in configs:
-            cfg_pth = find_config(config)
-            if cfg_pth is None:
-                print(f"Config `{config}` not found, skipped...")
-                continue
-            print(f"Building config `{config}`...")
-            data, label = cls.from_config(cfg_pth).build(save, replace)
+        for _, data, label, _ in cls.build_each(configs, save, replace):
             datasets.append(data)
             labels.append(np.ones(data.shape[0], dtype=np.bool_) * (label == cls._POS_LABEL))
-        
-        RWVolt.unbind()
-        return np.concatenate(datasets, axis=0), np.concatenate(labels, axis=0)
+        return ShardedArray.concatenate(datasets), np.concatenate(labels, axis=0)
 
 class DatasetGroup:
     _TARGET_DIR = os.path.join(DIR_DATASETS_BUILD, "group")
@@ -172,37 +503,93 @@ class DatasetGroup:
         self,
         name: str,
         configs: List[str],
-        augment: Optional[AugmentBase]
+        augment: Optional[AugmentBase],
+        online_augment: bool = False,
+        n_workers: int = 1,
+        chunk_rows: int = 1024,
+        seed: int = 0,
+        codec: Optional[Codec] = None,
+        augment_config: Optional[Dict] = None
     ):
+        """
+        Args:
+            online_augment (bool): Store the configs as captured, `train.py --augment` applies `augment` per batch.
+            n_workers (int): Processes augmenting row blocks, the output is the same for any number.
+            chunk_rows (int): Rows augmented at a time per process, bounds the memory used.
+            seed (int): Seed of the augmentation, each config and row block draws its own stream from it.
+            codec (str): Store augmented shards compressed as `.vtc` with `zlib`, `lzma` or `none`, `None` for `.npy`.
+            augment_config (dict): Config `augment` was parsed from, part of the cache key of the augmented shards.
+        """
         self.name_ = name
         self.configs_ = configs
         self.augment_ = augment
+        self.online_augment_ = online_augment
+        self.n_workers_ = n_workers
+        self.chunk_rows_ = chunk_rows
+        self.seed_ = seed
+        self.codec_ = codec
+        self.augment_config_ = augment_config
         self.target_dir_ = os.path.join(self._TARGET_DIR, name)
         os.makedirs(self.target_dir_, exist_ok=True)
         self.target_data_ = os.path.join(self.target_dir_, self._NAME_DATA)
         self.target_labels_ = os.path.join(self.target_dir_, self._NAME_LABELS)
     
     def build(self, save = True, replace = False):
-        X, y = DatasetBuilder.build_all(self.configs_, save, replace)
-        X, y = self.augment_.apply(X, y)
+        """Build and augment the configs one at a time into the shards of the manifest, unaugmented captures listed as they are."""
+        manifest, datasets, labels = Manifest(), [], []
+        for i, (config, X, label, key) in enumerate(DatasetBuilder.build_each(self.configs_, save, replace)):
+            path = None
+            if self.augment_ is not None and not self.online_augment_:
+                # Augmented shards are cached on their input and everything that changes their rows
+                shard_config = {"input": key, "augment": self.augment_config_, "seed": self.seed_, "index": i, "chunk_rows": self.chunk_rows_, "codec": self.codec_}
+                key = config_hash(shard_config)
+                path = self._cached_shard(config, key) if save and not replace else None
+                if path is not None:
+                    X = load_traces(path)
+                else:
+                    path = os.path.join(self.target_dir_, config + ".npy") if save else None
+                    X, _ = self.augment_.apply_chunks(X, np.zeros(len(X), dtype=np.bool_), path, self.chunk_rows_, self.n_workers_, (self.seed_, i))
+                    if path is not None and self.codec_ is not None:
+                        del X
+                        path = encode_npy(path, codec=self.codec_)
+                        os.remove(os.path.splitext(path)[0] + ".npy")
+                        X = load_traces(path)
+                    if path is not None:
+                        write_meta(path, key, shard_config, source=config, label=label, codec=self.codec_)
+            elif save:
+                path = X.filename
+            if path is not None:
+                manifest.add(os.path.relpath(path, self.target_dir_), X.shape[0], label, config, key=key)
+            datasets.append(X)
+            labels.append(np.full(X.shape[0], label == DatasetBuilder._POS_LABEL, dtype=np.bool_))
         if save:
-            np.save(self.target_data_  , X)
-            np.save(self.target_labels_, y)
-        return X, y
+            manifest.key_ = config_hash([shard["key"] for shard in manifest.shards_])
+            manifest.save(self.target_dir_)
+        return ShardedArray.concatenate(datasets), np.concatenate(labels)
+    
+    def _cached_shard(self, config: str, key: str) -> Optional[str]:
+        """Augmented shard of `config` built under `key`, if any."""
+        for ext in (".npy", ".vtc"):
+            path = os.path.join(self.target_dir_, config + ext)
+            if is_fresh(path, key): return path
     
     @classmethod
     def from_config(cls, path: str):
         with open(path) as fp:
             config: OrderedDict = json.load(fp, object_pairs_hook=OrderedDict)
         aug_config = config.pop("augment", None)
-        augment = aug_config and AugmentBase.from_config(aug_config)
-        return cls(**config, augment=augment)
+        # Parsing consumes the config, keep it for the cache key
+        augment = aug_config and AugmentBase.from_config(json.loads(json.dumps(aug_config), object_pairs_hook=OrderedDict))
+        return cls(**config, augment=augment, augment_config=aug_config)
     
     @classmethod
     def load_from(cls, dir):
+        """Samples and labels of a built group, lazily over its shards, or its read-only `data.npy` for older groups."""
+        if Manifest.exists(dir):
+            return Manifest.read(dir).load(dir, DatasetBuilder._POS_LABEL)
         data_pth = os.path.join(dir, cls._NAME_DATA + ".npy")
         label_pth = os.path.join(dir, cls._NAME_LABELS + ".npy")
-        return np.load(data_pth), np.load(label_pth)
+        return np.load(data_pth, mmap_mode="r"), np.load(label_pth)
 
 def parse_args():
     from argparse import ArgumentParser
@@ -8,4 +8,6 @@ DIR_DATASETS_GROUP  = "./datasets/group"
 DIR_MODELS = "./models"
 POS_LABEL = "disturbed"
 NEG_LABEL = "normal"
-PATH_LIB = "./rwvolt/librwvolt.so"
\ No newline at end of file
+PATH_LIB = "./rwvolt/librwvolt.so"
+MSR_PATH = "/dev/cpu/%d/msr"
+DIR_MSR_EMULATED = "./.log/msr"
\ No newline at end of file
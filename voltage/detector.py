@@ -1,29 +1,45 @@
-from train import load_model
-from rwvolt import RWVolt
-from recorder import VoltRecorder
+from recorder import VoltRecorder, StopDealing
+from source import VoltSourceBase
+from typing import List, Optional
+from inference import InferenceBackend, load_model
+from metrics import DetectorMetrics
 import multiprocessing as mp
-import sys, keras
+import sys, time
+from time import perf_counter_ns
 import numpy as np
-from utils.plot_voltage import plot_voltage
-import matplotlib.pyplot as plt
 
 class VoltDetector:
     _N_MAX_CORES = mp.cpu_count() - 2
     _DEALER_CORE = _N_MAX_CORES
     _READER_CORE = _DEALER_CORE + 1
-    def __init__(self, model_dir: str, threshold = 0.5, n_windows = 10, tol = 2, proc_core: int = _DEALER_CORE, reader_core: int = _READER_CORE, test = False):
+    def __init__(self, model_dir: str, threshold = 0.5, n_windows = 10, tol = 2, proc_core: int = _DEALER_CORE, reader_core: int = _READER_CORE, test = False, transport = "text", source: VoltSourceBase = None, backend = "session", max_decisions = 0, cores: Optional[List[int]] = None, queue_size = 0, policy = "block", metrics_path: Optional[str] = None, metrics_interval = 10.):
         """Initialize the VoltDetector with a model directory, threshold, fold, and tolerance.
+        Every monitored core is a stream: one sampler reads them round-robin, each tick all streams
+        slide by one chunk and are predicted in a single batched model call, alarms are per stream.
         Args:
             model_dir (str): Directory containing the model files.
             threshold (float): Threshold for volt detection model output.
             n_windows (int): Number of sliding windows for data predicting, the comming slide will replace the first slide for next predict.
-            tol (int): Tolerance truth for the alarm, in order to avoid error.
+            tol (int | List[int]): Tolerance truth for the alarm, in order to avoid error, per stream if a list.
             proc_core (int): Core ID for data processing.
             reader_core (int): Core ID for reading data.
+            transport (str): Sample transport from the reader, `text`, `binary` or `ring`, several cores need `binary` or `ring`.
+            source (VoltSourceBase): Voltage source, live MSR by default.
+            backend (str): Inference backend, `session` (traced graph), `predict` (`Model.predict`), `numpy` (exported `model.npz`, no TensorFlow)
+                or `streaming` (`numpy` reusing the overlap of windows).
+            max_decisions (int): Stop after this many predictions, `0` to run until the alarm.
+            cores (List[int]): Monitored cores, core 0 by default.
+            queue_size (int): Windows buffered between the reader thread and inference, `0` to read and predict in turn.
+            policy (str): What to drop when inference falls behind the queue, `block`, `drop_oldest` or `coalesce`.
+            metrics_path (str): Export stage latencies, rates and CPU time to `<metrics_path>.prom` and `.json`, `None` to only collect them.
+            metrics_interval (float): Seconds between metrics exports.
         """
-        self.recorder_ = VoltRecorder(proc_core, reader_core)
-        model, scaler, args = load_model(model_dir)
-        self.model_: keras.models.Model = model
+        self.cores_ = list(cores) if cores else [0]
+        self.n_streams_ = len(self.cores_)
+        assert self.n_streams_ == 1 or transport != "text", ValueError("Monitoring several cores needs the `binary` or `ring` transport.")
+        self.recorder_ = VoltRecorder(proc_core, reader_core, source, self.cores_)
+        model, scaler, args = load_model(model_dir, backend)
+        self.model_ = model
         self.scaler_ = scaler
         self.args_ = args
         self.n_reads_ = model.input_shape[1]
@@ -31,30 +47,85 @@ class VoltDetector:
         
         self.n_windows_ = n_windows
         assert self.n_reads_ % n_windows == 0, ValueError(f"Number of reads {self.n_reads_} should be divisible by fold {n_windows}.")
-        self.tol_ = tol
+        self.tol_ = np.broadcast_to(np.asarray(tol, dtype=np.int16), (self.n_streams_,)).copy()
         
         self.window_size_ = (self.n_reads_ + self.n_windows_ - 1) // self.n_windows_
+        # The backend scales the int16 window straight into its float32 input
+        self.backend_ = InferenceBackend.create(backend, model, shift=self.window_size_, scaler=scaler, batch=self.n_streams_)
         
         self.buffer_ = None
         self.record_ = None
         self.is_test_ = test
+        self.transport_ = transport
+        self.max_decisions_ = max_decisions
+        self.queue_size_ = queue_size
+        self.policy_ = policy
+        self.metrics_ = DetectorMetrics(metrics_path, metrics_interval, {"cores": ",".join(map(str, self.cores_)), "backend": backend}, self.recorder_.deal_stats)
     
+    def reset(self):
+        """Preallocate the sliding state, nothing is allocated per window afterwards."""
+        n, w, s = self.n_reads_, self.window_size_, self.n_streams_
+        # Every chunk is written twice, `n` apart, so the latest `n` samples of a stream are always contiguous
+        self.ring_ = np.zeros((s, 2 * n), dtype=np.int16)
+        self.slots_ = [(self.ring_[:, k * w:(k + 1) * w], self.ring_[:, n + k * w:n + (k + 1) * w]) for k in range(self.n_windows_)]
+        self.views_ = [self.ring_[:, k * w:k * w + n] for k in range(self.n_windows_)]
+        self.pos_ = 0
+        self.filled_ = 0
+        self.buffer_ = self.views_[0]
+        # Alarm votes of the last `n_windows` predictions of every stream and their running sums
+        self.record_ = np.zeros((s, self.n_windows_), dtype=np.int8)
+        self.record_cols_ = [self.record_[:, k] for k in range(self.n_windows_)]
+        self.record_pos_ = 0
+        self.n_alarms_ = np.zeros(s, dtype=np.int16)
+        self.votes_ = np.zeros(s, dtype=np.int8)
+        self.alarmed_ = np.zeros(s, dtype=bool)
+        self.backend_.reset()
+        self.cnt_ = 0
+        self.t_dealt_ = perf_counter_ns()
+
+    def _slide(self, data) -> bool:
+        """Push one chunk `(streams, window_size)` (1-D for one stream) into the windows, return whether they are full."""
+        head, mirror = self.slots_[self.pos_]
+        data = data.reshape(head.shape)
+        np.copyto(head, data)
+        np.copyto(mirror, data)
+        self.pos_ = (self.pos_ + 1) % self.n_windows_
+        self.buffer_ = self.views_[self.pos_]
+        if self.filled_ < self.n_reads_:
+            self.filled_ += self.window_size_
+            # Keep the first full window as history only, like the sliding always did
+            return False
+        return True
+
+    def _vote(self, alarm) -> np.ndarray:
+        """Replace the oldest vote of every stream by `alarm`, return the number of alarms per stream in the last `n_windows`."""
+        col = self.record_cols_[self.record_pos_]
+        np.subtract(self.n_alarms_, col, out=self.n_alarms_)
+        np.copyto(col, alarm)
+        np.add(self.n_alarms_, col, out=self.n_alarms_)
+        self.record_pos_ = (self.record_pos_ + 1) % self.n_windows_
+        return self.n_alarms_
+
     def _dealer(self, data):
-        if self.buffer_.shape[1] < self.n_reads_:
-            self.buffer_ = np.hstack((self.buffer_, data.reshape(1,-1)))
-            if self.buffer_.shape[1] > self.n_reads_:
-                self.buffer_ = self.buffer_[:,-self.n_reads_:]
+        # Stages: waiting for the chunk, scaling into the model input, the model, voting
+        t_read = perf_counter_ns()
+        metrics = self.metrics_
+        metrics.stage("read", t_read - self.t_dealt_)
+        metrics.add_samples(data.size)
+        if not self._slide(data):
+            self.t_dealt_ = perf_counter_ns()
             return
         self.cnt_ += 1
-        self.buffer_ = np.hstack((self.buffer_[:,self.window_size_:], data.reshape(1,-1)))
         
-        result = self.model_.predict(
-            self.scaler_.transform(self.buffer_),
-            verbose=0
-        )[0][0]
+        self.backend_.fill(self.buffer_)
+        t_scaled = perf_counter_ns()
+        result = self.backend_.run_batch()
+        t_inferred = perf_counter_ns()
         
         if self.is_test_:
             import os
+            import matplotlib.pyplot as plt
+            from utils.plot_voltage import plot_voltage
             os.makedirs(".log/temp", exist_ok=True)
             with open(".log/temp/result.txt", "a") as f:
                 f.write(f"Test predict {self.cnt_: 4} {result}\n")
@@ -63,19 +134,31 @@ class VoltDetector:
             fig.savefig(f".log/temp/volt_detected_{self.cnt_}.png")
             plt.close()
         
-        # slide
-        self.record_ = np.roll(self.record_, -1)
-        self.record_[-1] = int(result > self.threshold_)
-        
-        if self.record_.sum() > self.tol_:
+        np.greater(result, self.threshold_, out=self.votes_, casting="unsafe")
+        alarm = np.greater(self._vote(self.votes_), self.tol_, out=self.alarmed_).any()
+        self.t_dealt_ = t_decided = perf_counter_ns()
+        metrics.stage("scale", t_scaled - t_read)
+        metrics.stage("inference", t_inferred - t_scaled)
+        metrics.stage("decision", t_decided - t_inferred)
+        metrics.stage("window", t_decided - t_read)
+        metrics.add_window()
+        metrics.tick()
+        if alarm:
+            metrics.add_alarm()
             print("Alarm!!!!")
-            raise OSError("Being attacked!")
+            raise OSError(f"Being attacked on core {[c for c, a in zip(self.cores_, self.alarmed_) if a]}!")
+        if self.cnt_ == self.max_decisions_:
+            raise StopDealing()
     
     def start(self):
-        self.buffer_ = np.zeros((1, 0),dtype=np.int16)
-        self.record_ = np.zeros((self.n_windows_,), dtype=np.int8)
-        self.cnt_ = 0
-        self.recorder_.record_deal(self.window_size_, 0, self._dealer, sys.stderr)
+        self.reset()
+        try:
+            self.recorder_.record_deal(self.window_size_, 0, self._dealer, sys.stderr, self.transport_, queue_size=self.queue_size_, policy=self.policy_)
+        finally:
+            # The last period, up to the alarm or the stop
+            if self.metrics_.path_ is not None: self.metrics_.export()
+        if self.queue_size_ > 0:
+            sys.stderr.write(f"Window queue: {self.recorder_.queue_stats()}\n")
 
 
 def parse_args():
@@ -85,12 +168,45 @@ def parse_args():
     parser.add_argument("-t", "--threshold", type=float, default=0.7, help="Threshold for the volt detection model output.")
     parser.add_argument("-n", "--n_windows", type=int, default=10, help="Number of sliding windows for data predicting.")
     parser.add_argument("-a", "--tol", type=int, default=8, help="Tolerance for the alarm, in order to avoid error.")
+    parser.add_argument("-T", "--transport", type=str, choices=["text", "binary", "ring"], default="text", help="Sample transport from the reader process.")
+    parser.add_argument("-B", "--backend", type=str, choices=list(InferenceBackend.registered), default="session", help="Inference backend of the model.")
+    parser.add_argument("-c", "--cores", type=int, nargs="+", default=[0], help="Monitored cores, several need `-T binary` or `-T ring`.")
+    parser.add_argument("-q", "--queue_size", type=int, default=0, help="Windows buffered between reading and inference, 0 to read and predict in turn.")
+    parser.add_argument("--policy", type=str, choices=["block", "drop_oldest", "coalesce"], default="block", help="What to drop when inference falls behind the queue.")
+    parser.add_argument("-P", "--proc_core", type=int, default=VoltDetector._DEALER_CORE, help="Core of the detector process.")
+    parser.add_argument("-R", "--reader_core", type=int, default=VoltDetector._READER_CORE, help="Core of the sampler process.")
+    parser.add_argument("--replay", type=str, default=None, help="Replay a recorded `.npy` trace instead of reading MSR.")
+    parser.add_argument("--rate", type=float, default=0, help="Replay rate in samples/sec, 0 for as fast as possible.")
+    parser.add_argument("--emulated", action="store_true", default=False, help="Read an emulated MSR file instead of the hardware.")
+    parser.add_argument("--metrics", type=str, default=None, help="Export detector metrics to `<metrics>.prom` (Prometheus textfile collector) and `<metrics>.json`.")
+    parser.add_argument("--metrics_interval", type=float, default=10., help="Seconds between metrics exports.")
+    parser.add_argument("--first_decision", action="store_true", default=False, help="Exit after the first prediction, printing the startup timeline as json (CLOCK_MONOTONIC seconds).")
+    parser.add_argument("--import_profile", action="store_true", default=False, help="Print the slowest imports of this run up to the first decision instead of detecting.")
     return parser.parse_args()
 
 def main():
+    t_main = time.monotonic()
     args = parse_args()
-    detector = VoltDetector(args.model, args.threshold, args.n_windows, args.tol)
+    if args.import_profile:
+        from utils.tools import import_profile
+        argv = [arg for arg in sys.argv if arg != "--import_profile"]
+        print(f"{'self [us]':>10} {'cumulative [us]':>16}  module")
+        for module, self_us, cumulative_us in import_profile([*argv, "--first_decision"]):
+            print(f"{self_us:>10} {cumulative_us:>16}  {module}")
+        return
+    source = None
+    if args.replay:
+        from source import ReplaySource
+        source = ReplaySource(args.replay, args.rate)
+    elif args.emulated:
+        from source import EmulatedMSRSource
+        source = EmulatedMSRSource(args.cores)
+    detector = VoltDetector(args.model, args.threshold, args.n_windows, args.tol, args.proc_core, args.reader_core, transport=args.transport, source=source, backend=args.backend, max_decisions=int(args.first_decision), cores=args.cores, queue_size=args.queue_size, policy=args.policy, metrics_path=args.metrics, metrics_interval=args.metrics_interval)
+    t_loaded = time.monotonic()
     detector.start()
+    if args.first_decision:
+        import json
+        print(json.dumps({"main": t_main, "loaded": t_loaded, "decision": time.monotonic(), "decisions": detector.cnt_}))
     
 if __name__ == "__main__":
     main()
@@ -1,10 +1,7 @@
 import multiprocessing as mp
 import sys, os, time, random
 from detector import VoltDetector
-from setter import seq_setter
-from rwvolt import RWVolt
 from enum import Enum, auto
-from utils.plot_voltage import plot_voltage
 
 class TestResult(Enum):
     TP = 0
@@ -13,8 +10,8 @@ class TestResult(Enum):
     TN = 3
     UNDEFINED = auto()
 
-def detector_process_entry(model, threshold, n_windows, tol, test):
-    detector = VoltDetector(model, threshold, n_windows, tol, test=test)
+def detector_process_entry(model, threshold, n_windows, tol, test, backend = "session"):
+    detector = VoltDetector(model, threshold, n_windows, tol, test=test, backend=backend)
     detector.start()
 
 # False Positive in 10 minutes
@@ -81,6 +78,7 @@ def parse_args():
     parser.add_argument("-n", "--n_windows", type=int, default=10, help="Number of sliding windows for data predicting.")
     parser.add_argument("-a", "--tol", type=int, default=8, help="Tolerance for the alarm, in order to avoid error.")
     parser.add_argument("-s", "--tests", type=int, nargs="+", default=[0,1])
+    parser.add_argument("-B", "--backend", type=str, default="session", help="Inference backend of the detector, `numpy` starts fastest.")
     
     parser.add_argument("-l", "--log", action="store_true", default=False)
     
@@ -136,7 +134,7 @@ def main():
     random.seed(42)
     args = parse_args()
     
-    detector_args = [args.model, args.threshold, args.n_windows, args.tol, args.log]
+    detector_args = [args.model, args.threshold, args.n_windows, args.tol, args.log, args.backend]
     N = args.n_rounds
     
     results = {}
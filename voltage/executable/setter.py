@@ -1,28 +1,40 @@
 from rwvolt import RWVolt
-import argparse, time, sys
+import argparse, sys
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-c", "--cores", nargs="+", type=list, default=[0])
+    parser.add_argument("-c", "--cores", nargs="+", type=int, default=[0])
     parser.add_argument("-m", "--method", type=str, default="offset")
     parser.add_argument("-p", "--periods", type=int, nargs="+", required=True)
     parser.add_argument("-v", "--values", type=int, nargs="+", required=True)
+    parser.add_argument("--msr_path", type=str, default=None, help="MSR path format, e.g. an emulated MSR file.")
+    parser.add_argument("--timing", type=str, default=None, help="CSV of the requested and actual CLOCK_MONOTONIC ns of every step.")
+    parser.add_argument("--ready_fd", type=int, default=-1, help="Inherited pipe the first deadline is written to before it is reached.")
     return parser.parse_args()
 
-def seq_setter(func, cores, periods, values, output = sys.stderr):
-    st = time.time()
+def write_timing(path, values, deadlines, stamps):
+    with open(path, "w") as fp:
+        fp.write("step,value,deadline_ns,written_ns,late_ns\n")
+        for step, (v, d, s) in enumerate(zip(values, deadlines, stamps)):
+            fp.write(f"{step},{v},{d},{s},{s - d}\n")
+
+def seq_setter(handles, periods, values, timing = None, ready_fd = -1, output = sys.stderr):
     print(periods, values)
-    for p, v in zip(periods, values):
-        while 1000*(time.time() - st) < p: ...
-        for core in cores: func(core, v, output)
-        st = time.time()
+    # Native player: absolute deadlines from the start, writes do not drift the following steps
+    deadlines, stamps = handles.play(periods, values, ready_fd)
+    if timing: write_timing(timing, values, deadlines, stamps)
+    late = max(s - d for d, s in zip(deadlines, stamps)) if stamps else 0
+    output.write(f"Voltage schedule applied: {len(values)} steps on cores {handles.cores_}, written at most {late / 1e3:.1f} us after their deadlines.\n")
 
 def main():
     args = parse_args()
     config = args.__dict__
     method = config.pop("method")
-    func = RWVolt.set_core_voltage if method == "set" else RWVolt.offset_core_voltage
-    seq_setter(func, **config)
+    msr_path = config.pop("msr_path")
+    if msr_path: RWVolt.set_msr_path(msr_path)
+    # Open once, write many: no open/close or log line per step
+    with RWVolt.open_handles(config.pop("cores"), method) as handles:
+        seq_setter(handles, **config)
 
 # subprocess only
 main()
@@ -0,0 +1,175 @@
+import numpy as np
+import os, json, pickle
+from typing import Optional
+from utils.scaler import FloatScaler
+
+def register(name):
+    def wrapper(cls):
+        cls.registered[name] = cls
+        return cls
+    return wrapper
+
+class InferenceBackend:
+    """Runs the detector model on `batch` windows at a time, one per monitored stream. The windows
+    are written into the preallocated float32 `input_` of shape `(batch, n_reads, 1)`, then
+    `run_batch` returns the model outputs. `shift` is the number of samples between consecutive
+    windows of a stream, `0` if they are unrelated. Raw windows passed to `__call__` or `predict`
+    are scaled by `scaler` on the way into `input_`.
+    """
+    registered = {}
+    # Whether the backend reuses work between consecutive windows, so the inputs must be shift-invariant
+    streaming_ = False
+    # Whether the backend runs the Keras model, otherwise it takes a `NumpyModel` as well
+    keras_ = True
+
+    def __init__(self, model, shift: int = 0, scaler: Optional[FloatScaler] = None, batch: int = 1):
+        self.model_ = model
+        self.n_reads_ = model.input_shape[1]
+        self.shift_ = shift
+        self.scaler_ = scaler
+        self.batch_ = batch
+        self.input_ = np.zeros((batch, self.n_reads_, 1), dtype=np.float32)
+
+    def run_batch(self) -> np.ndarray:
+        """Model outputs `(batch,)` of the windows in `input_`."""
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def run(self) -> float:
+        return float(self.run_batch()[0])
+
+    def reset(self):
+        """Forget the previous windows, the next one is unrelated."""
+        ...
+
+    def fill(self, X: np.ndarray):
+        """Scale the raw windows `X` `(batch, n_reads)` into `input_`, rows of `X` may be strided."""
+        X, out = X.reshape(self.batch_, self.n_reads_), self.input_.reshape(self.batch_, self.n_reads_)
+        if self.scaler_ is None:
+            np.copyto(out, X, casting="same_kind")
+        else:
+            self.scaler_.transform_into(X, out)
+
+    def __call__(self, x: np.ndarray) -> float:
+        self.fill(x)
+        return self.run()
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        self.fill(X)
+        return self.run_batch()
+
+    @classmethod
+    def create(cls, name: str, model, **kwargs) -> "InferenceBackend":
+        assert name in cls.registered, ValueError(f"Inference backend {name} not found, choose from {list(cls.registered)}.")
+        return cls.registered[name](model, **kwargs)
+
+@register("predict")
+class PredictBackend(InferenceBackend):
+    """`keras.Model.predict` per window, the reference path."""
+    def run_batch(self):
+        return self.model_.predict(self.input_, verbose=0)[:, 0]
+
+@register("session")
+class SessionBackend(InferenceBackend):
+    """The model traced once into a graph with a fixed `(batch, n_reads, 1)` float32 signature,
+    so a call skips the data adapter, callbacks and retracing of `predict`.
+    """
+    def __init__(self, model, shift: int = 0, scaler: Optional[FloatScaler] = None, batch: int = 1, n_warmup: int = 3):
+        import tensorflow as tf
+        super().__init__(model, shift, scaler, batch)
+        spec = tf.TensorSpec(self.input_.shape, tf.float32)
+        self.fn_ = tf.function(lambda x: model(x, training=False), input_signature=[spec]).get_concrete_function()
+        # The first calls build the graph and the kernels, keep them out of the detection
+        for _ in range(n_warmup): self.run_batch()
+
+    def run_batch(self):
+        return np.asarray(self.fn_(self.input_))[:, 0]
+
+@register("numpy")
+class NumpyBackend(InferenceBackend):
+    """The whole window through `NumpyModel`, TensorFlow is not needed once the model is exported.
+    A scaler shared by all positions is folded into the first convolution, the input is then the raw samples.
+    """
+    keras_ = False
+
+    def __init__(self, model, shift: int = 0, scaler: Optional[FloatScaler] = None, batch: int = 1):
+        from npmodel import NumpyModel
+        super().__init__(model, shift, scaler, batch)
+        self.net_ = model if isinstance(model, NumpyModel) else NumpyModel.from_keras(model)
+        if scaler is not None and scaler.uniform_ and self.net_.layers_[0]["type"] == "conv":
+            self.net_ = self.net_.fold_scaler(scaler.center_[0], scaler.scale_[0])
+            self.scaler_ = None
+
+    def run_batch(self):
+        return self.net_.predict(self.input_[..., 0])
+
+@register("streaming")
+class StreamingBackend(NumpyBackend):
+    """Windows `shift` samples apart: only the newest positions of the local layers run, kept in a ring whose running mean feeds the head."""
+    streaming_ = True
+
+    def __init__(self, model, shift: int = 0, scaler: Optional[FloatScaler] = None, batch: int = 1):
+        super().__init__(model, shift, scaler, batch)
+        assert self.scaler_ is None or self.scaler_.uniform_, ValueError("Streaming needs a scaler shared by all positions, train with a `*_global` scale method.")
+        stride = self.net_.stride_
+        n_features = self.net_.n_features(self.n_reads_)
+        assert shift > 0 and shift % stride == 0, ValueError(f"Window shift {shift} should be a multiple of the model stride {stride}.")
+        assert shift // stride <= n_features, ValueError(f"Window shift {shift} is longer than the model output.")
+        self.n_new_ = shift // stride
+        # Samples behind the newest `n_new_` positions: their receptive fields, `stride` apart
+        self.start_ = (n_features - self.n_new_) * stride
+        self.stop_ = self.start_ + shift + self.net_.receptive_field_ - stride
+        n_channels = self.net_.features(np.zeros(self.net_.receptive_field_)).shape[-1]
+        self.features_ = np.zeros((batch, n_features, n_channels), dtype=np.float32)
+        self.sum_ = np.zeros((batch, n_channels), dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        self.pos_ = -1
+
+    def run_batch(self):
+        x = self.input_[..., 0]
+        n_features = self.features_.shape[1]
+        if self.pos_ < 0:
+            self.features_[:] = self.net_.features(x)
+            self.pos_ = 0
+            np.sum(self.features_, axis=1, dtype=np.float64, out=self.sum_)
+            return self.net_.head(self.sum_ / n_features)
+
+        new = self.net_.features(x[:, self.start_:self.stop_])
+        # The newest positions replace the oldest ones, which sit at `pos_` in the ring
+        done = 0
+        while done < self.n_new_:
+            k = min(self.n_new_ - done, n_features - self.pos_)
+            old = self.features_[:, self.pos_:self.pos_ + k]
+            self.sum_ -= old.sum(axis=1, dtype=np.float64)
+            old[:] = new[:, done:done + k]
+            self.sum_ += old.sum(axis=1, dtype=np.float64)
+            self.pos_ = (self.pos_ + k) % n_features
+            done += k
+        if self.pos_ < self.n_new_:
+            # Once per turn of the ring, drop the rounding accumulated by the running sum
+            np.sum(self.features_, axis=1, dtype=np.float64, out=self.sum_)
+        return self.net_.head(self.sum_ / n_features)
+
+def load_scaler(load_dir: str) -> FloatScaler:
+    """The exported `scaler.npz`, or else the pickled sklearn scaler converted."""
+    npz = os.path.join(load_dir, "scaler.npz")
+    if os.path.exists(npz):
+        return FloatScaler.load(npz)
+    with open(os.path.join(load_dir, "scaler.pkl"), "rb") as fp:
+        return FloatScaler.from_sklearn(pickle.load(fp))
+
+def load_model(load_dir: str, backend: str = "session"):
+    """Model for `backend`, its `FloatScaler` and training config. Backends without Keras get the
+    exported `model.npz` when there is one, then neither TensorFlow nor sklearn is imported.
+    """
+    npz = os.path.join(load_dir, "model.npz")
+    if InferenceBackend.registered[backend].keras_ or not os.path.exists(npz):
+        import keras
+        model = keras.models.load_model(os.path.join(load_dir, "model.keras"))
+    else:
+        from npmodel import NumpyModel
+        model = NumpyModel.load(npz)
+    with open(os.path.join(load_dir, "config.json"), "r") as fp:
+        args = json.load(fp)
+    return model, load_scaler(load_dir), args
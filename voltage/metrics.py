@@ -0,0 +1,175 @@
+import os, json, time
+from typing import Callable, Dict, Optional
+
+class LatencyHistogram:
+    """Log-linear histogram of durations in ns, HDR-style: every power of two is split into
+    `2 ** _SUB_BITS` buckets, so a percentile is off by at most 1/8. Recording is O(1) on a
+    preallocated list, percentiles cover the samples since the last `reset`, `count_` and
+    `sum_` are cumulative.
+    """
+    _SUB_BITS = 3
+    _SUB = 1 << _SUB_BITS
+
+    def __init__(self, max_bits: int = 48):
+        self.n_buckets_ = (max_bits - self._SUB_BITS + 1) * self._SUB
+        self.counts_ = [0] * self.n_buckets_
+        self.period_count_ = 0
+        self.max_ = 0
+        self.count_ = 0
+        self.sum_ = 0
+
+    def _upper(self, index: int) -> int:
+        if index < self._SUB: return index
+        e = (index >> self._SUB_BITS) - 1
+        return ((index - (e << self._SUB_BITS)) + 1 << e) - 1
+
+    def record(self, ns: int):
+        # Bucket: values below `_SUB` as is, else the exponent then the top `_SUB_BITS` bits below the leading one
+        if ns < self._SUB:
+            index = max(ns, 0)
+        else:
+            e = ns.bit_length() - 1 - self._SUB_BITS
+            index = ((e + 1) << self._SUB_BITS) + (ns >> e) - self._SUB
+            if index >= self.n_buckets_: index = self.n_buckets_ - 1
+        self.counts_[index] += 1
+        self.period_count_ += 1
+        self.count_ += 1
+        self.sum_ += ns
+        if ns > self.max_: self.max_ = ns
+
+    def percentile(self, q: float) -> int:
+        """Upper bound in ns of the `q`-th percentile since the last `reset`."""
+        if not self.period_count_: return 0
+        rank, seen = q / 100 * self.period_count_, 0
+        for index, count in enumerate(self.counts_):
+            seen += count
+            if count and seen >= rank: return min(self._upper(index), self.max_)
+        return self.max_
+
+    def reset(self):
+        self.counts_ = [0] * self.n_buckets_
+        self.period_count_ = 0
+        self.max_ = 0
+
+class DetectorMetrics:
+    """Per-stage latency histograms, sample/window counters and CPU time of a detector, exported every
+    `interval` seconds to `<path>.prom` (Prometheus textfile collector) and `<path>.json`.
+    Percentiles and rates cover the last period. `extra` returns more gauges, e.g. queue stats.
+    """
+    STAGES = ("read", "scale", "inference", "decision", "window")
+    QUANTILES = (50, 99)
+
+    def __init__(self, path: Optional[str] = None, interval: float = 10., labels: Optional[Dict[str, str]] = None, extra: Optional[Callable[[], dict]] = None):
+        self.path_ = path
+        self.interval_ = interval
+        self.labels_ = labels or {}
+        self.extra_ = extra
+        self.stages_ = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.samples_ = 0
+        self.windows_ = 0
+        self.alarms_ = 0
+        self.period_samples_ = 0
+        self.period_windows_ = 0
+        self.t_period_ = time.monotonic()
+        self.cpu_period_ = time.process_time()
+        self.t_export_ = self.t_period_ + interval
+        self.last_ = {}
+
+    def stage(self, name: str, ns: int):
+        self.stages_[name].record(ns)
+
+    def add_samples(self, n: int):
+        self.samples_ += n
+        self.period_samples_ += n
+
+    def add_window(self):
+        self.windows_ += 1
+        self.period_windows_ += 1
+
+    def add_alarm(self):
+        self.alarms_ += 1
+
+    def tick(self):
+        """Export when the period is over, cheap enough to call once per window."""
+        if self.path_ is not None and time.monotonic() >= self.t_export_:
+            self.export()
+
+    def snapshot(self) -> dict:
+        """Metrics of the period since the previous snapshot, which starts a new period."""
+        now, cpu = time.monotonic(), time.process_time()
+        elapsed = max(now - self.t_period_, 1e-9)
+        snap = {
+            "time": time.time(),
+            "period_s": elapsed,
+            "samples_total": self.samples_,
+            "windows_total": self.windows_,
+            "alarms_total": self.alarms_,
+            "samples_per_sec": self.period_samples_ / elapsed,
+            "windows_per_sec": self.period_windows_ / elapsed,
+            "cpu_seconds_total": cpu,
+            "cpu_utilization": (cpu - self.cpu_period_) / elapsed,
+            "stages": {
+                stage: {
+                    **{f"p{q}_s": hist.percentile(q) * 1e-9 for q in self.QUANTILES},
+                    "max_s": hist.max_ * 1e-9,
+                    "count": hist.count_,
+                    "sum_s": hist.sum_ * 1e-9,
+                }
+                for stage, hist in self.stages_.items()
+            },
+        }
+        if self.extra_ is not None: snap.update(self.extra_())
+        for hist in self.stages_.values(): hist.reset()
+        self.period_samples_ = self.period_windows_ = 0
+        self.t_period_, self.cpu_period_ = now, cpu
+        self.last_ = snap
+        return snap
+
+    def prometheus(self, snap: dict) -> str:
+        labels = ",".join(f'{k}="{v}"' for k, v in self.labels_.items())
+        def metric(name, value, extra = "", kind = None, doc = None):
+            lines = []
+            if kind: lines += [f"# HELP voltdetect_{name} {doc}", f"# TYPE voltdetect_{name} {kind}"]
+            tags = ",".join(filter(None, [labels, extra]))
+            lines.append(f"voltdetect_{name}{{{tags}}} {value}" if tags else f"voltdetect_{name} {value}")
+            return lines
+        lines = []
+        lines += metric("samples_total", snap["samples_total"], kind="counter", doc="Voltage samples processed.")
+        lines += metric("windows_total", snap["windows_total"], kind="counter", doc="Windows predicted.")
+        lines += metric("alarms_total", snap["alarms_total"], kind="counter", doc="Alarms raised.")
+        lines += metric("samples_per_second", snap["samples_per_sec"], kind="gauge", doc="Samples processed per second over the last period.")
+        lines += metric("windows_per_second", snap["windows_per_sec"], kind="gauge", doc="Windows predicted per second over the last period.")
+        lines += metric("cpu_seconds_total", snap["cpu_seconds_total"], kind="counter", doc="CPU time of the detector process.")
+        lines += [
+            "# HELP voltdetect_stage_latency_seconds Latency of a detector stage per window over the last period.",
+            "# TYPE voltdetect_stage_latency_seconds summary",
+        ]
+        for stage, values in snap["stages"].items():
+            for q in self.QUANTILES:
+                lines += metric("stage_latency_seconds", values[f"p{q}_s"], f'stage="{stage}",quantile="{q / 100}"')
+            lines += metric("stage_latency_seconds", values["max_s"], f'stage="{stage}",quantile="1"')
+            lines += metric("stage_latency_seconds_sum", values["sum_s"], f'stage="{stage}"')
+            lines += metric("stage_latency_seconds_count", values["count"], f'stage="{stage}"')
+        for key, value in snap.items():
+            if key not in self._CORE_KEYS and isinstance(value, (int, float)):
+                lines += metric(key, value, kind="gauge", doc=f"Detector {key.replace('_', ' ')}.")
+        return "\n".join(lines) + "\n"
+
+    _CORE_KEYS = ("time", "period_s", "samples_total", "windows_total", "alarms_total", "samples_per_sec", "windows_per_sec", "cpu_seconds_total", "stages")
+
+    @staticmethod
+    def _write(path: str, text: str):
+        # Collectors may read at any time, so replace the file atomically
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fp:
+            fp.write(text)
+        os.replace(tmp, path)
+
+    def export(self) -> dict:
+        snap = self.snapshot()
+        self.t_export_ = self.t_period_ + self.interval_
+        if self.path_ is not None:
+            os.makedirs(os.path.dirname(self.path_) or ".", exist_ok=True)
+            self._write(f"{self.path_}.prom", self.prometheus(snap))
+            self._write(f"{self.path_}.json", json.dumps(snap, indent=4))
+        return snap
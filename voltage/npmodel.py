@@ -0,0 +1,186 @@
+import numpy as np
+import json, os
+from numpy.lib.stride_tricks import sliding_window_view
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+def _sigmoid(x):
+    # exp overflows to inf for very negative x, which still gives 0
+    with np.errstate(over="ignore"):
+        return np.reciprocal(1 + np.exp(-x, out=x), out=x)
+
+# Keras layers computed from a bounded neighbourhood of their input position
+_LOCAL_LAYERS = ("Conv1D", "DepthwiseConv1D", "AveragePooling1D")
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": _relu,
+    "sigmoid": _sigmoid,
+}
+
+def _first(value) -> int:
+    # Keras keeps sizes as int or 1-tuples depending on the version
+    return value[0] if isinstance(value, (tuple, list)) else value
+
+def conv1d(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray, stride: int = 1) -> np.ndarray:
+    """Valid Conv1D of `x` `(B, L, C_in)` with a Keras kernel `(k, C_in, C_out)`."""
+    windows = sliding_window_view(x, kernel.shape[0], axis=1)[:, ::stride]
+    return np.tensordot(windows, kernel, axes=([3, 2], [0, 1])) + bias
+
+def depthwise_conv1d(x: np.ndarray, kernel: np.ndarray, bias: np.ndarray, stride: int = 1) -> np.ndarray:
+    """Valid DepthwiseConv1D of `x` `(B, L, C)` with a Keras kernel `(k, C, 1)`."""
+    k = kernel.shape[0]
+    n = (x.shape[1] - k) // stride + 1
+    out = x[:, :(n - 1) * stride + 1:stride] * kernel[0, :, 0]
+    for i in range(1, k):
+        out += x[:, i:i + (n - 1) * stride + 1:stride] * kernel[i, :, 0]
+    return out + bias
+
+def avg_pool1d(x: np.ndarray, size: int) -> np.ndarray:
+    """Valid AveragePooling1D of `x` `(B, L, C)` with `strides == pool_size`."""
+    n = x.shape[1] // size
+    return x[:, :n * size].reshape(x.shape[0], n, size, -1).mean(axis=2)
+
+class NumpyModel:
+    """Forward pass of the `model.get_model` nets in NumPy: local `layers_`, global average pool, Dense `head_`."""
+    _ARRAYS = ("kernel", "bias")
+
+    def __init__(self, layers: list, head: list, n_reads: int):
+        self.layers_ = layers
+        self.head_ = head
+        self.n_reads_ = n_reads
+        # Input span and step of one output position of the local layers
+        self.receptive_field_, self.stride_ = 1, 1
+        for layer in reversed(layers):
+            size = layer.get("size", len(layer.get("kernel", ())))
+            self.receptive_field_ = (self.receptive_field_ - 1) * layer["stride"] + size
+        for layer in layers:
+            self.stride_ *= layer["stride"]
+
+    @classmethod
+    def from_keras(cls, model) -> "NumpyModel":
+        layers, head, pooled = [], [], False
+        for layer in model.layers:
+            kind, config, weights = type(layer).__name__, layer.get_config(), layer.get_weights()
+            if kind in ("Conv1D", "DepthwiseConv1D"):
+                assert config["padding"] == "valid" and _first(config["dilation_rate"]) == 1, ValueError(f"Layer {layer.name}: only valid, undilated convolutions are supported.")
+                assert kind == "Conv1D" or config["depth_multiplier"] == 1, ValueError(f"Layer {layer.name}: depth multiplier should be 1.")
+                kernel = weights[0].astype(np.float32)
+                bias = weights[1].astype(np.float32) if len(weights) > 1 else np.zeros(kernel.shape[-1] if kind == "Conv1D" else kernel.shape[1], np.float32)
+                layers.append({"type": "conv" if kind == "Conv1D" else "depthwise", "kernel": kernel, "bias": bias, "stride": _first(config["strides"]), "activation": config["activation"]})
+            elif kind == "AveragePooling1D":
+                size = _first(config["pool_size"])
+                assert config["padding"] == "valid" and _first(config["strides"] or size) == size, ValueError(f"Layer {layer.name}: only valid, non-overlapping pooling is supported.")
+                layers.append({"type": "avgpool", "size": size, "stride": size})
+            elif kind == "GlobalAveragePooling1D":
+                pooled = True
+            elif kind == "Dense" and pooled:
+                head.append({"type": "dense", "kernel": weights[0].astype(np.float32), "bias": weights[1].astype(np.float32), "activation": config["activation"]})
+            else:
+                raise NotImplementedError(f"Layer {layer.name} ({kind}) is not supported.")
+            assert kind not in _LOCAL_LAYERS or not pooled, ValueError(f"Layer {layer.name} comes after the global pooling.")
+        assert pooled, ValueError("Model should end with GlobalAveragePooling1D and Dense layers.")
+        return cls(layers, head, model.input_shape[1])
+
+    @property
+    def input_shape(self):
+        # Same as the Keras model, so inference backends take either
+        return (None, self.n_reads_, 1)
+
+    def save(self, path: str):
+        """Dump the layers into a `.npz`, arrays as `<group><i>_<name>` and the rest as a json `config`."""
+        arrays, config = {}, {"n_reads": self.n_reads_}
+        for group, layers in (("layers", self.layers_), ("head", self.head_)):
+            config[group] = []
+            for i, layer in enumerate(layers):
+                config[group].append({k: v for k, v in layer.items() if k not in self._ARRAYS})
+                arrays.update({f"{group}{i}_{k}": layer[k] for k in self._ARRAYS if k in layer})
+        np.savez(path, config=np.array(json.dumps(config)), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyModel":
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(str(data["config"]))
+            groups = {}
+            for group in ("layers", "head"):
+                groups[group] = [
+                    {**layer, **{k: data[f"{group}{i}_{k}"] for k in cls._ARRAYS if f"{group}{i}_{k}" in data}}
+                    for i, layer in enumerate(config[group])
+                ]
+        return cls(groups["layers"], groups["head"], config["n_reads"])
+
+    def fold_scaler(self, center: float, scale: float) -> "NumpyModel":
+        """Same net taking raw samples: `(x - center) / scale` folded into the first convolution."""
+        first = self.layers_[0]
+        assert first["type"] == "conv", ValueError("Scaling can only be folded into a first Conv1D.")
+        kernel = (first["kernel"] / np.float32(scale)).astype(np.float32)
+        bias = (first["bias"] - np.float32(center) * kernel.sum(axis=(0, 1))).astype(np.float32)
+        return NumpyModel([{**first, "kernel": kernel, "bias": bias}, *self.layers_[1:]], self.head_, self.n_reads_)
+
+    def features(self, x: np.ndarray) -> np.ndarray:
+        """Outputs `(..., positions, channels)` of the local layers on the samples `x` `(..., L)`."""
+        x = np.asarray(x, dtype=np.float32)
+        lead = x.shape[:-1]
+        x = x.reshape(-1, x.shape[-1], 1)
+        for layer in self.layers_:
+            if layer["type"] == "avgpool":
+                x = avg_pool1d(x, layer["size"])
+                continue
+            op = conv1d if layer["type"] == "conv" else depthwise_conv1d
+            x = _ACTIVATIONS[layer["activation"]](op(x, layer["kernel"], layer["bias"], layer["stride"]))
+        return x.reshape(*lead, *x.shape[1:])
+
+    def n_features(self, n: int) -> int:
+        """Number of output positions of the local layers on `n` samples."""
+        return max((n - self.receptive_field_) // self.stride_ + 1, 0)
+
+    def head(self, pooled: np.ndarray) -> np.ndarray:
+        """Dense layers on the globally pooled features `(..., channels)`, one output per window."""
+        pooled = np.asarray(pooled, dtype=np.float32)
+        x = pooled.reshape(-1, pooled.shape[-1])
+        for layer in self.head_:
+            x = _ACTIVATIONS[layer["activation"]](x @ layer["kernel"] + layer["bias"])
+        return x[:, 0].reshape(pooled.shape[:-1])
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Outputs of the windows `X` `(..., L)`."""
+        return self.head(self.features(X).mean(axis=-2))
+
+    def __call__(self, x: np.ndarray) -> float:
+        return float(self.predict(np.reshape(x, -1)))
+
+def export_model(model_dir: str, n_checks: int = 16, seed: int = 42) -> float:
+    """Write `model.npz` and `scaler.npz` next to `model.keras` in `model_dir`, return the largest output
+    difference to Keras on `n_checks` random windows.
+    """
+    import keras
+    model = keras.models.load_model(os.path.join(model_dir, "model.keras"))
+    net = NumpyModel.from_keras(model)
+    net.save(os.path.join(model_dir, "model.npz"))
+    net = NumpyModel.load(os.path.join(model_dir, "model.npz"))
+    import pickle
+    from utils.scaler import FloatScaler
+    with open(os.path.join(model_dir, "scaler.pkl"), "rb") as fp:
+        FloatScaler.from_sklearn(pickle.load(fp)).save(os.path.join(model_dir, "scaler.npz"))
+    X = np.random.default_rng(seed).normal(size=(n_checks, net.n_reads_, 1)).astype(np.float32)
+    expected = model.predict(X, verbose=0)[:, 0]
+    return float(np.max(np.abs(net.predict(X[..., 0]) - expected)))
+
+def parse_args():
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("models", type=str, nargs="+", help="Model directories holding a `model.keras`.")
+    parser.add_argument("-n", "--n_checks", type=int, default=16, help="Random windows compared against Keras.")
+    parser.add_argument("-t", "--tol", type=float, default=1e-4, help="Largest output difference accepted.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for model_dir in args.models:
+        diff = export_model(model_dir, args.n_checks)
+        print(f"Exported {model_dir}/model.npz, max diff to Keras {diff:.2e}")
+        assert diff <= args.tol, ValueError(f"NumPy outputs of {model_dir} differ from Keras by {diff}.")
+
+if __name__ == "__main__":
+    main()
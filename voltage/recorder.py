@@ -1,31 +1,125 @@
-from rwvolt import RWVolt
+from ring import VoltRing
+from window_queue import WindowQueue, QueuePolicy
+from source import VoltSourceBase, MSRSource
 from constants import DIR_EXECUTABLE
 from subprocess import Popen, PIPE
 import numpy as np
 from io import TextIOWrapper, StringIO
 import multiprocessing as mp
 from multiprocessing.connection import Connection
-import os
-from threading import Timer
-from typing import Callable, Any
+import os, mmap, time
+from threading import Timer, Thread
+from typing import Callable, Any, Literal, List, Optional, Tuple
+
+Transport = Literal["text", "binary", "ring", "inproc", "worker"]
+
+class StopDealing(Exception):
+    """Raised by a `record_deal` dealer to end the capture quietly."""
+
+class SamplerWorker:
+    """Sampler process pinned once to `reader_core` that keeps the source open and serves
+    "capture N samples now" commands, results come back through a reusable shared buffer.
+    """
+    def __init__(self, reader_core: int, source: VoltSourceBase, cores: List[int], max_reads: int, flog = None):
+        self.reader_core_ = reader_core
+        self.source_ = source
+        self.cores_ = list(cores)
+        self.max_reads_ = max_reads
+        self.flog_ = flog
+        # Anonymous mmap is MAP_SHARED, the forked worker fills the same pages
+        self.mm_ = mmap.mmap(-1, max_reads * len(self.cores_) * np.dtype(np.int16).itemsize)
+        self.buffer_ = np.frombuffer(self.mm_, dtype=np.int16)
+        self.conn_, child_conn = mp.Pipe()
+        self.proc_ = mp.Process(target=self._serve, args=(child_conn,), daemon=True)
+        self.proc_.start()
+        ready = self.conn_.recv()
+        if isinstance(ready, Exception): raise ready
+    
+    def _serve(self, conn: Connection):
+        try:
+            os.sched_setaffinity(0, {self.reader_core_})
+            sampler = self.source_.open_sampler(self.cores_)
+        except Exception as e:
+            conn.send(e)
+            return
+        conn.send(True)
+        while True:
+            cmd = conn.recv()
+            if cmd is None: break
+            n_reads, interval = cmd
+            try:
+                sampler.read_into(self.buffer_[:n_reads * len(self.cores_)], interval, self.flog_)
+                conn.send(n_reads)
+            except Exception as e:
+                conn.send(e)
+        sampler.close()
+    
+    def capture(self, n_reads: int, interval: int = 0) -> np.ndarray:
+        """Capture `n_reads` samples (per core), the returned view is overwritten by the next capture."""
+        assert n_reads <= self.max_reads_, ValueError(f"Worker buffer holds at most {self.max_reads_} reads.")
+        self.conn_.send((n_reads, interval))
+        result = self.conn_.recv()
+        if isinstance(result, Exception): raise result
+        data = self.buffer_[:n_reads * len(self.cores_)]
+        return data if len(self.cores_) == 1 else data.reshape(len(self.cores_), n_reads)
+    
+    def alive(self) -> bool:
+        return self.proc_.is_alive()
+    
+    def stop(self):
+        if self.proc_.is_alive():
+            self.conn_.send(None)
+            self.proc_.join(timeout=1)
+        if self.proc_.is_alive(): self.proc_.kill()
 
 class VoltRecorder:
-    def __init__(self, proc_core, reader_core):
+    # Seconds between two ring overrun lines in the log, `deal_stats` counts every overrun
+    _OVERRUN_LOG_INTERVAL = 10.
+    
+    def __init__(self, proc_core, reader_core, source: VoltSourceBase = None, cores: Optional[List[int]] = None):
+        """
+        Args:
+            proc_core (int): Core of the consuming process.
+            reader_core (int): Core of the sampler process.
+            source (VoltSourceBase): Voltage source, live MSR by default.
+            cores (List[int]): Monitored cores, sampled round-robin by one sampler. Captures
+                of a single core are 1-D, otherwise `(cores, samples)` with aligned columns.
+        """
         self.proc_core_ = proc_core
         self.reader_core_ = reader_core
-        
-    def _read_timeout(self):
-        raise TimeoutError("Read Pipe timeout!")
+        self.source_ = source or MSRSource()
+        self.cores_ = list(cores) if cores else [0]
+        self.ring_ = None
+        self.worker_ = None
+        self.queue_ = None
+        self.overruns_logged_ = (0, 0.)
+    
+    def start_worker(self, max_reads: int, flog = None) -> SamplerWorker:
+        """Start (or keep) the long-lived sampler used by the `worker` transport."""
+        if self.worker_ is not None and self.worker_.alive() and self.worker_.max_reads_ >= max_reads:
+            return self.worker_
+        self.stop_worker()
+        self.worker_ = SamplerWorker(self.reader_core_, self.source_, self.cores_, max_reads, flog)
+        return self.worker_
     
+    def stop_worker(self):
+        if self.worker_ is not None:
+            self.worker_.stop()
+            self.worker_ = None
+        
     def _check_flog(self, flog):
         sign = flog is None
         if sign: flog = open("/dev/null", "w")
         return flog, sign
     
-    def _build_pipe(self):
+    def _build_pipe(self, transport: Transport = "text"):
         rp, wp = os.pipe()
-        reader = os.fdopen(rp, "r")
-        writer = os.fdopen(wp, "w")
+        if transport == "binary":
+            reader = os.fdopen(rp, "rb", buffering=0)
+            writer = os.fdopen(wp, "wb", buffering=0)
+        else:
+            reader = os.fdopen(rp, "r")
+            writer = os.fdopen(wp, "w")
         return reader, writer
     
     def _read_pipe(self, fp: TextIOWrapper, n_reads: int, dtype=np.int16, timeout = 10):
@@ -34,54 +128,213 @@ class VoltRecorder:
         # Unstable
         while cnt < n_reads:
             line = fp.readline()
+            if not line: raise EOFError("Read Pipe closed!")
             data[cnt] = int(line)
             cnt += 1
         return data
     
-    def record_once(self, n_reads, interval, flog = None):
+    def _read_pipe_binary(self, fp, n_reads: int, dtype=np.int16, out: np.ndarray = None):
+        # Samples arrive as little-endian uint16, the voltage field fits in int16 as well
+        data = np.empty(n_reads, dtype=dtype) if out is None else out
+        view = memoryview(data).cast("B")
+        cnt = 0
+        while cnt < view.nbytes:
+            n = fp.readinto(view[cnt:])
+            if not n: raise EOFError("Read Pipe closed!")
+            cnt += n
+        return data
+    
+    def _sampler(self, read_num, interval, out, flog, transport: Transport):
+        """Source entry point and arguments for the transport and the monitored cores."""
+        assert len(self.cores_) == 1 or transport != "text", ValueError("Multi-core capture needs the `binary` or `ring` transport.")
+        if len(self.cores_) > 1:
+            read = self.source_.read_cores_voltage_ring if transport == "ring" else self.source_.read_cores_voltage
+            return read, (self.cores_, read_num, interval, out, flog)
+        if transport == "ring":
+            return self.source_.read_core_voltage_ring, (self.cores_[0], read_num, interval, out, flog)
+        return self.source_.read_core_voltage, (self.cores_[0], read_num, interval, out, flog, transport == "binary")
+    
+    def _frames(self, data: np.ndarray) -> np.ndarray:
+        """View interleaved frames as `(cores, samples)`, single-core data stays 1-D."""
+        if len(self.cores_) == 1: return data.reshape(-1)
+        return data.reshape(-1, len(self.cores_)).T
+    
+    def _record_inproc(self, n_reads, interval, flog, out: np.ndarray):
+        """Capture into `out` from a thread pinned to the reader core, no sampler process or pipe."""
+        errors = []
+        def run():
+            try:
+                os.sched_setaffinity(0, {self.reader_core_})
+                if self.source_.read_cores_voltage_into(self.cores_, out, interval, flog) < 0:
+                    raise OSError(f"Failed to read cores {self.cores_}")
+            except Exception as e:
+                errors.append(e)
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        thread.join()
+        if errors: raise errors[0]
+        return out
+    
+    def record_once(self, n_reads, interval, flog = None, transport: Transport = "text", out: np.ndarray = None):
+        """Capture `n_reads` samples (per core), into `out` if given, in place with the `inproc` transport."""
+        assert transport != "ring", ValueError("Ring transport is only available in `record_deal`.")
         os.sched_setaffinity(0, {self.proc_core_})
-        reader, writer = self._build_pipe()
+        if transport == "inproc":
+            shape = (n_reads,) if len(self.cores_) == 1 else (len(self.cores_), n_reads)
+            inplace = out is not None and out.flags.c_contiguous
+            data = self._record_inproc(n_reads, interval, flog, out.reshape(shape) if inplace else np.empty(shape, dtype=np.int16))
+            if inplace: return out
+        elif transport == "worker":
+            data = self.start_worker(n_reads, flog).capture(n_reads, interval)
+            if out is None: return data.copy()
+        else:
+            data = self._record_pipe(n_reads, interval, flog, transport)
+        
+        if out is not None:
+            out[...] = data.reshape(out.shape)
+            return out
+        return data
+    
+    def _record_pipe(self, n_reads, interval, flog, transport: Transport):
+        reader, writer = self._build_pipe(transport)
         # Check flog
         flog, sign = self._check_flog(flog)
         
-        proc = mp.Process(
-            target=RWVolt.read_core_voltage,
-            args=(0, n_reads, interval, writer, flog)
-        )
+        target, args = self._sampler(n_reads, interval, writer, flog, transport)
+        proc = mp.Process(target=target, args=args)
         proc.start()
-        os.sched_setaffinity(proc.pid, {self.reader_core_})
-        
-        data = self._read_pipe(reader, n_reads)
-        proc.join()
-        reader.close()
+        # Only the sampler writes, reads see EOF as soon as it exits, e.g. when an MSR cannot be opened
         writer.close()
-        
-        if sign: flog.close()
+        try:
+            os.sched_setaffinity(proc.pid, {self.reader_core_})
+            if transport == "binary":
+                data = self._read_pipe_binary(reader, n_reads * len(self.cores_))
+                data = np.ascontiguousarray(self._frames(data))
+            else:
+                data = self._read_pipe(reader, n_reads)
+        except EOFError:
+            proc.join()
+            raise EOFError(f"Sampler of cores {self.cores_} exited with code {proc.exitcode} before {n_reads} samples, see the log.")
+        finally:
+            reader.close()
+            if sign: flog.close()
+        proc.join()
 
         return data
 
-    def record_deal(self, n_reads = 10_000, interval = 0, dealer:Callable[[np.ndarray],Any] = lambda:None, flog: StringIO = None):
+    def _log_overruns(self, flog):
+        """Log new ring overruns, the first at once, then at most every `_OVERRUN_LOG_INTERVAL` seconds."""
+        overruns, (logged, t_logged) = self.overruns, self.overruns_logged_
+        if overruns == logged: return
+        now = time.monotonic()
+        if logged and now - t_logged < self._OVERRUN_LOG_INTERVAL: return
+        flog.write(f"Ring overrun: {overruns} samples dropped in total\n")
+        self.overruns_logged_ = (overruns, now)
+    
+    def _deal_ring(self, dealer: Callable[[np.ndarray],Any], alive: Callable[[], bool], flog):
+        while True:
+            dealer(self._frames(self.ring_.acquire(alive)))
+            self.ring_.release()
+            self._log_overruns(flog)
+    
+    def _fill_queue(self, transport: Transport, reader, alive: Callable[[], bool], flog):
+        """Reader thread of the queued `record_deal`: read windows into the queue slots until it closes."""
+        queue = self.queue_
+        try:
+            while True:
+                slot = queue.reserve()
+                if slot is None: return
+                out = queue.slots_[slot]
+                if transport == "ring":
+                    out[:] = self.ring_.acquire(alive)
+                    self.ring_.release()
+                    self._log_overruns(flog)
+                elif transport == "binary":
+                    self._read_pipe_binary(reader, out.size, out=out)
+                else:
+                    out[:] = self._read_pipe(reader, out.size)
+                queue.put(slot)
+        except Exception as e:
+            queue.close(e)
+    
+    def _deal_queue(self, dealer: Callable[[np.ndarray],Any]):
+        frames = [self._frames(slot) for slot in self.queue_.slots_]
+        while True:
+            slot = self.queue_.get()
+            dealer(frames[slot])
+            self.queue_.release(slot)
+    
+    def queue_stats(self) -> dict:
+        """Queue depth, consumer lag (seconds from read to dealer) and skipped windows of the queued `record_deal`."""
+        return self.queue_.stats() if self.queue_ is not None else {}
+    
+    def deal_stats(self) -> dict:
+        """Flat counters of the running `record_deal` for metrics export: ring overruns and queue stats."""
+        return {"ring_overruns": self.overruns, **{f"queue_{k}": v for k, v in self.queue_stats().items()}}
+    
+    @property
+    def overruns(self) -> int:
+        """Samples per core dropped by the ring transport of the last `record_deal`."""
+        return self.ring_.overruns // len(self.cores_) if self.ring_ is not None else 0
+    
+    def record_deal(self, n_reads = 10_000, interval = 0, dealer:Callable[[np.ndarray],Any] = lambda:None, flog: StringIO = None, transport: Transport = "text", ring_blocks: int = 16, queue_size: int = 0, policy: QueuePolicy = "block"):
+        """Feed `dealer` with windows of `n_reads` samples (per core) until it raises.
+        In binary transport the same buffer is refilled for every window, in ring transport
+        windows are views into shared memory (`ring_blocks` windows deep), copy them to keep them.
+        With `queue_size > 0` a reader thread keeps draining the transport into a bounded
+        `WindowQueue` while `dealer` runs, `policy` decides what to drop when it falls behind,
+        see `queue_stats`.
+        """
         os.sched_setaffinity(0, {self.proc_core_})
-        reader, writer = self._build_pipe()
         # Check flog
         flog, sign = self._check_flog(flog)
         
-        proc = mp.Process(
-            target=RWVolt.read_core_voltage,
+        if transport == "ring":
+            self.ring_ = VoltRing(n_reads * len(self.cores_), ring_blocks)
+            # Infinite read
+            target, args = self._sampler(-1, interval, self.ring_, flog, transport)
+        else:
+            reader, writer = self._build_pipe(transport)
             # Infinite read
-            args=(0, -1, interval, writer, flog)
-        )
+            target, args = self._sampler(-1, interval, writer, flog, transport)
+        proc = mp.Process(target=target, args=args)
         proc.start()
+        # Only the sampler writes, reads see EOF as soon as it exits
+        if transport != "ring": writer.close()
         os.sched_setaffinity(proc.pid, {self.reader_core_})
+        self.overruns_logged_ = (0, 0.)
+        thread = None
         
         try:
+            if queue_size > 0:
+                self.queue_ = WindowQueue(n_reads * len(self.cores_), queue_size, policy)
+                thread = Thread(target=self._fill_queue, args=(transport, None if transport == "ring" else reader, proc.is_alive, flog), daemon=True)
+                thread.start()
+                self._deal_queue(dealer)
+            if transport == "ring":
+                self._deal_ring(dealer, proc.is_alive, flog)
+            if transport == "binary":
+                data = np.empty(n_reads * len(self.cores_), dtype=np.int16)
+                frames = self._frames(data)
+                while True:
+                    self._read_pipe_binary(reader, data.size, out=data)
+                    dealer(frames)
             while True:
                 data = self._read_pipe(reader, n_reads)
                 dealer(data)
+        except StopDealing:
+            ...
         except Exception as e:
             import traceback; traceback.print_exc(file=flog);
         finally:
+            if self.queue_ is not None: self.queue_.close()
             proc.kill()
+            proc.join()
+            # The reader thread stops on the closed queue or the dead sampler before its pipe is closed
+            if thread is not None: thread.join()
+            if transport != "ring": reader.close()
+            if self.overruns != self.overruns_logged_[0]: flog.write(f"Ring overrun at exit: {self.overruns} samples dropped in total\n")
+            if sign: flog.close()
         
     # def stop(self):
     #     return
@@ -0,0 +1,66 @@
+import numpy as np
+import mmap, time, ctypes
+from typing import Callable
+
+class VoltRing:
+    """Single-producer/single-consumer ring of int16 samples in anonymous shared memory.
+    The layout mirrors `volt_ring_t` in `rwvolt/inc/ring.h`. The sampler publishes whole
+    blocks by advancing `head`, the consumer hands out zero-copy views and advances `tail`.
+    """
+    _HEADER = 192
+    _HEAD = 0
+    _TAIL = 8
+    _OVERRUNS = 16
+    _CAPACITY = 17
+    _BLOCK = 18
+    
+    def __init__(self, block: int, n_blocks: int = 16, poll: float = 1e-4):
+        """
+        Args:
+            block (int): Samples per published block, i.e. the window handed to the consumer.
+            n_blocks (int): Number of blocks the ring holds before the sampler starts dropping.
+            poll (float): Sleep in seconds between checks while the ring is empty.
+        """
+        assert block > 0 and n_blocks > 0, ValueError("Ring block and size should be positive.")
+        self.block_ = block
+        self.capacity_ = block * n_blocks
+        self.poll_ = poll
+        # Anonymous mmap is MAP_SHARED, so forked sampler processes write into the same pages
+        self.mm_ = mmap.mmap(-1, self._HEADER + self.capacity_ * np.dtype(np.int16).itemsize)
+        self.header_ = np.frombuffer(self.mm_, dtype=np.uint64, count=self._HEADER // 8)
+        self.data_ = np.frombuffer(self.mm_, dtype=np.int16, offset=self._HEADER)
+        self.header_[self._CAPACITY] = self.capacity_
+        self.header_[self._BLOCK] = block
+        self.address_ = ctypes.addressof(ctypes.c_char.from_buffer(self.mm_))
+    
+    @property
+    def head(self) -> int:
+        return int(self.header_[self._HEAD])
+    
+    @property
+    def tail(self) -> int:
+        return int(self.header_[self._TAIL])
+    
+    @property
+    def overruns(self) -> int:
+        """Samples dropped by the sampler because the consumer fell behind."""
+        return int(self.header_[self._OVERRUNS])
+    
+    def pending(self) -> int:
+        """Number of completed blocks not yet released."""
+        return (self.head - self.tail) // self.block_
+    
+    def acquire(self, alive: Callable[[], bool] = lambda: True) -> np.ndarray:
+        """Wait for the oldest completed block and return a zero-copy view of it.
+        The view stays valid until `release`, copy it to keep the data afterwards.
+        """
+        tail = self.tail
+        while self.head == tail:
+            if not alive(): raise EOFError("Ring producer exited!")
+            time.sleep(self.poll_)
+        start = tail % self.capacity_
+        return self.data_[start:start + self.block_]
+    
+    def release(self):
+        """Hand the block returned by `acquire` back to the sampler."""
+        self.header_[self._TAIL] = self.tail + self.block_
@@ -1,15 +1,30 @@
-from ctypes import CDLL, c_int, POINTER
-from typing import TextIO
+from ctypes import CDLL, c_int, c_uint64, c_void_p, c_char_p, POINTER, byref
+from typing import TextIO, List, Optional, Tuple
 from sys import stdout, stderr
 from constants import *
 
+# Voltage write methods, see `VOLT_METHOD_*` in rwvolt/inc/rwmsr.h
+VOLT_METHODS = {"offset": 0, "set": 1}
+
+def _c_ints(values: List[int]):
+    return (c_int * len(values))(*values)
+
+def _checked(result: int, cores: List[int]) -> int:
+    """Raise `OSError` when a native read returns a negative count: an MSR could not be opened or read."""
+    if result < 0: raise OSError(f"Failed to read MSR of cores {cores}, see the log.")
+    return result
+
 class RWVolt:
     _LIB = None
+    _MSR_PATH = MSR_PATH
     
     @classmethod
     def build(cls, path = PATH_LIB):
         cls._LIB = CDLL(path)
         
+        cls._LIB.set_msr_path.argtypes = [c_char_p]
+        cls._LIB.set_msr_path.restype = None
+        
         # cls._LIB.bind_core.argtypes = [c_int]
         # cls._LIB.bind_core.restype = None
         
@@ -19,11 +34,65 @@ class RWVolt:
         cls._LIB.read_core_voltage.argtypes = [c_int, c_int, c_int, c_int, c_int]
         cls._LIB.read_core_voltage.restype = c_int
         
+        cls._LIB.read_core_voltage_bin.argtypes = [c_int, c_int, c_int, c_int, c_int]
+        cls._LIB.read_core_voltage_bin.restype = c_int
+        
+        cls._LIB.read_core_voltage_ring.argtypes = [c_int, c_int, c_int, c_void_p, c_int]
+        cls._LIB.read_core_voltage_ring.restype = c_int
+        
+        cls._LIB.read_cores_voltage_bin.argtypes = [POINTER(c_int), c_int, c_int, c_int, c_int, c_int]
+        cls._LIB.read_cores_voltage_bin.restype = c_int
+        
+        cls._LIB.read_cores_voltage_ring.argtypes = [POINTER(c_int), c_int, c_int, c_int, c_void_p, c_int]
+        cls._LIB.read_cores_voltage_ring.restype = c_int
+        
+        cls._LIB.read_cores_voltage_into.argtypes = [POINTER(c_int), c_int, c_void_p, c_int, c_int, c_int]
+        cls._LIB.read_cores_voltage_into.restype = c_int
+        
+        cls._LIB.read_core_voltage_into.argtypes = [c_int, c_void_p, c_int, c_int, c_int]
+        cls._LIB.read_core_voltage_into.restype = c_int
+        
         cls._LIB.offset_core_voltage.argtypes = [c_int, c_int, c_int]
         cls._LIB.offset_core_voltage.restype = c_int
         
         cls._LIB.set_core_voltage.argtypes = [c_int, c_int, c_int]
         cls._LIB.set_core_voltage.restype = c_int
+        
+        cls._LIB.open_core_handles.argtypes = [POINTER(c_int), c_int, POINTER(c_int)]
+        cls._LIB.open_core_handles.restype = c_int
+        
+        cls._LIB.close_core_handles.argtypes = [POINTER(c_int), c_int]
+        cls._LIB.close_core_handles.restype = None
+        
+        cls._LIB.open_core_readers.argtypes = [POINTER(c_int), c_int, POINTER(c_int)]
+        cls._LIB.open_core_readers.restype = c_int
+        
+        cls._LIB.read_handles_voltage_into.argtypes = [POINTER(c_int), c_int, c_void_p, c_int, c_int, c_int]
+        cls._LIB.read_handles_voltage_into.restype = c_int
+        
+        cls._LIB.write_core_voltage.argtypes = [POINTER(c_int), c_int, c_int, c_int, POINTER(c_int)]
+        cls._LIB.write_core_voltage.restype = c_int
+        
+        cls._LIB.apply_voltage_schedule.argtypes = [POINTER(c_int), c_int, c_int, POINTER(c_int), POINTER(c_int), c_int, c_int]
+        cls._LIB.apply_voltage_schedule.restype = c_int
+        
+        cls._LIB.play_voltage_waveform.argtypes = [POINTER(c_int), c_int, c_int, POINTER(c_int), POINTER(c_int), c_int, POINTER(c_uint64), POINTER(c_uint64), c_int]
+        cls._LIB.play_voltage_waveform.restype = c_int
+        
+        cls._LIB.set_msr_path(cls._MSR_PATH.encode())
+    
+    @classmethod
+    def _lib(cls) -> CDLL:
+        # Loaded on first use, so importing this module needs neither the library nor MSR access
+        if cls._LIB is None: cls.build()
+        return cls._LIB
+    
+    @classmethod
+    def set_msr_path(cls, fmt: str = MSR_PATH) -> None:
+        """Redirect MSR access to `fmt % core_id`, e.g. an emulated MSR file."""
+        assert fmt.count("%d") == 1 and fmt.count("%") == 1, ValueError(f"MSR path `{fmt}` should contain exactly one `%d`.")
+        cls._MSR_PATH = fmt
+        if cls._LIB is not None: cls._LIB.set_msr_path(fmt.encode())
 
     @classmethod
     def read_core_voltage(
@@ -32,35 +101,222 @@ class RWVolt:
         read_num: int,
         interval: int = 0,
         fpout: TextIO = stdout,
+        fplog: TextIO = stderr,
+        binary: bool = False
+    ) -> int:
+        """Stream `read_num` voltage samples of `core_id` into `fpout` (`-1` for infinite).
+        Samples are paced `interval` ns apart against absolute deadlines (`0` for free running),
+        achieved rate, jitter percentiles and missed deadlines are logged to `fplog`.
+        Text mode writes one decimal sample per line, binary mode writes little-endian uint16 blocks.
+        """
+        read = cls._lib().read_core_voltage_bin if binary else cls._lib().read_core_voltage
+        return _checked(read(
+            core_id,
+            read_num,
+            interval,
+            fpout.fileno(),
+            fplog.fileno()
+        ), [core_id])
+    
+    @classmethod
+    def read_core_voltage_ring(
+        cls,
+        core_id: int,
+        read_num: int,
+        interval: int,
+        ring: "VoltRing",
         fplog: TextIO = stderr
     ) -> int:
-        return cls._LIB.read_core_voltage(
+        """Publish `read_num` voltage samples of `core_id`, paced `interval` ns apart, into a shared `VoltRing` (`-1` for infinite)."""
+        return _checked(cls._lib().read_core_voltage_ring(
             core_id,
             read_num,
             interval,
+            ring.address_,
+            fplog.fileno()
+        ), [core_id])
+    
+    @classmethod
+    def read_cores_voltage(
+        cls,
+        cores: List[int],
+        read_num: int,
+        interval: int = 0,
+        fpout: TextIO = stdout,
+        fplog: TextIO = stderr
+    ) -> int:
+        """Stream `read_num` frames into `fpout` (`-1` for infinite), a frame holds one
+        little-endian uint16 sample per core in `cores` order, read back to back in one paced pass.
+        """
+        return _checked(cls._lib().read_cores_voltage_bin(
+            _c_ints(cores),
+            len(cores),
+            read_num,
+            interval,
             fpout.fileno(),
             fplog.fileno()
-        )
+        ), cores)
+    
+    @classmethod
+    def read_cores_voltage_ring(
+        cls,
+        cores: List[int],
+        read_num: int,
+        interval: int,
+        ring: "VoltRing",
+        fplog: TextIO = stderr
+    ) -> int:
+        """Publish `read_num` frames of `cores` into a shared `VoltRing` (`-1` for infinite)."""
+        return _checked(cls._lib().read_cores_voltage_ring(
+            _c_ints(cores),
+            len(cores),
+            read_num,
+            interval,
+            ring.address_,
+            fplog.fileno()
+        ), cores)
+    
+    @classmethod
+    def read_cores_voltage_into(
+        cls,
+        cores: List[int],
+        out: "np.ndarray",
+        interval: int = 0,
+        fplog: Optional[TextIO] = None
+    ) -> int:
+        """Fill the C-contiguous int16 `out` planar `(cores, n)` with paced samples of `cores`, GIL released."""
+        assert out.dtype.itemsize == 2 and out.flags.c_contiguous and out.flags.writeable, ValueError("Output should be a writeable C-contiguous int16 array.")
+        assert out.size % len(cores) == 0, ValueError(f"Output size {out.size} is not a multiple of {len(cores)} cores.")
+        return _checked(cls._lib().read_cores_voltage_into(
+            _c_ints(cores),
+            len(cores),
+            out.ctypes.data,
+            out.size // len(cores),
+            interval,
+            fplog.fileno() if fplog is not None else -1
+        ), cores)
+    
+    @classmethod
+    def read_core_voltage_into(
+        cls,
+        core_id: int,
+        out: "np.ndarray",
+        interval: int = 0,
+        fplog: Optional[TextIO] = None
+    ) -> int:
+        """Single-core `read_cores_voltage_into`: fill the C-contiguous int16 `out` with samples of `core_id`."""
+        assert out.dtype.itemsize == 2 and out.flags.c_contiguous and out.flags.writeable, ValueError("Output should be a writeable C-contiguous int16 array.")
+        return _checked(cls._lib().read_core_voltage_into(
+            core_id,
+            out.ctypes.data,
+            out.size,
+            interval,
+            fplog.fileno() if fplog is not None else -1
+        ), [core_id])
     
     # @classmethod
     # def bind_core(cls, core_id) -> None:
-    #     cls._LIB.bind_core(core_id)
+    #     cls._lib().bind_core(core_id)
     
     @classmethod
     def unbind(cls) -> None:
-        cls._LIB.unbind()
+        cls._lib().unbind()
 
     @classmethod
     def offset_core_voltage(cls, core_id: int, offset: int, fplog: TextIO = stderr) -> int:
-        return cls._LIB.offset_core_voltage(core_id, offset, fplog.fileno())
+        return cls._lib().offset_core_voltage(core_id, offset, fplog.fileno())
     
     
     @classmethod
     def set_core_voltage(cls, core_id: int, target: int, fplog: TextIO = stderr) -> int:
-        return cls._LIB.set_core_voltage(core_id, target, fplog.fileno())
+        return cls._lib().set_core_voltage(core_id, target, fplog.fileno())
+    
+    @classmethod
+    def open_handles(cls, cores: List[int], method: str = "offset", readonly: bool = False) -> "MSRHandles":
+        """Open the MSR files of `cores` once for repeated voltage writes, or reads only if `readonly`."""
+        return MSRHandles(cores, method, readonly)
+    
+    @classmethod
+    def apply_voltage_schedule(
+        cls,
+        cores: List[int],
+        periods: List[int],
+        values: List[int],
+        method: str = "offset",
+        fplog: TextIO = stderr
+    ) -> int:
+        """Write `values[i]` mV to all `cores` `periods[i]` ms after the previous step in one native call,
+        scheduled against absolute deadlines like `MSRHandles.play`.
+        Returns the number of steps applied, `-1` if the cores could not be opened.
+        """
+        assert len(periods) == len(values), ValueError("Periods and values should have the same length.")
+        return cls._lib().apply_voltage_schedule(
+            _c_ints(cores),
+            len(cores),
+            VOLT_METHODS[method],
+            _c_ints(periods),
+            _c_ints(values),
+            len(values),
+            fplog.fileno()
+        )
 
-# Default
-RWVolt.build()
+class MSRHandles:
+    """MSR files of several cores opened once, every `write` applies one voltage step to all of them without logging
+    and every `read_into` captures all of them like `RWVolt.read_cores_voltage_into`.
+    """
+    def __init__(self, cores: List[int], method: str = "offset", readonly: bool = False):
+        self.cores_ = list(cores)
+        self.method_ = VOLT_METHODS[method]
+        self.fds_ = (c_int * len(self.cores_))()
+        opener = RWVolt._lib().open_core_readers if readonly else RWVolt._lib().open_core_handles
+        if opener(_c_ints(self.cores_), len(self.cores_), self.fds_) < 0:
+            raise OSError(f"Failed to open MSR of cores {self.cores_}")
+    
+    def _fds(self):
+        if self.fds_ is None: raise ValueError("MSR handles closed.")
+        return self.fds_
+    
+    def read_into(self, out: "np.ndarray", interval: int = 0, fplog: Optional[TextIO] = None) -> int:
+        assert out.dtype.itemsize == 2 and out.flags.c_contiguous and out.flags.writeable, ValueError("Output should be a writeable C-contiguous int16 array.")
+        assert out.size % len(self.cores_) == 0, ValueError(f"Output size {out.size} is not a multiple of {len(self.cores_)} cores.")
+        return _checked(RWVolt._lib().read_handles_voltage_into(
+            self._fds(),
+            len(self.cores_),
+            out.ctypes.data,
+            out.size // len(self.cores_),
+            interval,
+            fplog.fileno() if fplog is not None else -1
+        ), self.cores_)
+    
+    def write(self, value: int) -> int:
+        """Apply `value` mV, returns the mailbox value written."""
+        mbox = c_int()
+        if RWVolt._lib().write_core_voltage(self._fds(), len(self.cores_), self.method_, value, byref(mbox)) < 0:
+            raise OSError(f"Failed to write MSR of cores {self.cores_}")
+        return mbox.value
+    
+    def play(self, periods: List[int], values: List[int], ready_fd: int = -1) -> Tuple[List[int], List[int]]:
+        """Write `values[i]` mV `periods[i]` ms after the previous step in one native call, against absolute
+        CLOCK_MONOTONIC deadlines (sleep, then spin the last 50 us), so write latency does not drift the waveform.
+        The first deadline is written to `ready_fd` (8 bytes) before sleeping to it, unless -1.
+        Returns the deadline and the actual write time of every step in CLOCK_MONOTONIC ns, like `time.monotonic_ns`.
+        """
+        assert len(periods) == len(values), ValueError("Periods and values should have the same length.")
+        deadlines, stamps = (c_uint64 * len(values))(), (c_uint64 * len(values))()
+        n = RWVolt._lib().play_voltage_waveform(self._fds(), len(self.cores_), self.method_, _c_ints(periods), _c_ints(values), len(values), deadlines, stamps, ready_fd)
+        if n < len(values): raise OSError(f"Failed to write MSR of cores {self.cores_} at step {n}")
+        return list(deadlines), list(stamps)
+    
+    def close(self):
+        if self.fds_ is not None:
+            RWVolt._lib().close_core_handles(self.fds_, len(self.cores_))
+            self.fds_ = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
 
 if __name__ == "__main__":
     import sys
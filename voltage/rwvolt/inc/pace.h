@@ -0,0 +1,37 @@
+#include <stdio.h>
+#include <stdint.h>
+#include <time.h>
+
+// Sleep with clock_nanosleep until this close to a deadline, then spin
+#define PACE_SPIN_NS 50000
+// Report pacing statistics every this many samples on infinite reads
+#define PACE_REPORT_EVERY (1 << 22)
+
+// Log-linear lateness histogram: 8 sub-buckets per power of two (~12.5% resolution)
+#define PACE_SUB_BITS 3
+#define PACE_HIST_BUCKETS (64 << PACE_SUB_BITS)
+
+typedef struct {
+    uint64_t start;     // CLOCK_MONOTONIC ns of the first deadline
+    uint64_t interval;  // ns between samples, 0 for free running
+    uint64_t n;         // Samples paced so far
+    uint64_t missed;    // Deadlines already passed when the sampler got to them
+    uint64_t max_late;  // Worst lateness in ns
+    uint64_t hist[PACE_HIST_BUCKETS];
+} pace_t;
+
+uint64_t monotonic_ns(void);
+
+// Sleep until an absolute CLOCK_MONOTONIC deadline, sleeping first and spinning the last PACE_SPIN_NS
+void sleep_until_ns(uint64_t deadline);
+
+void pace_init(pace_t* pace, int interval);
+
+// Wait for the deadline of the next sample and record its lateness
+void pace_wait(pace_t* pace);
+
+// Value below which `q` of the recorded lateness falls (bucket upper bound)
+uint64_t pace_percentile(const pace_t* pace, double q);
+
+// Log achieved rate, jitter percentiles and missed deadlines
+void pace_report(const pace_t* pace, FILE* flog);
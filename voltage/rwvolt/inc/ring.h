@@ -0,0 +1,20 @@
+#include <stdint.h>
+#include <stddef.h>
+
+// Shared-memory single-producer/single-consumer ring of voltage samples.
+// The layout is mirrored by `VoltRing` in ring.py, keep both in sync.
+#define VOLT_RING_HEADER 192
+
+typedef struct {
+    uint64_t head;      // Samples published by the producer
+    uint8_t _pad0[56];
+    uint64_t tail;      // Samples released by the consumer
+    uint8_t _pad1[56];
+    uint64_t overruns;  // Samples dropped because the ring was full
+    uint64_t capacity;  // Number of samples in `data`, a multiple of `block`
+    uint64_t block;     // Samples published at once
+    uint8_t _pad2[40];
+    int16_t data[];
+} volt_ring_t;
+
+_Static_assert(offsetof(volt_ring_t, data) == VOLT_RING_HEADER, "volt_ring_t header size mismatch");
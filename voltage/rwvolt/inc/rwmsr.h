@@ -36,6 +36,29 @@
 uint64_t extract_bits(uint64_t value, int high, int low);
 
 
+// Most cores a single sampler reads at once
+#define RWVOLT_MAX_CORES 256
+
+// Default MSR device path, `%d` is replaced by the core id
+#define MSR_PATH_DEFAULT "/dev/cpu/%d/msr"
+
+// Redirect MSR access, e.g. to an emulated MSR file (NULL restores the default)
+void set_msr_path(const char* fmt);
+
+// Build the MSR path of a core
+int msr_path(int core_id, char* buf, size_t size);
+
+// Voltage write methods of the mailbox
+#define VOLT_METHOD_OFFSET 0
+#define VOLT_METHOD_SET 1
+
+// Open the MSR file of a core once for repeated access, -1 on failure
+int open_msr(int core_id, int flags);
+
+// Read/write an MSR register through an opened handle, writes return -1 on failure
+uint64_t read_msr_fd(int fd, uint32_t msr_address);
+int write_msr_fd(int fd, uint32_t msr_address, uint64_t val);
+
 // Function to read an MSR register
 uint64_t read_msr(int core_id, uint32_t msr_address);
 
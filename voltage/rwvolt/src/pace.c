@@ -0,0 +1,96 @@
+#include "pace.h"
+
+uint64_t monotonic_ns(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ULL + ts.tv_nsec;
+}
+
+void sleep_until_ns(uint64_t deadline)
+{
+    uint64_t now = monotonic_ns();
+    if (now + PACE_SPIN_NS < deadline)
+    {
+        uint64_t wake = deadline - PACE_SPIN_NS;
+        struct timespec ts = { .tv_sec = wake / 1000000000ULL, .tv_nsec = wake % 1000000000ULL };
+        while (clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &ts, NULL) != 0);
+    }
+    while (monotonic_ns() < deadline);
+}
+
+static int bucket_of(uint64_t value)
+{
+    if (value < (1 << PACE_SUB_BITS)) return value;
+    int exp = 63 - __builtin_clzll(value);
+    int sub = (value >> (exp - PACE_SUB_BITS)) & ((1 << PACE_SUB_BITS) - 1);
+    return ((exp - PACE_SUB_BITS + 1) << PACE_SUB_BITS) + sub;
+}
+
+static uint64_t bucket_upper(int bucket)
+{
+    if (bucket < (1 << PACE_SUB_BITS)) return bucket;
+    int exp = (bucket >> PACE_SUB_BITS) + PACE_SUB_BITS - 1;
+    uint64_t sub = bucket & ((1 << PACE_SUB_BITS) - 1);
+    return (((1ULL << PACE_SUB_BITS) + sub + 1) << (exp - PACE_SUB_BITS)) - 1;
+}
+
+void pace_init(pace_t* pace, int interval)
+{
+    for (int i = 0; i < PACE_HIST_BUCKETS; i++) pace->hist[i] = 0;
+    pace->interval = interval > 0 ? interval : 0;
+    pace->n = pace->missed = pace->max_late = 0;
+    pace->start = monotonic_ns();
+}
+
+void pace_wait(pace_t* pace)
+{
+    if (pace->interval)
+    {
+        // Absolute deadlines, so a late sample does not shift the following ones
+        uint64_t deadline = pace->start + pace->n * pace->interval;
+        uint64_t now = monotonic_ns();
+        if (now > deadline)
+        {
+            pace->missed++;
+        }
+        else
+        {
+            sleep_until_ns(deadline);
+            now = monotonic_ns();
+        }
+        uint64_t late = now - deadline;
+        pace->hist[bucket_of(late)]++;
+        if (late > pace->max_late) pace->max_late = late;
+    }
+    pace->n++;
+}
+
+uint64_t pace_percentile(const pace_t* pace, double q)
+{
+    uint64_t rank = (uint64_t)(q * pace->n), seen = 0;
+    for (int i = 0; i < PACE_HIST_BUCKETS; i++)
+    {
+        seen += pace->hist[i];
+        if (seen > rank) return bucket_upper(i) < pace->max_late ? bucket_upper(i) : pace->max_late;
+    }
+    return pace->max_late;
+}
+
+void pace_report(const pace_t* pace, FILE* flog)
+{
+    double used = monotonic_ns() - pace->start;
+    if (pace->n == 0) return;
+    fprintf(flog, "Time used per read (ns): %lf\n", used / pace->n);
+    fprintf(flog, "Achieved rate (samples/s): %.1lf\n", pace->n * 1e9 / used);
+    if (!pace->interval) return;
+    fprintf(flog, "Target rate (samples/s): %.1lf\n", 1e9 / pace->interval);
+    fprintf(flog, "Jitter (ns): p50 %lu, p90 %lu, p99 %lu, p99.9 %lu, max %lu\n",
+        pace_percentile(pace, 0.5),
+        pace_percentile(pace, 0.9),
+        pace_percentile(pace, 0.99),
+        pace_percentile(pace, 0.999),
+        pace->max_late
+    );
+    fprintf(flog, "Missed deadlines: %lu / %lu\n", pace->missed, pace->n);
+}
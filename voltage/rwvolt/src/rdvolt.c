@@ -1,5 +1,25 @@
 #include "rwmsr.h"
+#include "ring.h"
+#include "pace.h"
 #include <time.h>
+#include <endian.h>
+
+// Samples per binary block written to the output pipe
+#define BIN_BLOCK_SIZE 4096
+
+// Write the whole buffer, retrying on short writes
+static int write_all(int fd, const void* buf, size_t size)
+{
+    const char* p = buf;
+    while (size > 0)
+    {
+        ssize_t n = write(fd, p, size);
+        if (n <= 0) return -1;
+        p += n;
+        size -= n;
+    }
+    return 0;
+}
 
 void bind_core(int core_id) {
     cpu_set_t cpuset;
@@ -27,7 +47,6 @@ void unbind() {
 }
 
 int read_core_voltage(int core_id, int read_num, int interval, int fdout, int fdlog){
-    struct timespec st, et, rt;
     FILE* fout = fdopen(dup(fdout), "w");
     FILE* flog = fdopen(dup(fdlog), "w");
     // Open output CSV file
@@ -37,26 +56,35 @@ int read_core_voltage(int core_id, int read_num, int interval, int fdout, int fd
         return -1;
     }
 
-    char msr_path[64];
-    snprintf(msr_path, sizeof(msr_path), "/dev/cpu/%d/msr", core_id);
-    
-    int fd = open(msr_path, O_RDONLY);
+    int fd = open_msr(core_id, O_RDONLY);
     if (fd == -1)
     {
         perror("Error opening MSR file");
-        exit(EXIT_FAILURE);
+        fclose(fout);
+        fclose(flog);
+        return -1;
     }
 
     fprintf(flog, "Monitoring voltage on core %d.\n", core_id);
     uint64_t value;
-    clock_gettime(CLOCK_REALTIME, &st);
+    pace_t pace;
+    pace_init(&pace, interval);
 
-    int is_finite = read_num >= 0;
+    int is_finite = read_num >= 0, failed = 0;
     for (int i = 0; !is_finite || i < read_num; i+=is_finite)
     {
-        // do clock_gettime(CLOCK_REALTIME, &rt);
-        // while ((rt.tv_sec - st.tv_sec)*1000 + (rt.tv_nsec - st.tv_nsec) < i * interval);
-        pread(fd, &value, sizeof(value), MSR_IA32_PERF_STATUS);
+        pace_wait(&pace);
+        if (!is_finite && pace.n % PACE_REPORT_EVERY == 0)
+        {
+            pace_report(&pace, flog);
+            fflush(flog);
+        }
+        if (pread(fd, &value, sizeof(value), MSR_IA32_PERF_STATUS) != sizeof(value))
+        {
+            perror("Error reading MSR");
+            failed = 1;
+            break;
+        }
         uint64_t voltage_value = EXTRACT_BITS(
             value,
             MSR_IA32_PERF_STATUS_VOLTAGE_FIELD_HIGH,
@@ -65,14 +93,261 @@ int read_core_voltage(int core_id, int read_num, int interval, int fdout, int fd
         fprintf(fout, "%lu\n", voltage_value); // Write to fout
     }
 
-    clock_gettime(CLOCK_REALTIME, &et);
-
-    // fprintf(flog, "Start time: %ld, %ld\n", st.tv_sec, st.tv_nsec);
-    // fprintf(flog, "End   time: %ld, %ld\n", et.tv_sec, et.tv_nsec);
-    fprintf(flog, "Time used per read (ns): %lf\n", (et.tv_sec-st.tv_sec)*(1e9/read_num)+(et.tv_nsec - st.tv_nsec)*1./read_num);
+    pace_report(&pace, flog);
 
-    fprintf(flog, "Data collection complete.\n");
+    fprintf(flog, failed ? "Data collection failed.\n" : "Data collection complete.\n");
+    close(fd);
     fclose(fout);
     fclose(flog);
+    return failed ? -1 : is_finite ? read_num : 0;
+}
+
+// Open the MSR files of `cores` read-only for a long-lived sampler, closing the opened ones again on failure
+int open_core_readers(const int* cores, int n_cores, int* fds){
+    for (int c = 0; c < n_cores; c++)
+    {
+        fds[c] = open_msr(cores[c], O_RDONLY);
+        if (fds[c] == -1)
+        {
+            perror("Error opening MSR file");
+            while (c--) close(fds[c]);
+            return -1;
+        }
+    }
+    return n_cores;
+}
+
+static void close_cores(int* fds, int n_cores)
+{
+    for (int c = 0; c < n_cores; c++) close(fds[c]);
+}
+
+static void log_cores(FILE* flog, const int* cores, int n_cores, const char* mode)
+{
+    fprintf(flog, "Monitoring voltage on core %d", cores[0]);
+    for (int c = 1; c < n_cores; c++) fprintf(flog, ",%d", cores[c]);
+    fprintf(flog, " (%s).\n", mode);
+}
+
+// Voltage field of the performance status, -1 if the MSR could not be read
+static inline int read_voltage_fd(int fd)
+{
+    uint64_t value;
+    if (pread(fd, &value, sizeof(value), MSR_IA32_PERF_STATUS) != sizeof(value)) return -1;
+    return (int)EXTRACT_BITS(
+        value,
+        MSR_IA32_PERF_STATUS_VOLTAGE_FIELD_HIGH,
+        MSR_IA32_PERF_STATUS_VOLTAGE_FIELD_LOW
+    );
+}
+
+// Binary framing: every frame holds one little-endian uint16 sample per core, in `cores` order.
+// All cores are read back to back in one paced pass, so samples of a frame are aligned in time.
+int read_cores_voltage_bin(const int* cores, int n_cores, int read_num, int interval, int fdout, int fdlog){
+    FILE* flog = fdopen(dup(fdlog), "w");
+    if (!flog || n_cores <= 0 || n_cores > RWVOLT_MAX_CORES)
+    {
+        if (flog) { fprintf(flog, "Bad core list\n"); fclose(flog); }
+        return -1;
+    }
+
+    int fds[RWVOLT_MAX_CORES];
+    if (open_core_readers(cores, n_cores, fds) < 0)
+    {
+        fclose(flog);
+        return -1;
+    }
+
+    log_cores(flog, cores, n_cores, "binary");
+    uint16_t block[BIN_BLOCK_SIZE];
+    const int block_size = BIN_BLOCK_SIZE - BIN_BLOCK_SIZE % n_cores;
+    int n_block = 0;
+    pace_t pace;
+    pace_init(&pace, interval);
+
+    int is_finite = read_num >= 0, failed = 0;
+    for (int i = 0; !is_finite || i < read_num; i+=is_finite)
+    {
+        pace_wait(&pace);
+        if (!is_finite && pace.n % PACE_REPORT_EVERY == 0)
+        {
+            pace_report(&pace, flog);
+            fflush(flog);
+        }
+        for (int c = 0; c < n_cores && !failed; c++)
+        {
+            int value = read_voltage_fd(fds[c]);
+            failed = value < 0;
+            block[n_block++] = htole16((uint16_t)value);
+        }
+        if (failed)
+        {
+            // Drop the partial frame, complete ones are still written
+            n_block -= 1 + (n_block - 1) % n_cores;
+            perror("Error reading MSR");
+            break;
+        }
+        if (n_block == block_size)
+        {
+            // A closed output ends an infinite read, a finite one is truncated
+            if (write_all(fdout, block, n_block * sizeof(uint16_t)) < 0)
+            {
+                failed = is_finite;
+                n_block = 0;
+                break;
+            }
+            n_block = 0;
+        }
+    }
+    if (n_block > 0 && write_all(fdout, block, n_block * sizeof(uint16_t)) < 0) failed = is_finite;
+
+    pace_report(&pace, flog);
+
+    fprintf(flog, failed ? "Data collection failed.\n" : "Data collection complete.\n");
+    close_cores(fds, n_cores);
+    fclose(flog);
+    return failed ? -1 : is_finite ? read_num : 0;
+}
+
+int read_core_voltage_bin(int core_id, int read_num, int interval, int fdout, int fdlog){
+    return read_cores_voltage_bin(&core_id, 1, read_num, interval, fdout, fdlog);
+}
+
+// Shared-memory ring: whole blocks of frames are published to `ring`, never blocks on a slow consumer.
+// A block that does not fit is still sampled but dropped and counted in `ring->overruns`.
+int read_cores_voltage_ring(const int* cores, int n_cores, int read_num, int interval, void* ring_ptr, int fdlog){
+    volt_ring_t* ring = ring_ptr;
+    FILE* flog = fdopen(dup(fdlog), "w");
+    if (!flog || !ring || n_cores <= 0 || n_cores > RWVOLT_MAX_CORES
+        || ring->block == 0 || ring->block % n_cores != 0 || ring->capacity % ring->block != 0)
+    {
+        if (flog) { fprintf(flog, "Bad ring buffer\n"); fclose(flog); }
+        return -1;
+    }
+
+    int fds[RWVOLT_MAX_CORES];
+    if (open_core_readers(cores, n_cores, fds) < 0)
+    {
+        fclose(flog);
+        return -1;
+    }
+
+    log_cores(flog, cores, n_cores, "ring");
+    fflush(flog);
+    const uint64_t block = ring->block, capacity = ring->capacity;
+    uint64_t head = __atomic_load_n(&ring->head, __ATOMIC_RELAXED);
+    uint64_t pos = 0;
+    int16_t* slot = NULL;
+    pace_t pace;
+    pace_init(&pace, interval);
+
+    int is_finite = read_num >= 0, failed = 0;
+    for (int i = 0; !failed && (!is_finite || i < read_num); i+=is_finite)
+    {
+        if (pos == 0)
+        {
+            uint64_t tail = __atomic_load_n(&ring->tail, __ATOMIC_ACQUIRE);
+            slot = head + block - tail > capacity ? NULL : ring->data + head % capacity;
+        }
+        pace_wait(&pace);
+        if (!is_finite && pace.n % PACE_REPORT_EVERY == 0)
+        {
+            pace_report(&pace, flog);
+            fprintf(flog, "Samples dropped on overrun: %lu\n", ring->overruns);
+            fflush(flog);
+        }
+        for (int c = 0; c < n_cores && !failed; c++, pos++)
+        {
+            int value = read_voltage_fd(fds[c]);
+            failed = value < 0;
+            if (slot) slot[pos] = (int16_t)value;
+        }
+        if (failed)
+        {
+            // The partial block is never published
+            perror("Error reading MSR");
+            break;
+        }
+        if (pos == block)
+        {
+            if (slot)
+            {
+                head += block;
+                __atomic_store_n(&ring->head, head, __ATOMIC_RELEASE);
+            }
+            else
+            {
+                __atomic_store_n(&ring->overruns, ring->overruns + block, __ATOMIC_RELEASE);
+            }
+            pos = 0;
+        }
+    }
+
+    pace_report(&pace, flog);
+    fprintf(flog, "Samples dropped on overrun: %lu\n", ring->overruns);
+
+    fprintf(flog, failed ? "Data collection failed.\n" : "Data collection complete.\n");
+    close_cores(fds, n_cores);
+    fclose(flog);
+    return failed ? -1 : is_finite ? read_num : 0;
+}
+
+int read_core_voltage_ring(int core_id, int read_num, int interval, void* ring_ptr, int fdlog){
+    return read_cores_voltage_ring(&core_id, 1, read_num, interval, ring_ptr, fdlog);
+}
+
+// `read_num` paced frames of `fds` into `out` planar, -1 if an MSR could not be read
+static int read_fds_voltage_into(const int* fds, int n_fds, int16_t* out, int read_num, int interval, FILE* flog)
+{
+    pace_t pace;
+    pace_init(&pace, interval);
+    for (int i = 0; i < read_num; i++)
+    {
+        pace_wait(&pace);
+        for (int c = 0; c < n_fds; c++)
+        {
+            int value = read_voltage_fd(fds[c]);
+            if (value < 0)
+            {
+                if (flog) fprintf(flog, "Error reading MSR at sample %d\n", i);
+                return -1;
+            }
+            out[(size_t)c * read_num + i] = (int16_t)value;
+        }
+    }
+    if (flog) pace_report(&pace, flog);
     return read_num;
 }
+
+// Capture into a caller's int16 buffer of `n_cores * read_num` samples, no logging if `fdlog` < 0
+int read_cores_voltage_into(const int* cores, int n_cores, int16_t* out, int read_num, int interval, int fdlog){
+    if (!out || read_num < 0 || n_cores <= 0 || n_cores > RWVOLT_MAX_CORES) return -1;
+    FILE* flog = fdlog >= 0 ? fdopen(dup(fdlog), "w") : NULL;
+
+    int fds[RWVOLT_MAX_CORES];
+    if (open_core_readers(cores, n_cores, fds) < 0)
+    {
+        if (flog) { fprintf(flog, "Error opening MSR file\n"); fclose(flog); }
+        return -1;
+    }
+    if (flog) log_cores(flog, cores, n_cores, "in-process");
+
+    int result = read_fds_voltage_into(fds, n_cores, out, read_num, interval, flog);
+
+    close_cores(fds, n_cores);
+    if (flog) fclose(flog);
+    return result;
+}
+
+int read_core_voltage_into(int core_id, int16_t* out, int read_num, int interval, int fdlog){
+    return read_cores_voltage_into(&core_id, 1, out, read_num, interval, fdlog);
+}
+
+// Same as `read_cores_voltage_into` on handles opened once by `open_core_readers`
+int read_handles_voltage_into(const int* fds, int n_fds, int16_t* out, int read_num, int interval, int fdlog){
+    if (!out || read_num < 0 || n_fds <= 0) return -1;
+    FILE* flog = fdlog >= 0 ? fdopen(dup(fdlog), "w") : NULL;
+    int result = read_fds_voltage_into(fds, n_fds, out, read_num, interval, flog);
+    if (flog) fclose(flog);
+    return result;
+}
@@ -1,32 +1,57 @@
 #include "rwmsr.h"
 
+static char msr_path_fmt[256] = MSR_PATH_DEFAULT;
+
+void set_msr_path(const char* fmt)
+{
+    snprintf(msr_path_fmt, sizeof(msr_path_fmt), "%s", fmt ? fmt : MSR_PATH_DEFAULT);
+}
+
+int msr_path(int core_id, char* buf, size_t size)
+{
+    return snprintf(buf, size, msr_path_fmt, core_id);
+}
+
 // Extract specific bits from a 64-bit value
 uint64_t extract_bits(uint64_t value, int high, int low)
 {
     return (value >> low) & ((1ULL << (high - low + 1)) - 1);
 }
 
-// Function to read an MSR register
-uint64_t read_msr(int core_id, uint32_t msr_address)
+int open_msr(int core_id, int flags)
 {
-    char msr_path[64];
-    snprintf(msr_path, sizeof(msr_path), "/dev/cpu/%d/msr", core_id);
+    char path[256];
+    msr_path(core_id, path, sizeof(path));
+    return open(path, flags);
+}
 
-    int fd = open(msr_path, O_RDONLY);
-    if (fd == -1)
+uint64_t read_msr_fd(int fd, uint32_t msr_address)
+{
+    uint64_t value;
+    if (pread(fd, &value, sizeof(value), msr_address) != sizeof(value))
     {
-        perror("Error opening MSR file");
+        perror("Error reading MSR");
         exit(EXIT_FAILURE);
     }
+    return value;
+}
 
-    uint64_t value;
-    if (pread(fd, &value, sizeof(value), msr_address) != sizeof(value))
+int write_msr_fd(int fd, uint32_t msr_address, uint64_t val)
+{
+    return pwrite(fd, &val, sizeof(val), msr_address) == sizeof(val) ? 0 : -1;
+}
+
+// Function to read an MSR register
+uint64_t read_msr(int core_id, uint32_t msr_address)
+{
+    int fd = open_msr(core_id, O_RDONLY);
+    if (fd == -1)
     {
-        perror("Error reading MSR");
-        close(fd);
+        perror("Error opening MSR file");
         exit(EXIT_FAILURE);
     }
 
+    uint64_t value = read_msr_fd(fd, msr_address);
     close(fd);
     return value;
 }
@@ -34,17 +59,14 @@ uint64_t read_msr(int core_id, uint32_t msr_address)
 // Function to write an MSR register
 void write_msr(int core_id, uint32_t msr_address, uint64_t val)
 {
-    char msr_path[64];
-    snprintf(msr_path, sizeof(msr_path), "/dev/cpu/%d/msr", core_id);
-
-    int fd = open(msr_path, O_WRONLY);
+    int fd = open_msr(core_id, O_WRONLY);
     if (fd == -1)
     {
         perror("Error opening MSR file");
         exit(EXIT_FAILURE);
     }
 
-    if (pwrite(fd, &val, sizeof(val), msr_address) != sizeof(val))
+    if (write_msr_fd(fd, msr_address, val) < 0)
     {
         perror("Error writing MSR");
         close(fd);
@@ -1,8 +1,17 @@
 #include "rwmsr.h"
+#include "pace.h"
+#include <time.h>
+
+// Mailbox command for a voltage in mV, the converted value goes to `mbox` if not NULL
+static uint64_t mailbox_value(int method, int mv, int* mbox)
+{
+    int value = MV_TO_MBOX(mv);
+    if (mbox) *mbox = value;
+    return method == VOLT_METHOD_SET ? MAILBOX_SET_CORE_VOLT(value) : MAILBOX_OFFSET_CORE_VOLT(value);
+}
 
 int offset_core_voltage(int core_id, int offset, int fdlog){
-    offset = MV_TO_MBOX(offset);
-    uint64_t value = MAILBOX_OFFSET_CORE_VOLT(offset);
+    uint64_t value = mailbox_value(VOLT_METHOD_OFFSET, offset, &offset);
     FILE* flog = fdopen(dup(fdlog), "w");
     write_msr(core_id, MSR_OC_MBOX, value);
     fprintf(flog, "Voltage offset applied successfully.\n");
@@ -11,11 +20,93 @@ int offset_core_voltage(int core_id, int offset, int fdlog){
 }
 
 int set_core_voltage(int core_id, int target, int fdlog){
-    target = MV_TO_MBOX(target);
-    uint64_t value = MAILBOX_SET_CORE_VOLT(target);
+    uint64_t value = mailbox_value(VOLT_METHOD_SET, target, &target);
     FILE* flog = fdopen(dup(fdlog), "w");
     write_msr(core_id, MSR_OC_MBOX, value);
     fprintf(flog, "Voltage set successfully.\n");
     fclose(flog);
     return target;
 }
+
+// Open the MSR files of `cores` once, closing the opened ones again on failure
+int open_core_handles(const int* cores, int n_cores, int* fds){
+    for (int c = 0; c < n_cores; c++)
+    {
+        fds[c] = open_msr(cores[c], O_RDWR);
+        if (fds[c] == -1)
+        {
+            perror("Error opening MSR file");
+            while (c--) close(fds[c]);
+            return -1;
+        }
+    }
+    return n_cores;
+}
+
+void close_core_handles(const int* fds, int n_cores){
+    for (int c = 0; c < n_cores; c++) close(fds[c]);
+}
+
+// Write one voltage step to every opened core, no logging on this path. The converted value goes to `mbox`
+// if not NULL, as it is negative for negative offsets the return is only 0 or -1 on failure
+int write_core_voltage(const int* fds, int n_fds, int method, int mv, int* mbox){
+    uint64_t value = mailbox_value(method, mv, mbox);
+    for (int c = 0; c < n_fds; c++)
+    {
+        if (write_msr_fd(fds[c], MSR_OC_MBOX, value) < 0) return -1;
+    }
+    return 0;
+}
+
+// Play `values[i]` (mV) on all opened cores `delays[i]` ms after the previous step. Steps are scheduled
+// against absolute CLOCK_MONOTONIC deadlines from the start, so a late write does not shift the following ones.
+// The deadline of every step and the time once all cores were written go to `deadlines` and `stamps`
+// (CLOCK_MONOTONIC ns, either may be NULL). Unless `fdready` is -1, the first deadline is written to it (8 bytes)
+// before sleeping to it, so a reader can start capturing in time. Returns the number of steps written.
+int play_voltage_waveform(const int* fds, int n_fds, int method, const int* delays, const int* values, int n_steps, uint64_t* deadlines, uint64_t* stamps, int fdready){
+    uint64_t deadline = monotonic_ns();
+    int step = 0;
+    for (; step < n_steps; step++)
+    {
+        if (delays[step] > 0) deadline += (uint64_t)delays[step] * 1000000ULL;
+        if (step == 0 && fdready >= 0 && write(fdready, &deadline, sizeof(deadline)) != sizeof(deadline)) perror("Error signalling the first deadline");
+        // Returns at once when the deadline already passed
+        sleep_until_ns(deadline);
+        if (write_core_voltage(fds, n_fds, method, values[step], NULL) < 0)
+        {
+            perror("Error writing MSR");
+            break;
+        }
+        if (stamps) stamps[step] = monotonic_ns();
+        if (deadlines) deadlines[step] = deadline;
+    }
+    return step;
+}
+
+// Apply `values[i]` (mV) to all `cores` `delays[i]` ms after the previous step, see `play_voltage_waveform`.
+// Handles are opened once and the log is written after the last step.
+int apply_voltage_schedule(const int* cores, int n_cores, int method, const int* delays, const int* values, int n_steps, int fdlog){
+    int fds[RWVOLT_MAX_CORES];
+    FILE* flog = fdopen(dup(fdlog), "w");
+    if (!flog || n_cores <= 0 || n_cores > RWVOLT_MAX_CORES || open_core_handles(cores, n_cores, fds) < 0)
+    {
+        if (flog) { fprintf(flog, "Bad core list\n"); fclose(flog); }
+        return -1;
+    }
+
+    uint64_t* deadlines = malloc(sizeof(uint64_t) * (n_steps > 0 ? n_steps : 1));
+    uint64_t* stamps = malloc(sizeof(uint64_t) * (n_steps > 0 ? n_steps : 1));
+    int step = play_voltage_waveform(fds, n_cores, method, delays, values, n_steps, deadlines, stamps, -1);
+    close_core_handles(fds, n_cores);
+
+    uint64_t max_late = 0;
+    for (int i = 0; deadlines && stamps && i < step; i++)
+    {
+        if (stamps[i] - deadlines[i] > max_late) max_late = stamps[i] - deadlines[i];
+    }
+    fprintf(flog, "Voltage schedule applied: %d / %d steps on %d core(s), written at most %lu ns after their deadlines.\n", step, n_steps, n_cores, max_late);
+    fclose(flog);
+    free(deadlines);
+    free(stamps);
+    return step;
+}
@@ -1,29 +1,25 @@
 from rwvolt import RWVolt
-import argparse, time, sys
+import argparse, sys
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-c", "--cores", nargs="+", type=list, default=[0])
+    parser.add_argument("-c", "--cores", nargs="+", type=int, default=[0])
     parser.add_argument("-m", "--method", type=str, default="offset")
     parser.add_argument("-p", "--periods", type=int, nargs="+", required=True)
     parser.add_argument("-v", "--values", type=int, nargs="+", required=True)
     return parser.parse_args()
 
-def seq_setter(func, cores, periods, values, output = sys.stderr):
-    """ms-level setter"""
-    st = time.time()
+def seq_setter(method, cores, periods, values, output = sys.stderr):
+    """ms-level setter, played natively against absolute deadlines"""
     print(periods, values)
-    for p, v in zip(periods, values):
-        time.sleep(1e-3 * p)
-        for core in cores: func(core, v, output)
-        st = time.time()
+    with RWVolt.open_handles(cores, method) as handles:
+        deadlines, stamps = handles.play(periods, values)
+    for step, (v, d, s) in enumerate(zip(values, deadlines, stamps)):
+        output.write(f"Step {step}: {v} mV written {(s - d) / 1e3:.1f} us after its deadline.\n")
 
 def main():
     args = parse_args()
-    config = args.__dict__
-    method = config.pop("method")
-    func = RWVolt.set_core_voltage if method == "set" else RWVolt.offset_core_voltage
-    seq_setter(func, **config)
+    seq_setter(**args.__dict__)
 
 # subprocess only
 if __name__ == "__main__":
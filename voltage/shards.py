@@ -0,0 +1,112 @@
+import numpy as np
+import json, os
+from typing import List, Sequence
+from trace_codec import load_traces
+
+class ShardedArray:
+    """Arrays with the same row shape and dtype seen as one concatenated array, indexing reads only the rows asked for."""
+    def __init__(self, shards: Sequence[np.ndarray]):
+        assert len(shards) > 0, ValueError("At least one shard is needed.")
+        self.shards_ = list(shards)
+        row_shape, dtype = self.shards_[0].shape[1:], self.shards_[0].dtype
+        assert all(s.shape[1:] == row_shape and s.dtype == dtype for s in self.shards_), ValueError("Shards should share their row shape and dtype.")
+        # Index of the first row of every shard, and the total
+        self.offsets_ = np.cumsum([0] + [len(s) for s in self.shards_])
+
+    @property
+    def shape(self):
+        return (int(self.offsets_[-1]), *self.shards_[0].shape[1:])
+
+    @property
+    def dtype(self):
+        return self.shards_[0].dtype
+
+    @property
+    def ndim(self):
+        return self.shards_[0].ndim
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _rows(self, index) -> np.ndarray:
+        n = len(self)
+        if isinstance(index, (int, np.integer)):
+            if not -n <= index < n: raise IndexError(f"Row {index} out of range for {n} rows.")
+            index = index % n
+            shard = np.searchsorted(self.offsets_, index, side="right") - 1
+            return self.shards_[shard][index - self.offsets_[shard]]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(n)
+            if step == 1 and start < stop:
+                shard = np.searchsorted(self.offsets_, start, side="right") - 1
+                if stop <= self.offsets_[shard + 1]:
+                    return self.shards_[shard][start - self.offsets_[shard]:stop - self.offsets_[shard]]
+            index = np.arange(start, stop, step)
+        index = np.asarray(index)
+        if index.dtype == np.bool_:
+            index = np.flatnonzero(index)
+        index = np.where(index < 0, index + n, index)
+        if index.size and (index.min() < 0 or index.max() >= n): raise IndexError(f"Rows out of range for {n} rows.")
+        out = np.empty((*index.shape, *self.shape[1:]), dtype=self.dtype)
+        shards = np.searchsorted(self.offsets_, index, side="right") - 1
+        for shard in np.unique(shards):
+            mask = shards == shard
+            out[mask] = self.shards_[shard][index[mask] - self.offsets_[shard]]
+        return out
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            rows = self._rows(index[0])
+            return rows[index[1:]] if isinstance(index[0], (int, np.integer)) else rows[(slice(None), *index[1:])]
+        return self._rows(index)
+
+    def __array__(self, dtype=None, copy=None):
+        out = np.concatenate(self.shards_, axis=0)
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    @classmethod
+    def concatenate(cls, arrays: Sequence) -> "ShardedArray":
+        """Rows of `arrays` one after another, their shards are shared, not copied."""
+        shards = []
+        for array in arrays:
+            shards += array.shards_ if isinstance(array, ShardedArray) else [array]
+        return cls(shards)
+
+class Manifest:
+    """Shards of a dataset group in `manifest.json`: path relative to it, rows, label and config of each."""
+    _NAME = "manifest.json"
+    VERSION = 1
+
+    def __init__(self, shards: List[dict] = None, key: str = None):
+        self.shards_ = shards or []
+        self.key_ = key
+
+    def add(self, path: str, rows: int, label: str, config: str, **extra):
+        self.shards_.append({"path": path, "rows": int(rows), "label": label, "config": config, **extra})
+
+    @classmethod
+    def exists(cls, dir: str) -> bool:
+        return os.path.exists(os.path.join(dir, cls._NAME))
+
+    def save(self, dir: str):
+        path = os.path.join(dir, self._NAME)
+        with open(path + ".tmp", "w") as fp:
+            json.dump({"version": self.VERSION, "key": self.key_, "shards": self.shards_}, fp, indent=4)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def read(cls, dir: str) -> "Manifest":
+        with open(os.path.join(dir, cls._NAME)) as fp:
+            manifest = json.load(fp)
+        assert manifest["version"] == cls.VERSION, ValueError(f"Manifest version {manifest['version']} not supported.")
+        return cls(manifest["shards"], manifest.get("key"))
+
+    def load(self, dir: str, pos_label: str):
+        """Lazy `ShardedArray` of the samples and their boolean labels, `True` for `pos_label`."""
+        shards = []
+        for shard in self.shards_:
+            data = load_traces(os.path.join(dir, shard["path"]))
+            assert len(data) == shard["rows"], ValueError(f"Shard {shard['path']} has {len(data)} rows, the manifest says {shard['rows']}.")
+            shards.append(data)
+        labels = np.concatenate([np.full(s["rows"], s["label"] == pos_label, dtype=np.bool_) for s in self.shards_])
+        return ShardedArray(shards), labels
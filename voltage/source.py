@@ -0,0 +1,249 @@
+import numpy as np
+import os, time
+from typing import TextIO, Union, Optional, List
+from sys import stdout, stderr
+from rwvolt import RWVolt
+from constants import MSR_PATH, DIR_MSR_EMULATED
+
+MSR_IA32_PERF_STATUS = 0x198
+
+def register(name):
+    def wrapper(cls):
+        cls.registered[name] = cls
+        return cls
+    return wrapper
+
+class VoltSourceBase:
+    """Where voltage samples come from. The read methods mirror `RWVolt`, so a recorder
+    runs them as its sampler process whatever the backend is.
+    """
+    registered = {}
+
+    # Path format of the MSR files written by setters, `None` if the source cannot be disturbed
+    msr_path_: Optional[str] = None
+
+    def read_core_voltage(
+        self,
+        core_id: int,
+        read_num: int,
+        interval: int = 0,
+        fpout: TextIO = stdout,
+        fplog: TextIO = stderr,
+        binary: bool = False
+    ) -> int:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def read_core_voltage_ring(self, core_id: int, read_num: int, interval: int, ring, fplog: TextIO = stderr) -> int:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def read_cores_voltage(
+        self,
+        cores: List[int],
+        read_num: int,
+        interval: int = 0,
+        fpout: TextIO = stdout,
+        fplog: TextIO = stderr
+    ) -> int:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def read_cores_voltage_ring(self, cores: List[int], read_num: int, interval: int, ring, fplog: TextIO = stderr) -> int:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def read_cores_voltage_into(self, cores: List[int], out: np.ndarray, interval: int = 0, fplog: Optional[TextIO] = None) -> int:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def offset_core_voltage(self, core_id: int, offset: int, fplog: TextIO = stderr) -> int:
+        raise NotImplementedError("Subclasses should implement this method.")
+
+    def open_sampler(self, cores: List[int]) -> "SourceSampler":
+        """Sampler kept open across captures, see `SourceSampler`."""
+        return SourceSampler(self, cores)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        config = dict(config)
+        return cls.registered[config.pop("type")](**config)
+
+class SourceSampler:
+    """Long-lived sampler of `cores`, `read_into` fills planar `(cores, n)` int16 buffers like
+    `read_cores_voltage_into`. Sources with an open/close cost override `open_sampler`.
+    """
+    def __init__(self, source: VoltSourceBase, cores: List[int]):
+        self.source_ = source
+        self.cores_ = list(cores)
+
+    def read_into(self, out: np.ndarray, interval: int = 0, fplog: Optional[TextIO] = None) -> int:
+        return self.source_.read_cores_voltage_into(self.cores_, out, interval, fplog)
+
+    def close(self):
+        ...
+
+@register("msr")
+class MSRSource(VoltSourceBase):
+    """Live samples from `MSR_IA32_PERF_STATUS` through librwvolt."""
+    def __init__(self, msr_path: str = MSR_PATH):
+        self.msr_path_ = msr_path
+
+    def read_core_voltage(self, core_id, read_num, interval=0, fpout=stdout, fplog=stderr, binary=False):
+        RWVolt.set_msr_path(self.msr_path_)
+        return RWVolt.read_core_voltage(core_id, read_num, interval, fpout, fplog, binary)
+
+    def read_core_voltage_ring(self, core_id, read_num, interval, ring, fplog=stderr):
+        RWVolt.set_msr_path(self.msr_path_)
+        return RWVolt.read_core_voltage_ring(core_id, read_num, interval, ring, fplog)
+
+    def read_cores_voltage(self, cores, read_num, interval=0, fpout=stdout, fplog=stderr):
+        RWVolt.set_msr_path(self.msr_path_)
+        return RWVolt.read_cores_voltage(cores, read_num, interval, fpout, fplog)
+
+    def read_cores_voltage_ring(self, cores, read_num, interval, ring, fplog=stderr):
+        RWVolt.set_msr_path(self.msr_path_)
+        return RWVolt.read_cores_voltage_ring(cores, read_num, interval, ring, fplog)
+
+    def read_cores_voltage_into(self, cores, out, interval=0, fplog=None):
+        RWVolt.set_msr_path(self.msr_path_)
+        if len(cores) == 1: return RWVolt.read_core_voltage_into(cores[0], out, interval, fplog)
+        return RWVolt.read_cores_voltage_into(cores, out, interval, fplog)
+
+    def offset_core_voltage(self, core_id, offset, fplog=stderr):
+        RWVolt.set_msr_path(self.msr_path_)
+        return RWVolt.offset_core_voltage(core_id, offset, fplog)
+
+    def open_sampler(self, cores):
+        # MSR files stay open, so a capture is paced reads only
+        RWVolt.set_msr_path(self.msr_path_)
+        return RWVolt.open_handles(cores, readonly=True)
+
+@register("emulated")
+class EmulatedMSRSource(MSRSource):
+    """Regular files standing in for `/dev/cpu/N/msr`, read and written by librwvolt as usual.
+    The voltage sits in bits 47:32 of the register at `0x198`, as on the hardware.
+    """
+    _FILE_SIZE = 0x1000
+
+    def __init__(self, cores: List[int] = [0], value: int = 6554, directory: str = DIR_MSR_EMULATED):
+        super().__init__(os.path.join(directory, "%d", "msr"))
+        for core in cores:
+            self.set_voltage(core, value)
+
+    @staticmethod
+    def encode(value: int) -> int:
+        return (int(value) & 0xffff) << 32
+
+    def set_voltage(self, core_id: int, value: int):
+        """Write a raw voltage value (1/8192 V) into the emulated status register of `core_id`."""
+        path = self.msr_path_ % core_id
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as fp:
+            fp.truncate(max(self._FILE_SIZE, os.path.getsize(path)))
+        with open(path, "r+b") as fp:
+            fp.seek(MSR_IA32_PERF_STATUS)
+            fp.write(np.uint64(self.encode(value)).tobytes())
+
+@register("replay")
+class ReplaySource(VoltSourceBase):
+    """Replay of a recorded `.npy` trace (rows are played back to back) at `rate` samples/sec, `0` for as fast as possible.
+    Multi-core reads replay the same trace on every core.
+    """
+    _CHUNK = 4096
+
+    def __init__(self, trace: Union[str, np.ndarray], rate: float = 0, loop: bool = True):
+        data = np.load(trace, mmap_mode="r") if isinstance(trace, str) else trace
+        self.trace_ = np.asarray(data, dtype=np.int16).reshape(-1)
+        assert self.trace_.size > 0, ValueError("Empty replay trace.")
+        self.rate_ = rate
+        self.loop_ = loop
+
+    @staticmethod
+    def _frames(chunk: np.ndarray, n_cores: int) -> np.ndarray:
+        return np.repeat(chunk, n_cores) if n_cores > 1 else chunk
+
+    def _chunks(self, read_num: int, size: int, interval: int = 0):
+        """Yield consecutive trace chunks of at most `size` samples, paced to `interval` ns or else `rate_`."""
+        rate = 1e9 / interval if interval > 0 else self.rate_
+        st = time.perf_counter()
+        pos = sent = 0
+        while read_num < 0 or sent < read_num:
+            if pos >= self.trace_.size:
+                if not self.loop_: return
+                pos = 0
+            n = min(size, self.trace_.size - pos)
+            if read_num >= 0: n = min(n, read_num - sent)
+            if rate > 0:
+                delay = st + (sent + n) / rate - time.perf_counter()
+                if delay > 0: time.sleep(delay)
+            yield self.trace_[pos:pos + n]
+            pos += n
+            sent += n
+
+    def read_core_voltage(self, core_id, read_num, interval=0, fpout=stdout, fplog=stderr, binary=False):
+        if binary: return self.read_cores_voltage([core_id], read_num, interval, fpout, fplog)
+        fplog.write(f"Replaying voltage trace as core {core_id}.\n")
+        fd, sent = fpout.fileno(), 0
+        for chunk in self._chunks(read_num, self._CHUNK, interval):
+            if not self._write(fd, ("\n".join(map(str, chunk.tolist())) + "\n").encode()): break
+            sent += chunk.size
+        fplog.write("Data collection complete.\n")
+        fplog.flush()
+        return sent
+
+    def read_cores_voltage(self, cores, read_num, interval=0, fpout=stdout, fplog=stderr):
+        fplog.write(f"Replaying voltage trace as core {','.join(map(str, cores))} (binary).\n")
+        fd, sent = fpout.fileno(), 0
+        for chunk in self._chunks(read_num, self._CHUNK, interval):
+            if not self._write(fd, self._frames(chunk, len(cores)).astype("<u2").tobytes()): break
+            sent += chunk.size
+        fplog.write("Data collection complete.\n")
+        fplog.flush()
+        return sent
+
+    @staticmethod
+    def _write(fd: int, buf: bytes) -> bool:
+        view = memoryview(buf)
+        try:
+            while view: view = view[os.write(fd, view):]
+        except BrokenPipeError:
+            return False
+        return True
+
+    def read_core_voltage_ring(self, core_id, read_num, interval, ring, fplog=stderr):
+        return self.read_cores_voltage_ring([core_id], read_num, interval, ring, fplog)
+
+    def read_cores_voltage_ring(self, cores, read_num, interval, ring, fplog=stderr):
+        # Same publishing rule as the native sampler: whole blocks, dropped when the ring is full
+        fplog.write(f"Replaying voltage trace as core {','.join(map(str, cores))} (ring).\n")
+        n_cores = len(cores)
+        block, sent = ring.block_, 0
+        assert block % n_cores == 0, ValueError("Ring block should hold whole frames.")
+        window = np.empty(block, dtype=np.int16)
+        pos = 0
+        for chunk in self._chunks(read_num, block // n_cores, interval):
+            chunk = self._frames(chunk, n_cores)
+            while chunk.size:
+                n = min(block - pos, chunk.size)
+                window[pos:pos + n] = chunk[:n]
+                chunk, pos, sent = chunk[n:], pos + n, sent + n
+                if pos < block: continue
+                head = ring.head
+                if head + block - ring.tail > ring.capacity_:
+                    ring.header_[ring._OVERRUNS] += block
+                else:
+                    start = head % ring.capacity_
+                    ring.data_[start:start + block] = window
+                    ring.header_[ring._HEAD] = head + block
+                pos = 0
+        fplog.write("Data collection complete.\n")
+        fplog.flush()
+        return sent // n_cores
+
+    def read_cores_voltage_into(self, cores, out, interval=0, fplog=None):
+        rows = out.reshape(len(cores), -1)
+        pos = 0
+        for chunk in self._chunks(rows.shape[1], self._CHUNK, interval):
+            rows[:, pos:pos + chunk.size] = chunk
+            pos += chunk.size
+        return pos
+
+    def offset_core_voltage(self, core_id, offset, fplog=stderr):
+        # A recorded trace cannot be disturbed
+        return 0
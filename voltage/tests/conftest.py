@@ -0,0 +1,58 @@
+import os, sys
+import numpy as np
+import pytest
+
+# Modules import each other by their plain names and resolve paths from `voltage/`
+VOLTAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, VOLTAGE_DIR)
+
+@pytest.fixture
+def voltage_dir(monkeypatch):
+    # Executables spawned as subprocesses import from `voltage/` as well
+    monkeypatch.setenv("PYTHONPATH", VOLTAGE_DIR)
+    monkeypatch.chdir(VOLTAGE_DIR)
+    return VOLTAGE_DIR
+
+@pytest.fixture
+def msr_path(tmp_path, voltage_dir):
+    """Emulated MSR files of cores 0-3 in `tmp_path`, needs a built `rwvolt/librwvolt.so`."""
+    from constants import PATH_LIB
+    if not os.path.exists(PATH_LIB): pytest.skip("librwvolt is not built")
+    for core in range(4):
+        (tmp_path / str(core)).write_bytes(bytes(4096))
+    return str(tmp_path / "%d")
+
+@pytest.fixture
+def layers():
+    """Random weights of a small `model.get_model`-like net: conv, depthwise, pool, then two Dense."""
+    rng = np.random.default_rng(0)
+    weights = lambda *shape: rng.normal(scale=0.5, size=shape).astype(np.float32)
+    return (
+        [
+            {"type": "conv", "kernel": weights(5, 1, 4), "bias": weights(4), "stride": 2, "activation": "relu"},
+            {"type": "depthwise", "kernel": weights(3, 4, 1), "bias": weights(4), "stride": 1, "activation": "relu"},
+            {"type": "avgpool", "size": 2, "stride": 2},
+        ],
+        [
+            {"type": "dense", "kernel": weights(4, 3), "bias": weights(3), "activation": "relu"},
+            {"type": "dense", "kernel": weights(3, 1), "bias": weights(1), "activation": "sigmoid"},
+        ],
+    )
+
+@pytest.fixture
+def keras_model(layers):
+    """The `layers` net in Keras, skipped without it."""
+    keras = pytest.importorskip("keras")
+    local, head = layers
+    model = keras.Sequential([
+        keras.Input((128, 1)),
+        keras.layers.Conv1D(4, 5, strides=2, activation="relu"),
+        keras.layers.DepthwiseConv1D(3, activation="relu"),
+        keras.layers.AveragePooling1D(2),
+        keras.layers.GlobalAveragePooling1D(),
+        keras.layers.Dense(3, activation="relu"),
+        keras.layers.Dense(1, activation="sigmoid"),
+    ])
+    for layer, weights in zip([l for l in model.layers if l.get_weights()], [l for l in local + head if "kernel" in l]):
+        layer.set_weights([weights["kernel"], weights["bias"]])
+    return model
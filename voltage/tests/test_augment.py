@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from utils.augment import RandomRollAugment, RollAugment, SequantialAugment
+
+@pytest.mark.parametrize("augment", [
+    RandomRollAugment(n_repeat=2, keepsrc=True),
+    SequantialAugment(RollAugment(shift=7, keepsrc=True), RandomRollAugment(n_repeat=2)),
+])
+def test_apply_chunks_workers(augment, tmp_path):
+    X = np.random.default_rng(0).integers(-1000, 1000, (50, 64)).astype(np.int16)
+    y = np.arange(50) % 2 == 0
+    serial, labels = augment.apply_chunks(X, y, str(tmp_path / "serial.npy"), chunk_rows=8, n_workers=1, seed=(3, 1))
+    pooled, _ = augment.apply_chunks(X, y, str(tmp_path / "pooled.npy"), chunk_rows=8, n_workers=3, seed=(3, 1))
+    memory, _ = augment.apply_chunks(X, y, None, chunk_rows=8, seed=(3, 1))
+    assert serial.shape == (augment.n_copies * len(X), X.shape[1])
+    np.testing.assert_array_equal(pooled, serial)
+    np.testing.assert_array_equal(memory, serial)
+    np.testing.assert_array_equal(labels, np.tile(y, augment.n_copies))
@@ -0,0 +1,38 @@
+import time
+import numpy as np
+import pytest
+from backgroud import DisturberBackground
+from rwvolt import RWVolt
+
+pytest.importorskip("tqdm")
+from build_dataset import capture_overlaps
+
+def _timing(capture, written):
+    timing = np.zeros((), dtype=[("capture", "<i8", (2,)), ("deadline", "<i8", (len(written),)), ("written", "<i8", (len(written),))])
+    timing["capture"], timing["deadline"], timing["written"] = capture, written, written
+    return timing
+
+def test_capture_overlaps():
+    assert capture_overlaps(_timing((10, 20), [15, 30]))
+    assert capture_overlaps(_timing((20, 40), [15, 30]))
+    assert not capture_overlaps(_timing((0, 10), [15, 30]))
+    assert not capture_overlaps(_timing((10, 20), [15, -1]))
+
+def test_capture_overlaps_written_steps(msr_path, tmp_path):
+    RWVolt.set_msr_path(msr_path)
+    disturber = DisturberBackground(cores=[0], msr_path=msr_path, targets=[0], periods=[5, 10], values=[-10, 0], timing=str(tmp_path / "timing.csv"))
+    try:
+        disturber.run()
+        while not disturber.ready(): ...
+        # Like `DatasetBuilder._capture`: 20 ms of samples from the signalled start
+        capture = (time.monotonic_ns(), 0)
+        RWVolt.read_core_voltage_into(0, np.empty(2000, dtype=np.int16), 10000)
+        capture = (capture[0], time.monotonic_ns())
+        while not disturber.finished(): ...
+    finally:
+        disturber.stop()
+    assert disturber.subprocess_.returncode == 0, disturber.subprocess_.stderr.read().decode()
+    steps = np.loadtxt(tmp_path / "timing.csv", delimiter=",", skiprows=1, dtype=np.int64, ndmin=2)
+    assert disturber.start_ns_ == steps[0, 2]
+    assert capture[0] <= steps[0, 3] <= capture[1]
+    assert capture_overlaps(_timing(capture, steps[:, 3]))
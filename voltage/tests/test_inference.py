@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from inference import InferenceBackend
+from npmodel import NumpyModel
+from utils.scaler import FloatScaler
+
+N_READS, SHIFT = 128, 16
+
+def _windows(n_windows = 40, seed = 1):
+    stream = np.random.default_rng(seed).integers(900, 1100, N_READS + n_windows * SHIFT).astype(np.int16)
+    return np.lib.stride_tricks.sliding_window_view(stream, N_READS)[::SHIFT]
+
+def _outputs(backend, windows):
+    return np.array([backend(x) for x in windows])
+
+@pytest.mark.parametrize("scaler", [None, FloatScaler(1000., 50.)])
+def test_streaming_matches_numpy(layers, scaler):
+    net, windows = NumpyModel(*layers, N_READS), _windows()
+    expected = _outputs(InferenceBackend.create("numpy", net, scaler=scaler), windows)
+    streaming = InferenceBackend.create("streaming", net, shift=SHIFT, scaler=scaler)
+    # Enough windows for the feature ring to wrap around more than once
+    assert np.abs(_outputs(streaming, windows) - expected).max() < 1e-5
+    streaming.reset()
+    assert np.abs(_outputs(streaming, windows[5:]) - expected[5:]).max() < 1e-5
+
+def test_streaming_matches_keras(keras_model):
+    windows, scaler = _windows(), FloatScaler(1000., 50.)
+    expected = keras_model.predict(((windows - 1000.) / 50.)[..., None].astype(np.float32), verbose=0)[:, 0]
+    streaming = InferenceBackend.create("streaming", keras_model, shift=SHIFT, scaler=scaler)
+    assert np.abs(_outputs(streaming, windows) - expected).max() < 1e-5
+
+def test_streaming_rejects_positional_scaler(layers):
+    with pytest.raises(AssertionError):
+        InferenceBackend.create("streaming", NumpyModel(*layers, N_READS), shift=SHIFT, scaler=FloatScaler(np.arange(N_READS), 1.))
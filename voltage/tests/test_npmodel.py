@@ -0,0 +1,29 @@
+import numpy as np
+from inference import InferenceBackend
+from npmodel import NumpyModel
+from utils.scaler import FloatScaler
+
+N_READS = 128
+
+def _windows(n = 16, seed = 2):
+    return np.random.default_rng(seed).integers(900, 1100, (n, N_READS)).astype(np.int16)
+
+def test_numpy_matches_keras(keras_model, tmp_path):
+    X = np.random.default_rng(3).normal(size=(16, N_READS, 1)).astype(np.float32)
+    NumpyModel.from_keras(keras_model).save(str(tmp_path / "model.npz"))
+    net = NumpyModel.load(str(tmp_path / "model.npz"))
+    assert np.abs(net.predict(X[..., 0]) - keras_model.predict(X, verbose=0)[:, 0]).max() < 1e-5
+
+def test_save_load(layers, tmp_path):
+    net, X = NumpyModel(*layers, N_READS), _windows()
+    net.save(str(tmp_path / "model.npz"))
+    np.testing.assert_array_equal(NumpyModel.load(str(tmp_path / "model.npz")).predict(X), net.predict(X))
+
+def test_fold_scaler(layers):
+    net, X = NumpyModel(*layers, N_READS), _windows()
+    expected = net.predict(((X - 1000.) / 50.).astype(np.float32))
+    assert np.abs(net.fold_scaler(1000., 50.).predict(X) - expected).max() < 1e-5
+    # The numpy backend folds a uniform scaler, the result is the same as scaling the inputs
+    backend = InferenceBackend.create("numpy", net, scaler=FloatScaler(1000., 50.))
+    assert backend.scaler_ is None
+    assert np.abs(np.array([backend(x) for x in X]) - expected).max() < 1e-5
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from trace_codec import TraceFile, decode_row, encode_npy, encode_row, load_traces
+
+def _traces(n_cols = 257):
+    rng = np.random.default_rng(0)
+    walk = np.cumsum(rng.integers(-3, 4, (4, n_cols)), axis=1) + 1000
+    # Constant, full-range jumps between the int16 extremes, noise, and random walks
+    extremes = np.where(np.arange(n_cols) % 2, np.iinfo(np.int16).max, np.iinfo(np.int16).min)
+    noise = rng.integers(np.iinfo(np.int16).min, np.iinfo(np.int16).max, n_cols, endpoint=True)
+    return np.vstack([np.full(n_cols, -5), extremes, noise, walk]).astype(np.int16)
+
+@pytest.mark.parametrize("codec", [0, 1, 2])
+def test_row_round_trip(codec):
+    for row in _traces():
+        np.testing.assert_array_equal(decode_row(encode_row(row, codec), len(row), codec), row)
+
+@pytest.mark.parametrize("codec", ["none", "zlib", "lzma"])
+def test_file_round_trip(codec, tmp_path):
+    X = _traces()
+    np.save(tmp_path / "traces.npy", X)
+    path = encode_npy(str(tmp_path / "traces.npy"), codec=codec, chunk_rows=3)
+    traces = load_traces(path)
+    assert isinstance(traces, TraceFile) and traces.shape == X.shape
+    np.testing.assert_array_equal(np.asarray(traces), X)
+    np.testing.assert_array_equal(traces[-1], X[-1])
+    np.testing.assert_array_equal(traces[[4, 0, 2]], X[[4, 0, 2]])
+    np.testing.assert_array_equal(traces[1:6:2, 10:20], X[1:6:2, 10:20])
@@ -0,0 +1,179 @@
+import numpy as np
+import os, struct, zlib, lzma
+from typing import Literal
+
+Codec = Literal["none", "zlib", "lzma"]
+
+# File: header, one blob per row, the uint64 offsets of the blobs and the end of the last one, footer
+_MAGIC = b"VTRC"
+_VERSION = 1
+_HEADER = struct.Struct("<4sBBqq")   # magic, version, codec, rows, cols
+_FOOTER = struct.Struct("<q4s")      # offset of the index, magic
+# Row blob: first sample, bits per packed delta, then the packed deltas compressed
+_ROW = struct.Struct("<hB")
+_CODECS = ("none", "zlib", "lzma")
+
+def _compress(data: bytes, codec: int, level: int) -> bytes:
+    if codec == 1: return zlib.compress(data, level)
+    if codec == 2: return lzma.compress(data, preset=level)
+    return data
+
+def _decompress(data: bytes, codec: int) -> bytes:
+    if codec == 1: return zlib.decompress(data)
+    if codec == 2: return lzma.decompress(data)
+    return data
+
+def encode_row(row: np.ndarray, codec: int = 1, level: int = 6) -> bytes:
+    """One int16 trace as its first sample and the zigzagged deltas to the previous sample,
+    bit-packed plane by plane up to the width of the largest one, then compressed. Mostly
+    constant traces leave the high planes empty, which compress to almost nothing.
+    """
+    row = np.asarray(row, dtype=np.int16)
+    samples = row.astype(np.int32)
+    delta = np.diff(samples, prepend=samples[:1])
+    zigzag = ((delta << 1) ^ (delta >> 31)).astype(np.uint32)
+    width = int(zigzag.max()).bit_length() if row.size else 0
+    planes = ((zigzag >> np.arange(width, dtype=np.uint32)[:, np.newaxis]) & 1).astype(np.uint8)
+    packed = np.packbits(planes, axis=1, bitorder="little").tobytes()
+    return _ROW.pack(int(row[0]) if row.size else 0, width) + _compress(packed, codec, level)
+
+def decode_row(blob: bytes, n: int, codec: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """Inverse of `encode_row` for a trace of `n` samples, into `out` if given."""
+    first, width = _ROW.unpack_from(blob)
+    out = np.empty(n, dtype=np.int16) if out is None else out
+    if width == 0:
+        out[:] = first
+        return out
+    packed = np.frombuffer(_decompress(blob[_ROW.size:], codec), dtype=np.uint8).reshape(width, -1)
+    planes = np.unpackbits(packed, axis=1, count=n, bitorder="little")
+    zigzag = planes[0].astype(np.int32)
+    for k in range(1, width):
+        zigzag += planes[k] * np.int32(1 << k)
+    delta = (zigzag >> 1) ^ -(zigzag & 1)
+    np.cumsum(delta, out=delta)
+    np.add(delta, first, out=delta)
+    np.copyto(out, delta, casting="unsafe")
+    return out
+
+class TraceWriter:
+    """Write int16 traces of `n_cols` samples row by row into a `.vtc` file, see `TraceFile`."""
+    def __init__(self, path: str, n_cols: int, codec: Codec = "zlib", level: int = 6):
+        assert codec in _CODECS, ValueError(f"Unknown codec {codec}, choose from {_CODECS}.")
+        self.path_ = path
+        self.n_cols_ = n_cols
+        self.codec_ = _CODECS.index(codec)
+        self.level_ = level
+        self.fp_ = open(path, "wb")
+        self.fp_.write(_HEADER.pack(_MAGIC, _VERSION, self.codec_, 0, n_cols))
+        self.offsets_ = [self.fp_.tell()]
+
+    def write(self, rows: np.ndarray):
+        """Append `rows` `(n, n_cols)` (or a single row)."""
+        for row in np.reshape(rows, (-1, self.n_cols_)):
+            self.fp_.write(encode_row(row, self.codec_, self.level_))
+            self.offsets_.append(self.fp_.tell())
+
+    def close(self):
+        index = self.fp_.tell()
+        self.fp_.write(np.asarray(self.offsets_, dtype="<u8").tobytes())
+        self.fp_.write(_FOOTER.pack(index, _MAGIC))
+        self.fp_.seek(0)
+        self.fp_.write(_HEADER.pack(_MAGIC, _VERSION, self.codec_, len(self.offsets_) - 1, self.n_cols_))
+        self.fp_.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TraceFile:
+    """Read-only `.vtc` traces with the indexing of a `(rows, cols)` int16 array: a row read decodes
+    only that row, `np.asarray` decodes all of them. Reads use `pread`, so the file is safe to share
+    between threads and forked processes.
+    """
+    def __init__(self, path: str):
+        self.path_ = path
+        # Absolute, like `np.memmap.filename`
+        self.filename = os.path.abspath(path)
+        self.fd_ = os.open(path, os.O_RDONLY)
+        magic, version, self.codec_, rows, cols = _HEADER.unpack(os.pread(self.fd_, _HEADER.size, 0))
+        assert magic == _MAGIC and version == _VERSION, ValueError(f"{path} is not a version {_VERSION} trace file.")
+        size = os.fstat(self.fd_).st_size
+        index, magic = _FOOTER.unpack(os.pread(self.fd_, _FOOTER.size, size - _FOOTER.size))
+        assert magic == _MAGIC, ValueError(f"{path} is truncated.")
+        self.offsets_ = np.frombuffer(os.pread(self.fd_, 8 * (rows + 1), index), dtype="<u8").astype(np.int64)
+        self.shape = (rows, cols)
+        self.dtype = np.dtype(np.int16)
+        self.ndim = 2
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __del__(self):
+        if getattr(self, "fd_", None) is not None: os.close(self.fd_)
+
+    def read_row(self, i: int, out: np.ndarray = None) -> np.ndarray:
+        start, stop = self.offsets_[i], self.offsets_[i + 1]
+        return decode_row(os.pread(self.fd_, int(stop - start), int(start)), self.shape[1], self.codec_, out)
+
+    @property
+    def nbytes_encoded(self) -> int:
+        return int(self.offsets_[-1] - self.offsets_[0])
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            rows = self[index[0]]
+            return rows[index[1:]] if isinstance(index[0], (int, np.integer)) else rows[(slice(None), *index[1:])]
+        n = len(self)
+        if isinstance(index, (int, np.integer)):
+            if not -n <= index < n: raise IndexError(f"Row {index} out of range for {n} rows.")
+            return self.read_row(index % n)
+        index = np.arange(n)[index] if isinstance(index, slice) else np.asarray(index)
+        if index.dtype == np.bool_: index = np.flatnonzero(index)
+        index = np.where(index < 0, index + n, index)
+        out = np.empty((*index.shape, self.shape[1]), dtype=self.dtype)
+        for i, row in zip(index.reshape(-1), out.reshape(-1, self.shape[1])):
+            if not 0 <= i < n: raise IndexError(f"Row {i} out of range for {n} rows.")
+            self.read_row(i, row)
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+def encode_npy(src: str, dst: str = None, codec: Codec = "zlib", level: int = 6, chunk_rows: int = 64) -> str:
+    """Encode the `(rows, cols)` int16 `.npy` at `src` into `dst` (`src` with `.vtc` by default), `chunk_rows` rows in memory at a time."""
+    dst = dst or os.path.splitext(src)[0] + ".vtc"
+    data = np.load(src, mmap_mode="r")
+    assert data.ndim == 2 and data.dtype == np.int16, ValueError(f"{src} should hold (rows, cols) int16 traces.")
+    with TraceWriter(dst + ".tmp", data.shape[1], codec, level) as writer:
+        for start in range(0, len(data), chunk_rows):
+            writer.write(data[start:start + chunk_rows])
+    os.replace(dst + ".tmp", dst)
+    return dst
+
+def load_traces(path: str):
+    """Traces at `path` without reading them: a `TraceFile` for `.vtc`, a read-only memmap for `.npy`."""
+    return TraceFile(path) if path.endswith(".vtc") else np.load(path, mmap_mode="r")
+
+def parse_args():
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("paths", type=str, nargs="+", help="`.npy` traces to encode next to themselves as `.vtc`.")
+    parser.add_argument("-c", "--codec", type=str, choices=_CODECS, default="zlib")
+    parser.add_argument("-l", "--level", type=int, default=6, help="zlib level or lzma preset.")
+    parser.add_argument("--remove", action="store_true", default=False, help="Remove every `.npy` once encoded and checked.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for path in args.paths:
+        dst = encode_npy(path, codec=args.codec, level=args.level)
+        src, traces = np.load(path, mmap_mode="r"), TraceFile(dst)
+        assert all(np.array_equal(src[i], traces[i]) for i in range(len(src))), ValueError(f"{dst} does not decode to {path}.")
+        print(f"{path}: {src.nbytes / max(os.path.getsize(dst), 1):.1f}x smaller as {dst}")
+        if args.remove: os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import numpy as np
-from build_dataset import DatasetBuilder, DatasetGroup
+from build_dataset import DatasetBuilder, DatasetGroup, find_config
 from constants import *
 from model import get_model
+from npmodel import NumpyModel
 import datetime, os, json, pickle, random
 import tensorflow as tf
 
@@ -9,6 +10,7 @@ import keras
 from sklearn.model_selection import train_test_split
 from sklearn.utils.class_weight import compute_class_weight
 from utils.tools import set_random_seed
+from utils.scaler import GlobalScaler, FloatScaler
 
 def parse_args():
     from argparse import ArgumentParser
@@ -27,8 +29,9 @@ def parse_args():
     parser.add_argument("-p", "--patience", type=int, default=5)
     
     # Train setting
-    parser.add_argument("-s", "--scale_method", type=str, choices=["robust", "standard"], default="robust")
+    parser.add_argument("-s", "--scale_method", type=str, choices=["robust", "standard", "robust_global", "standard_global"], default="robust", help="`*_global` scales all positions alike, as the streaming detector backend needs.")
     parser.add_argument("-f", "--fft", type=int, default=None)
+    parser.add_argument("-A", "--augment", action="store_true", default=False, help="Augment every batch on the fly with the augment of the dataset group config, for groups built with `online_augment`.")
     
     # Additional
     # parser.add_argument("--quantize_model", action="store_true", default=False)
@@ -37,16 +40,23 @@ def parse_args():
     
     return parser.parse_args()
 
-def scale_input(X_train, X_test, y_train, method = "robust"):
-    if method == "robust":
+def scale_input(X_train, X_test, y_train, method = "robust", fit_only = False):
+    """Fit the scaler on `X_train` and scale both sets, `X_train` is left raw with `fit_only`."""
+    base, _, scope = method.partition("_")
+    if base == "robust":
         from sklearn.preprocessing import RobustScaler
         scaler = RobustScaler()
-    elif method == "standard":
+    elif base == "standard":
         from sklearn.preprocessing import StandardScaler
         scaler = StandardScaler()
     else:
         raise NotImplementedError(f"Scaling method {method} not implemented")
-    X_train = scaler.fit_transform(X_train,y_train)
+    if scope == "global":
+        scaler = GlobalScaler(scaler)
+    if fit_only:
+        scaler.fit(X_train, y_train)
+    else:
+        X_train = scaler.fit_transform(X_train,y_train)
     X_test = scaler.transform(X_test)
     return X_train, X_test, scaler
 
@@ -62,7 +72,7 @@ def threshold_opt_prec(y_val, y_val_pred, target_prec):
 
     return optimal_threshold
 
-def load_data(config_name, scaler_method, n_fft: int = None):
+def load_data(config_name, scaler_method, n_fft: int = None, raw_train = False):
     target_dir = os.path.join(DatasetGroup._TARGET_DIR, config_name)
     data, labels = DatasetGroup.load_from(target_dir)
     data = np.ascontiguousarray(data, np.float32)
@@ -70,7 +80,7 @@ def load_data(config_name, scaler_method, n_fft: int = None):
     
     X_train, X_test, y_train, y_test = train_test_split(data, labels, test_size=0.2, stratify=labels)
     if scaler_method:
-        X_train, X_test, scaler = scale_input(X_train, X_test, y_train, scaler_method)
+        X_train, X_test, scaler = scale_input(X_train, X_test, y_train, scaler_method, fit_only=raw_train)
     else:
         scaler = None
     X_train = X_train[:,:,np.newaxis]
@@ -80,7 +90,41 @@ def load_data(config_name, scaler_method, n_fft: int = None):
         X_test  = np.fft.fft(X_test, n_fft, axis=1)
     return X_train, X_test, y_train, y_test, scaler
 
-def train_model(model, X_train, y_train, args):
+def load_augment(config_name):
+    """Augment of the dataset group config `config_name`."""
+    augment = DatasetGroup.from_config(find_config(config_name, DIR_DATASETS_GROUP)).augment_
+    assert augment is not None, ValueError(f"Dataset group {config_name} has no augment.")
+    return augment
+
+def scale_windows(X, scaler, out = None):
+    """Raw windows `X` `(n, n_reads, 1)` scaled into float32 `out`, a new array by default."""
+    out = np.empty(X.shape, dtype=np.float32) if out is None else out
+    FloatScaler.from_sklearn(scaler).transform_into(X[..., 0], out[..., 0])
+    return out
+
+def augmented_dataset(X, y, augment, scaler, batch_size):
+    """`tf.data` batches of the raw `X` `(n, n_reads, 1)`, reshuffled every epoch, augmented by
+    `augment` with fresh random draws and scaled, on parallel threads ahead of the training step.
+    """
+    def load_batch(index, seed):
+        X_batch = augment.transform(X[index, :, 0], np.random.default_rng(seed))
+        return scale_windows(X_batch[..., np.newaxis], scaler), y[index]
+    def map_batch(index):
+        # Drawn from the global TensorFlow seed, a new one every batch of every epoch
+        seed = tf.random.uniform((), maxval=tf.int64.max, dtype=tf.int64)
+        X_batch, y_batch = tf.numpy_function(load_batch, [index, seed], [tf.float32, tf.as_dtype(y.dtype)])
+        X_batch.set_shape([None, *X.shape[1:]])
+        y_batch.set_shape([None])
+        return X_batch, y_batch
+    return (
+        tf.data.Dataset.range(len(X))
+        .shuffle(len(X), reshuffle_each_iteration=True)
+        .batch(batch_size)
+        .map(map_batch, num_parallel_calls=tf.data.AUTOTUNE)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
+def train_model(model, X_train, y_train, args, augment = None, scaler = None):
     model.compile(optimizer='Nadam',
                 loss='binary_crossentropy',
                 metrics=['accuracy', 
@@ -94,11 +138,16 @@ def train_model(model, X_train, y_train, args):
         y=y_train
     )
     
+    if augment is None:
+        data = dict(x=X_train, y=y_train, batch_size=args.batch_size, validation_split=0.2)
+    else:
+        # Validation on the last 20% as `validation_split` does, scaled but not augmented
+        n_val = int(0.2 * len(X_train))
+        X_val = scale_windows(X_train[-n_val:], scaler)
+        data = dict(x=augmented_dataset(X_train[:-n_val], y_train[:-n_val], augment, scaler, args.batch_size), validation_data=(X_val, y_train[-n_val:]))
     history = model.fit(
-        X_train, y_train,
+        **data,
         epochs=args.epochs,
-        batch_size=args.batch_size,
-        validation_split=0.2,
         class_weight={i : class_weights[i] for i in classes},
         
         callbacks=[keras.callbacks.EarlyStopping(
@@ -127,10 +176,15 @@ def load_model(load_dir):
 
 def save_model(model, scaler, args, history, save_dir):
     model.save(os.path.join(save_dir, "model.keras"))
+    try:
+        NumpyModel.from_keras(model).save(os.path.join(save_dir, "model.npz"))
+    except NotImplementedError as e:
+        print(f"Model not exported for the NumPy backends: {e}")
     with open(os.path.join(save_dir, "config.json"), "w") as fp:
         json.dump(args.__dict__, fp, indent=4)
     with open(os.path.join(save_dir, "scaler.pkl"), "wb") as fp:
         pickle.dump(scaler, fp)
+    FloatScaler.from_sklearn(scaler).save(os.path.join(save_dir, "scaler.npz"))
     with open(os.path.join(save_dir, "history.pkl"), "wb") as fp:
         pickle.dump(history, fp)
 
@@ -140,7 +194,9 @@ def main():
     save_dir = os.path.join(DIR_MODELS, args.name)
     
     print("Loading data...")
-    X_train, X_test, y_train, y_test, scaler = load_data(args.dataset_group, args.scale_method, args.fft)
+    assert not (args.augment and args.fft), ValueError("Online augmentation does not support fft inputs.")
+    augment = load_augment(args.dataset_group) if args.augment else None
+    X_train, X_test, y_train, y_test, scaler = load_data(args.dataset_group, args.scale_method, args.fft, raw_train=args.augment)
     
     print("Finding model...")
     _need_saving = True
@@ -153,10 +209,12 @@ def main():
     else:
         print("Training model...")
         model = get_model(X_train, id=args.model_id)
-        history = train_model(model, X_train, y_train, args)
+        history = train_model(model, X_train, y_train, args, augment, scaler)
         os.makedirs(save_dir, exist_ok=True)
         
         print("Calculating threshold...")
+        if args.threshold_opt and augment is not None:
+            X_train = scale_windows(X_train, scaler, out=X_train)
         args.threshold = threshold_opt_prec(y_train, model.predict(X_train), args.target_prec) if args.threshold_opt else 0.5
     
     print("Testing...")
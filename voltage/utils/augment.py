@@ -1,6 +1,20 @@
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
 from collections import OrderedDict
+from typing import Optional, Sequence, Union
+import multiprocessing as mp
+
+# Source, output and augment of the `apply_chunks` workers, inherited through fork
+_CHUNK_STATE = None
+
+def _init_chunk_worker(X, path, augment):
+    global _CHUNK_STATE
+    _CHUNK_STATE = (X, np.lib.format.open_memmap(path, mode="r+"), augment)
+
+def _run_chunk(start, stop, seed):
+    X, out, augment = _CHUNK_STATE
+    augment._write_block(X, out, start, stop, seed)
+    return stop - start
 
 
 def register(name):
@@ -17,6 +31,53 @@ class AugmentBase:
         self.keepsrc_ = keepsrc
     def apply(self, X, y):
         assert NotImplementedError("Base class not implemented")
+    
+    def transform(self, X: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """One augmented copy of every row of `X`, drawn from `rng`. Used online per training
+        batch, where `n_repeat` and `keepsrc` do not apply: each epoch sees fresh copies.
+        """
+        raise NotImplementedError(f"Augment {self.name_} has no online transform.")
+    
+    @property
+    def n_copies(self) -> int:
+        """Output rows per input row of `apply`."""
+        return 1 + self.keepsrc_
+    
+    def augment_block(self, X: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Copies `(n_copies, rows, ...)` of the rows `X`, the block of `apply` output row `c * len(X) + i`
+        being copy `c` of row `i`.
+        """
+        raise NotImplementedError(f"Augment {self.name_} has no block transform.")
+    
+    def _write_block(self, X, out, start, stop, seed):
+        rng = np.random.default_rng([*np.atleast_1d(seed), start])
+        copies = self.augment_block(np.asarray(X[start:stop]), rng)
+        n = len(X)
+        for c, copy in enumerate(copies):
+            out[c * n + start:c * n + stop] = copy
+    
+    def apply_chunks(self, X, y, path: Optional[str] = None, chunk_rows: int = 1024, n_workers: int = 1, seed: Union[int, Sequence[int]] = 0):
+        """Same layout as `apply`, computed `chunk_rows` rows at a time and written straight into the
+        `.npy` at `path` (in memory if `None`), returned read-only mapped with the labels. Blocks run in
+        `n_workers` processes, each with its own generator seeded by `seed` and its first row, so the
+        output does not depend on the number of workers.
+        """
+        n, k = len(X), self.n_copies
+        blocks = [(start, min(start + chunk_rows, n), seed) for start in range(0, n, chunk_rows)]
+        if path is None:
+            out = np.empty((k * n, *X.shape[1:]), dtype=X.dtype)
+            for block in blocks: self._write_block(X, out, *block)
+            return out, np.tile(y, k)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=X.dtype, shape=(k * n, *X.shape[1:]))
+        if n_workers <= 1:
+            for block in blocks: self._write_block(X, out, *block)
+            out.flush()
+        else:
+            del out
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(n_workers, mp.get_context("fork"), _init_chunk_worker, (X, path, self)) as pool:
+                for _ in pool.map(_run_chunk, *zip(*blocks)): ...
+        return np.load(path, mmap_mode="r"), np.tile(y, k)
         
     @staticmethod
     def custom_roll(arr: np.ndarray, roll):
@@ -52,6 +113,12 @@ class RollAugment(AugmentBase):
             return np.concatenate(X, newdata), np.concatenate(y, newlabels)
         else:
             return newdata, newlabels
+    
+    def transform(self, X, rng):
+        return np.roll(X, self.shift_, axis=1)
+    
+    def augment_block(self, X, rng):
+        return np.stack([X, self.transform(X, rng)] if self.keepsrc_ else [self.transform(X, rng)])
 
 @register("rroll")
 class RandomRollAugment(AugmentBase):
@@ -72,6 +139,23 @@ class RandomRollAugment(AugmentBase):
             y_new.append(y)
     
         return np.concatenate(X_new), np.concatenate(y_new)
+    
+    def transform(self, X, rng):
+        # Same shifts as `apply`, gathered in place of the double-width copy of `custom_roll`
+        n = X.shape[1]
+        shift = rng.integers(1, n + 1, size=(X.shape[0], 1))
+        return np.take_along_axis(X, (np.arange(n) - shift) % n, axis=1)
+    
+    @property
+    def n_copies(self):
+        return self.keepsrc_ + self.n_repeat_
+    
+    def augment_block(self, X, rng):
+        out = np.empty((self.n_copies, *X.shape), dtype=X.dtype)
+        if self.keepsrc_: out[0] = X
+        for i in range(self.keepsrc_, self.n_copies):
+            out[i] = self.transform(X, rng)
+        return out
 
 # class RandomConcatAugment(AugmentBase):
 #     """Randomly concatenate some data"""
@@ -98,6 +182,22 @@ class SequantialAugment(AugmentBase):
         else:
             return X_new, y_new
     
+    def transform(self, X, rng):
+        for augment in self.augments_:
+            X = augment.transform(X, rng)
+        return X
+    
+    @property
+    def n_copies(self):
+        return int(np.prod([augment.n_copies for augment in self.augments_])) + self.keepsrc_
+    
+    def augment_block(self, X, rng):
+        # Every step augments all copies so far, its own copies outermost as `apply` concatenates them
+        copies = X[np.newaxis]
+        for augment in self.augments_:
+            copies = augment.augment_block(copies.reshape(-1, *X.shape[1:]), rng).reshape(-1, *X.shape)
+        return np.concatenate([X[np.newaxis], copies]) if self.keepsrc_ else copies
+    
     @classmethod
     def _parse_config(cls, config: OrderedDict):
         """
@@ -0,0 +1,42 @@
+import hashlib, json, os, platform, time
+from typing import Optional
+
+# Bump when the layout of built artifacts changes, so every cached one is rebuilt
+FORMAT_VERSION = 1
+
+def config_hash(config) -> str:
+    """Hash of `config` normalized as sorted, compact json, so key order and tuples vs lists do not matter."""
+    text = json.dumps({"format": FORMAT_VERSION, "config": config}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def host_info() -> dict:
+    """Where an artifact was built: host name, kernel, CPU model and count."""
+    model = None
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as fp:
+            model = next((line.split(":", 1)[1].strip() for line in fp if line.startswith("model name")), None)
+    return {"node": platform.node(), "kernel": platform.release(), "cpu": model, "cpu_count": os.cpu_count()}
+
+def meta_path(artifact: str) -> str:
+    """Sidecar of `artifact`: `<name>.meta.json` next to `<name>.npy` or `<name>.vtc`."""
+    return os.path.splitext(artifact)[0] + ".meta.json"
+
+def write_meta(artifact: str, key: str, config, **info):
+    """Record that `artifact` was built from `config` hashed to `key`, with the host and `info`."""
+    path = meta_path(artifact)
+    meta = {"key": key, "file": os.path.basename(artifact), "config": config, "host": host_info(), "built": time.time(), **info}
+    with open(path + ".tmp", "w") as fp:
+        json.dump(meta, fp, indent=4, default=str)
+    os.replace(path + ".tmp", path)
+
+def read_meta(artifact: str) -> Optional[dict]:
+    path = meta_path(artifact)
+    if not os.path.exists(path): return None
+    with open(path) as fp:
+        return json.load(fp)
+
+def is_fresh(artifact: str, key: str) -> bool:
+    """Whether `artifact` exists with a sidecar of `key`, the host is not part of it."""
+    if not os.path.exists(artifact): return False
+    meta = read_meta(artifact)
+    return meta is not None and meta["key"] == key and meta["file"] == os.path.basename(artifact)
@@ -0,0 +1,59 @@
+import numpy as np
+
+class GlobalScaler:
+    """Scaler fit on all samples at once, so every position of a window is scaled the same way."""
+    def __init__(self, scaler):
+        self.scaler_ = scaler
+
+    @property
+    def center_(self):
+        return getattr(self.scaler_, "center_", getattr(self.scaler_, "mean_", None))
+
+    @property
+    def scale_(self):
+        return self.scaler_.scale_
+
+    def fit(self, X, y = None):
+        self.scaler_.fit(X.reshape(-1, 1))
+        return self
+
+    def fit_transform(self, X, y = None):
+        return self.scaler_.fit_transform(X.reshape(-1, 1)).reshape(X.shape)
+
+    def transform(self, X):
+        return self.scaler_.transform(X.reshape(-1, 1)).reshape(X.shape)
+
+class FloatScaler:
+    """`(x - center) / scale` as float32 vectors, one value per window position or a single one
+    shared by all positions. Stored as `scaler.npz` next to the model.
+    """
+    def __init__(self, center, scale):
+        self.center_ = np.ascontiguousarray(center, dtype=np.float32).reshape(-1)
+        self.scale_ = np.ascontiguousarray(scale, dtype=np.float32).reshape(-1)
+        self.inv_scale_ = np.reciprocal(self.scale_)
+
+    @property
+    def uniform_(self) -> bool:
+        """Whether every position of the window is scaled the same way."""
+        return bool((self.center_ == self.center_[0]).all() and (self.scale_ == self.scale_[0]).all())
+
+    @classmethod
+    def from_sklearn(cls, scaler) -> "FloatScaler":
+        """From a fitted `RobustScaler`, `StandardScaler` or `GlobalScaler`, `None` for no scaling."""
+        center = getattr(scaler, "center_", getattr(scaler, "mean_", None))
+        scale = getattr(scaler, "scale_", None)
+        return cls(0 if center is None else center, 1 if scale is None else scale)
+
+    def transform_into(self, x, out):
+        """Scale the samples `x` (any dtype) into the float32 `out` without temporaries."""
+        np.subtract(x, self.center_, out=out, casting="unsafe")
+        np.multiply(out, self.inv_scale_, out=out)
+        return out
+
+    def save(self, path: str):
+        np.savez(path, center=self.center_, scale=self.scale_)
+
+    @classmethod
+    def load(cls, path: str) -> "FloatScaler":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["center"], data["scale"])
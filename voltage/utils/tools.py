@@ -1,8 +1,21 @@
 import random
 import numpy as np
-import tensorflow as tf
 
 def set_random_seed(seed):
+    import tensorflow as tf
     random.seed(seed)
     np.random.seed(seed)
     tf.random.set_seed(seed)
+
+def import_profile(argv, top = 20):
+    """Run `python -X importtime <argv>` and return its `top` slowest imports as
+    `(module, self_us, cumulative_us)`, by cumulative time.
+    """
+    import subprocess, sys
+    proc = subprocess.run([sys.executable, "-X", "importtime", *argv], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line: continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return sorted(rows, key=lambda row: -row[2])[:top]
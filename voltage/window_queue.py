@@ -0,0 +1,112 @@
+import numpy as np
+import threading, time
+from collections import deque
+from typing import Literal, Optional, Tuple
+
+QueuePolicy = Literal["block", "drop_oldest", "coalesce"]
+
+class WindowQueue:
+    """Bounded queue of windows between a reader thread and a consumer, over preallocated slots.
+    The producer `reserve`s a free slot, fills it and `put`s it, the consumer `get`s a slot and
+    `release`s it once done. `policy` decides what happens when the consumer falls behind:
+        - `block`: the producer waits for a free slot, back pressure reaches the sampler.
+        - `drop_oldest`: the producer reuses the oldest queued window, the consumer sees the newest `size`.
+        - `coalesce`: like `drop_oldest`, and the consumer only takes the newest queued window.
+    Every dropped window counts in `skipped_`.
+    """
+    def __init__(self, window: int, size: int = 4, policy: QueuePolicy = "block"):
+        """
+        Args:
+            window (int): Samples per window.
+            size (int): Windows queued at most.
+            policy (str): Policy when the queue is full, `block`, `drop_oldest` or `coalesce`.
+        """
+        assert size > 0, ValueError("Queue size should be positive.")
+        assert policy in ("block", "drop_oldest", "coalesce"), ValueError(f"Unknown queue policy {policy}.")
+        self.size_ = size
+        self.policy_ = policy
+        # One slot more for the producer and one for the consumer
+        self.slots_ = np.zeros((size + 2, window), dtype=np.int16)
+        self.stamps_ = np.zeros(size + 2, dtype=np.float64)
+        self.free_ = deque(range(size + 2))
+        self.queued_ = deque()
+        self.cond_ = threading.Condition()
+        self.closed_ = False
+        self.error_: Optional[BaseException] = None
+        # Metrics
+        self.produced_ = 0
+        self.consumed_ = 0
+        self.skipped_ = 0
+        self.max_depth_ = 0
+        self.lag_ = 0.
+        self.max_lag_ = 0.
+
+    @property
+    def depth(self) -> int:
+        """Windows waiting for the consumer."""
+        return len(self.queued_)
+
+    def reserve(self) -> Optional[int]:
+        """Free slot for the producer, `None` once the queue is closed."""
+        with self.cond_:
+            if self.policy_ == "block":
+                while not self.closed_ and (not self.free_ or len(self.queued_) >= self.size_):
+                    self.cond_.wait()
+            elif not self.free_ and self.queued_:
+                self.free_.append(self.queued_.popleft())
+                self.skipped_ += 1
+            return None if self.closed_ else self.free_.popleft()
+
+    def put(self, slot: int):
+        """Queue the filled `slot`, stamped with the current CLOCK_MONOTONIC time."""
+        self.stamps_[slot] = time.monotonic()
+        with self.cond_:
+            self.queued_.append(slot)
+            self.produced_ += 1
+            if self.policy_ != "block" and len(self.queued_) > self.size_:
+                self.free_.append(self.queued_.popleft())
+                self.skipped_ += 1
+            self.max_depth_ = max(self.max_depth_, len(self.queued_))
+            self.cond_.notify_all()
+
+    def get(self) -> int:
+        """Next slot for the consumer. Once the producer closed the queue and it is drained,
+        raises the producer's error, or `EOFError`.
+        """
+        with self.cond_:
+            while not self.queued_:
+                if self.closed_: raise self.error_ or EOFError("Window queue closed!")
+                self.cond_.wait()
+            if self.policy_ == "coalesce":
+                while len(self.queued_) > 1:
+                    self.free_.append(self.queued_.popleft())
+                    self.skipped_ += 1
+            slot = self.queued_.popleft()
+            self.consumed_ += 1
+            self.cond_.notify_all()
+        self.lag_ = time.monotonic() - self.stamps_[slot]
+        self.max_lag_ = max(self.max_lag_, self.lag_)
+        return slot
+
+    def release(self, slot: int):
+        with self.cond_:
+            self.free_.append(slot)
+            self.cond_.notify_all()
+
+    def close(self, error: Optional[BaseException] = None):
+        """Stop both sides, `error` is raised to the consumer after the queued windows."""
+        with self.cond_:
+            self.closed_ = True
+            self.error_ = self.error_ or error
+            self.cond_.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth_,
+            "lag_s": float(self.lag_),
+            "max_lag_s": float(self.max_lag_),
+            "produced": self.produced_,
+            "consumed": self.consumed_,
+            "skipped": self.skipped_,
+        }